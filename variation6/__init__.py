@@ -15,9 +15,15 @@ DP_FIELD_NAME = 'dp'
 AO_FIELD_NAME = 'ao'
 RO_FIELD_NAME = 'ro'
 AD_FIELD_NAME = 'ad'
+GT_PACKED_FIELD_NAME = 'gt_packed'
+MAF_STAT_FIELD_NAME = 'maf'
+MAC_STAT_FIELD_NAME = 'mac'
+CALL_RATE_STAT_FIELD_NAME = 'call_rate'
+OBS_HET_STAT_FIELD_NAME = 'obs_het'
 
 PUBLIC_VARIATION_GROUP = '/variations'
 PUBLIC_CALL_GROUP = '/calldata'
+PUBLIC_VARIANT_STATS_GROUP = '/variant_stats'
 
 CHROM_FIELD = join(PUBLIC_VARIATION_GROUP, CHROM_FIELD_NAME)
 POS_FIELD = join(PUBLIC_VARIATION_GROUP, POS_FIELD_NAME)
@@ -34,6 +40,17 @@ DP_FIELD = join(PUBLIC_CALL_GROUP, DP_FIELD_NAME)
 AO_FIELD = join(PUBLIC_CALL_GROUP, AO_FIELD_NAME)
 RO_FIELD = join(PUBLIC_CALL_GROUP, RO_FIELD_NAME)
 AD_FIELD = join(PUBLIC_CALL_GROUP, AD_FIELD_NAME)
+# diploid biallelic genotypes, 2 bits per call, see array.genotype.pack_gts
+GT_PACKED_FIELD = join(PUBLIC_CALL_GROUP, GT_PACKED_FIELD_NAME)
+
+# per variation stats calculated from the genotypes and stored with them
+MAF_STAT_FIELD = join(PUBLIC_VARIANT_STATS_GROUP, MAF_STAT_FIELD_NAME)
+MAC_STAT_FIELD = join(PUBLIC_VARIANT_STATS_GROUP, MAC_STAT_FIELD_NAME)
+CALL_RATE_STAT_FIELD = join(PUBLIC_VARIANT_STATS_GROUP,
+                            CALL_RATE_STAT_FIELD_NAME)
+OBS_HET_STAT_FIELD = join(PUBLIC_VARIANT_STATS_GROUP, OBS_HET_STAT_FIELD_NAME)
+VARIANT_STAT_FIELDS = [MAF_STAT_FIELD, MAC_STAT_FIELD, CALL_RATE_STAT_FIELD,
+                       OBS_HET_STAT_FIELD]
 
 VARIATION_FIELDS = [CHROM_FIELD, POS_FIELD, ID_FIELD, REF_FIELD, ALT_FIELD,
                     QUAL_FIELD, INFO_FIELD ]
@@ -47,14 +64,21 @@ N_KEPT = 'n_kept'
 N_FILTERED_OUT = 'n_filtered_out'
 N_SAMPLES_KEPT = 'n_samples_kept'
 N_SAMPLES_FILTERED_OUT = 'n_samples_filtered_out'
+N_CALLS_SET_TO_MISSING = 'n_calls_set_to_missing'
+N_ITERATIONS = 'n_iterations'
 TOT = 'tot'
 COUNT = 'counts'
 BIN_EDGES = 'bin_edges'
 HIST_RANGE = 'limits'
+SWEEP_STATS = 'stats'
+SWEEP_THRESHOLDS = 'thresholds'
 
 MIN_NUM_GENOTYPES_FOR_POP_STAT = 10
 
 DEF_CHUNK_SIZE = 1000
+# chunks computed in advance and threads used by iterate_computed_chunks
+DEF_NUM_PREFETCHED_CHUNKS = 2
+DEF_NUM_PREFETCH_WORKERS = 2
 
 MISSING_INT = -1
 MISSING_FLOAT = float('nan')
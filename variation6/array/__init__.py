@@ -1,11 +1,22 @@
 from .array_calculations import (add, all, amax, any, assign_with_mask,
-                                 reshape_if_needed, reduce_chunk_dimensions,
+                                 reshape_if_needed,
                                  count_nonzero, create_full_array_in_memory,
                                  create_not_initialized_array_in_memory,
-                                 empty_array, histogram, isinf, isnan,
+                                 empty_array, histogram, histogram2d,
+                                 HistogramAccumulator, calc_bin_edges,
+                                 isinf, isnan,
                                  logical_and, logical_not, logical_or,
-                                 map_blocks, make_sure_array_is_in_memory, max,
+                                 map_blocks, map_blocks_and_sum_along_samples,
+                                 make_sure_array_is_in_memory, max,
                                  min, nanmean, nansum, ones, sum, stack,
                                  full, isfinite, pack, samples_to_numpy_str)
 
-from .genotype import gts_as_mat012
+from .genotype import (gts_as_mat012, pack_gts, unpack_gts, count_packed_gts,
+                       count_alleles_packed, calc_kosman_sums_packed,
+                       num_packed_bytes)
+from .sparse_genotype import (SparseGenotypes, count_alleles_sparse,
+                              count_missing_alleles_sparse,
+                              count_het_and_called_sparse,
+                              gts_as_mat012_sparse)
+from .quantile_sketch import (QuantileSketch, calc_quantile_sketch,
+                              DEF_SKETCH_COMPRESSION)
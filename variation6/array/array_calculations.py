@@ -1,10 +1,11 @@
 import math
-import re
 
 import dask.array as da
 import numpy as np
 
-from variation6.compute import compute
+# the module is imported instead of the function because compute imports
+# variations, that uses this package
+import variation6.compute
 from variation6 import MISSING_VALUES
 
 DEF_NUM_BINS = 40
@@ -42,65 +43,184 @@ def isinf(array, *args, **kwargs):
     return _same_interface_funcs('isinf', array, *args, **kwargs)
 
 
-def histogram(vector, n_bins, limits, weights=None):
+def _get_missing_value(array):
+    try:
+        return MISSING_VALUES[array.dtype]
+    except (KeyError, TypeError, ValueError):
+        return None
 
+
+def calc_bin_edges(n_bins, limits):
     if n_bins is None:
         n_bins = DEF_NUM_BINS
+    return np.histogram_bin_edges(np.empty((0,)), bins=n_bins, range=limits)
+
+
+def _calc_limits_in_memory(vector):
+    vector = np.asarray(vector, dtype=np.float64)
+    vector = vector[np.isfinite(vector)]
+    if not vector.size:
+        return (0, 1)
+    return (vector.min(), vector.max())
+
+
+def calc_bin_idxs(values, bin_edges, missing_value=None):
+    '''It returns the bin of every value, the values that are missing, nan
+       or out of the edges get the index n_bins.
+
+       The binning is the same as the one done by np.histogram.'''
+    n_bins = bin_edges.size - 1
+    is_binned = np.ones(values.shape, dtype=bool)
+    if missing_value is not None and not math.isnan(missing_value):
+        is_binned = values != missing_value
+    values = values.astype(np.float64)
+    with np.errstate(invalid='ignore'):
+        is_binned = np.logical_and(is_binned, values >= bin_edges[0])
+        is_binned = np.logical_and(is_binned, values <= bin_edges[-1])
+
+    binned_values = values[is_binned]
+    norm = n_bins / (bin_edges[-1] - bin_edges[0])
+    binned_idxs = ((binned_values - bin_edges[0]) * norm).astype(np.intp)
+    binned_idxs[binned_idxs == n_bins] -= 1
+    # the float errors are corrected using the edges
+    binned_idxs[binned_values < bin_edges[binned_idxs]] -= 1
+    is_above = np.logical_and(binned_values >= bin_edges[binned_idxs + 1],
+                              binned_idxs != n_bins - 1)
+    binned_idxs[is_above] += 1
+
+    idxs = np.full(values.shape, n_bins, dtype=np.intp)
+    idxs[is_binned] = binned_idxs
+    return idxs
+
+
+def _calc_histogram_counts_in_memory(vectors, bin_edges, missing_values,
+                                     weights=None):
+    idxs = np.zeros(vectors[0].shape, dtype=np.intp)
+    is_binned = np.ones(vectors[0].shape, dtype=bool)
+    for vector, edges, missing_value in zip(vectors, bin_edges,
+                                            missing_values):
+        n_bins = edges.size - 1
+        vector_idxs = calc_bin_idxs(vector, edges, missing_value)
+        is_binned = np.logical_and(is_binned, vector_idxs != n_bins)
+        idxs = idxs * n_bins + vector_idxs
+    shape = tuple(edges.size - 1 for edges in bin_edges)
+    num_cells = int(np.prod(shape))
+    if weights is not None:
+        weights = np.where(is_binned, weights, 0).ravel()
+    idxs = np.where(is_binned, idxs, num_cells).ravel()
+    counts = np.bincount(idxs, weights=weights, minlength=num_cells + 1)
+    return counts[:num_cells].reshape(shape)
+
+
+def _calc_histogram_counts(vectors, bin_edges, weights=None):
+    missing_values = [_get_missing_value(vector) for vector in vectors]
+    if not isinstance(vectors[0], da.Array):
+        return _calc_histogram_counts_in_memory(vectors, bin_edges,
+                                                missing_values,
+                                                weights=weights)
+
+    def _calc_counts(*blocks):
+        block_weights = blocks[len(vectors)] if weights is not None else None
+        counts = _calc_histogram_counts_in_memory(blocks[:len(vectors)],
+                                                  bin_edges, missing_values,
+                                                  weights=block_weights)
+        return counts.reshape((1,) * blocks[0].ndim + counts.shape)
+
+    in_index = 'ijklmn'[:vectors[0].ndim]
+    bin_index = 'uvwxyz'[:len(vectors)]
+    args = []
+    for array in vectors if weights is None else list(vectors) + [weights]:
+        args.extend([array, in_index])
+    dtype = np.int64 if weights is None else np.float64
+    # every block is reduced to its counts and the counts are added
+    partial_counts = da.blockwise(_calc_counts, in_index + bin_index, *args,
+                                  dtype=dtype,
+                                  new_axes={axis: edges.size - 1
+                                            for axis, edges in zip(bin_index,
+                                                                   bin_edges)},
+                                  adjust_chunks={axis: 1 for axis in in_index})
+    return partial_counts.sum(axis=tuple(range(len(in_index))))
 
-    try:
-        dtype = vector.dtype
-    except AttributeError:
-        dtype = type(vector[0])
 
-    missing_value = MISSING_VALUES[dtype]
-
-    if weights is None:
-        if math.isnan(missing_value):
-            not_nan = ~isnan(vector)
-        else:
-            not_nan = vector != missing_value
-
-        vector = vector[not_nan]
+def histogram(vector, n_bins, limits, weights=None):
+    '''It calculates a fixed bin histogram, the missing and nan values are
+       ignored.
 
-    if isinstance(vector, da.Array):
-        histo = da.histogram
-        if limits is None:
+       The dask arrays are binned block by block and the block counts added,
+       limits is required for them.'''
+    if limits is None:
+        if isinstance(vector, da.Array):
             raise ValueError('Limits is mandatory to use this function')
-
-    else:
-        histo = np.histogram
-        if limits is None:
-            limits = (min(vector), max(vector))
-
-    try:
-        dtype = vector.dtype
-    except AttributeError:
-        dtype = type(vector[0])
-
-    missing_value = MISSING_VALUES[dtype]
-
-    if weights is None:
-        if math.isnan(missing_value):
-            not_nan = ~isnan(vector)
-        else:
-            not_nan = vector != missing_value
-
-        vector = vector[not_nan]
-
-    try:
-        result = histo(vector, bins=n_bins, range=limits, weights=weights)
-    except ValueError as error:
-        if ('parameter must be finite' in str(error) or
-                re.search('autodetected range of .*finite', str(error))):
-            isfinite = ~isinf(vector)
-            vector = vector[isfinite]
-            if weights is not None:
-                weights = weights[isfinite]
-
-            result = histo(vector, bins=n_bins, range=limits, weights=weights)
-        else:
-            raise
-    return result
+        limits = _calc_limits_in_memory(vector)
+    bin_edges = calc_bin_edges(n_bins, limits)
+    if not isinstance(vector, da.Array):
+        vector = np.asarray(vector)
+    counts = _calc_histogram_counts([vector], [bin_edges], weights=weights)
+    return counts, bin_edges
+
+
+def histogram2d(vector1, vector2, n_bins, limits, weights=None):
+    '''It calculates a 2D fixed bin histogram, the pairs with any missing or
+       nan value are ignored.
+
+       n_bins and limits are given for each vector.'''
+    if not isinstance(vector1, da.Array):
+        vector1, vector2 = np.asarray(vector1), np.asarray(vector2)
+    bin_edges = [calc_bin_edges(vector_n_bins, vector_limits)
+                 for vector_n_bins, vector_limits in zip(n_bins, limits)]
+    counts = _calc_histogram_counts([vector1, vector2], bin_edges,
+                                    weights=weights)
+    return counts, bin_edges[0], bin_edges[1]
+
+
+class HistogramAccumulator:
+    '''A fixed bin histogram that accumulates the counts of the arrays
+       added to it.
+
+       The accumulators with the same bin edges, e.g. the ones created in
+       different runs, can be merged.'''
+
+    def __init__(self, bin_edges, counts=None):
+        self.bin_edges = [np.asarray(edges, dtype=np.float64)
+                          for edges in bin_edges]
+        shape = tuple(edges.size - 1 for edges in self.bin_edges)
+        if counts is None:
+            counts = np.zeros(shape)
+        elif np.shape(counts) != shape:
+            raise ValueError('The counts do not match the bin edges')
+        self.counts = counts
+
+    @classmethod
+    def from_limits(cls, n_bins, limits):
+        return cls([calc_bin_edges(n_bins, limits)])
+
+    def add(self, *vectors, weights=None):
+        vectors = [make_sure_array_is_in_memory(vector) for vector in vectors]
+        if len(vectors) != len(self.bin_edges):
+            raise ValueError('One vector per dimension is required')
+        if weights is not None:
+            weights = make_sure_array_is_in_memory(weights)
+        self.counts = self.counts + _calc_histogram_counts(vectors,
+                                                           self.bin_edges,
+                                                           weights=weights)
+
+    def _check_is_compatible(self, other):
+        # any and all are shadowed in this module
+        is_compatible = len(self.bin_edges) == len(other.bin_edges)
+        for edges, other_edges in zip(self.bin_edges, other.bin_edges):
+            if edges.shape != other_edges.shape or not np.allclose(edges,
+                                                                   other_edges):
+                is_compatible = False
+        if not is_compatible:
+            raise ValueError('Histograms with different bin edges can not be merged')
+
+    def merge(self, other):
+        self._check_is_compatible(other)
+        self.counts = self.counts + other.counts
+
+    def __add__(self, other):
+        self._check_is_compatible(other)
+        return self.__class__(self.bin_edges, self.counts + other.counts)
 
 
 def count_nonzero(a, *args, **kwargs):
@@ -258,9 +378,41 @@ def map_blocks(func, *args, **kwargs):
         return func(*args)
 
 
+def map_blocks_and_sum_along_samples(func, array, dtype, tail_shape=()):
+    '''It applies func to every (variations x samples x ...) block and adds
+       the partial results of the blocks that share the same variations.
+
+       func should return, for every variation, an addable partial result of
+       shape (num_variations,) + tail_shape. This allows per variation
+       reductions over arrays chunked along the sample axis.'''
+    if not isinstance(array, da.Array):
+        return func(array)
+
+    # all dimensions beyond the sample axis have to be in one chunk
+    if array.ndim > 2:
+        array = array.rechunk({axis: -1 for axis in range(2, array.ndim)})
+
+    def _func_with_sample_axis(block):
+        result = func(block)
+        return result.reshape((result.shape[0], 1) + result.shape[1:])
+
+    out_ndim = 2 + len(tail_shape)
+    kwargs = {}
+    if out_ndim < array.ndim:
+        kwargs['drop_axis'] = list(range(out_ndim, array.ndim))
+    elif out_ndim > array.ndim:
+        kwargs['new_axis'] = list(range(array.ndim, out_ndim))
+    chunks = ((array.chunks[0], (1,) * len(array.chunks[1])) +
+              tuple((dim,) for dim in tail_shape))
+    partial_results = da.map_blocks(_func_with_sample_axis, array,
+                                    chunks=chunks, dtype=dtype, **kwargs)
+    return partial_results.sum(axis=1, dtype=dtype)
+
+
 def make_sure_array_is_in_memory(array, silence_runtime_warnings=False):
     if isinstance(array, da.Array):
-        array = compute(array, silence_runtime_warnings=silence_runtime_warnings)
+        array = variation6.compute.compute(array,
+                                           silence_runtime_warnings=silence_runtime_warnings)
     return array
 
 
@@ -289,7 +441,9 @@ def reshape_if_needed(array, mask):
         not np.any(np.isnan(array.shape)) and
         len(array.shape) != len(mask.shape)):
 
-        mask = mask.reshape((array.shape))
+        # a per variation mask is broadcasted to the rest of dimensions
+        mask = mask.reshape(mask.shape + (1,) * (array.ndim - mask.ndim))
+        mask = da.broadcast_to(mask, array.shape, chunks=array.chunks)
     return mask
 
 
@@ -297,11 +451,4 @@ def samples_to_numpy_str(samples):
     samples = [sample.decode() for sample in make_sure_array_is_in_memory(samples)]
     return samples
 
-
-# rara
-def reduce_chunk_dimensions(array):
-    chunks = None
-    if isinstance(array, da.Array):
-        chunks = (array.chunks[0], (1,) * len(array.chunks[1]))
-    return chunks
 ###############################################################################
@@ -1,13 +1,196 @@
+import numpy as np
+import dask.array as da
+
 import variation6.array as va
 from variation6 import MISSING_INT
 
+# 2 bit codes used in the packed genotypes, 4 calls per byte
+PACKED_HOM_REF = 0
+PACKED_HET = 1
+PACKED_HOM_ALT = 2
+PACKED_MISSING = 3
+CALLS_PER_BYTE = 4
+PACKED_PLOIDY = 2
+
+_PACKED_CODE_TO_GT = np.array([[0, 0], [0, 1], [1, 1],
+                               [MISSING_INT, MISSING_INT]], dtype=np.int8)
+_BYTE_TO_PACKED_CODES = np.array([[(byte >> (2 * idx)) & 0b11
+                                   for idx in range(CALLS_PER_BYTE)]
+                                  for byte in range(256)], dtype=np.uint8)
+_POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)],
+                     dtype=np.uint8)
+_LOW_BITS = np.uint8(0b01010101)
+
 
 def gts_as_mat012(gts):
     '''It transforms the GT matrix into 0 (major allele homo), 1 (het),
        2(other hom)'''
+    if isinstance(gts, va.SparseGenotypes):
+        return va.gts_as_mat012_sparse(gts)
     gts012 = va.sum(gts, axis=2)
     gts012[va.any(gts == MISSING_INT, axis=2)] = MISSING_INT
     gts012[gts012 >= 1 ] = 2
     gts012[va.logical_and(gts012 == 2, va.any(gts == 0, axis=2))] = 1
 
     return gts012
+
+
+def num_packed_bytes(num_samples):
+    return -(-num_samples // CALLS_PER_BYTE)
+
+
+def _pack_gts_in_memory(gts):
+    if gts.shape[2] != PACKED_PLOIDY:
+        raise ValueError('Only diploid genotypes can be packed')
+    if np.any(gts > 1):
+        raise ValueError('Only biallelic genotypes can be packed')
+
+    is_missing = np.any(gts == MISSING_INT, axis=2)
+    if np.any(is_missing != np.all(gts == MISSING_INT, axis=2)):
+        # a packed call is whole or missing, so the partially missing calls
+        # would be counted as missing and the call rates would change
+        raise ValueError('Genotypes with partially missing calls can not be packed')
+    codes = np.sum(gts, axis=2, dtype=np.uint8)
+    codes[is_missing] = PACKED_MISSING
+
+    num_samples = gts.shape[1]
+    padding = num_packed_bytes(num_samples) * CALLS_PER_BYTE - num_samples
+    codes = np.pad(codes, ((0, 0), (0, padding)),
+                   constant_values=PACKED_MISSING)
+    codes = codes.reshape(codes.shape[0], -1, CALLS_PER_BYTE)
+    shifts = np.arange(CALLS_PER_BYTE, dtype=np.uint8) * 2
+    return np.bitwise_or.reduce(codes << shifts, axis=2).astype(np.uint8)
+
+
+def pack_gts(gts):
+    '''It packs diploid biallelic genotypes in 2 bits per call.
+
+       The codes are 0 (hom ref), 1 (het), 2 (hom alt) and 3 (missing), and
+       every byte holds 4 samples. The calls used to fill the last byte are
+       missing. The calls with only one missing allele can not be packed.'''
+    if isinstance(gts, da.Array):
+        gts = gts.rechunk({1: -1, 2: -1})
+        chunks = (gts.chunks[0], (num_packed_bytes(gts.shape[1]),))
+        return da.map_blocks(_pack_gts_in_memory, gts, chunks=chunks,
+                             drop_axis=2, dtype=np.uint8)
+    return _pack_gts_in_memory(gts)
+
+
+def _unpack_codes_in_memory(packed, num_samples):
+    return _BYTE_TO_PACKED_CODES[packed].reshape(packed.shape[0], -1)[:, :num_samples]
+
+
+def _unpack_gts_in_memory(packed, num_samples):
+    return _PACKED_CODE_TO_GT[_unpack_codes_in_memory(packed, num_samples)]
+
+
+def unpack_gts(packed, num_samples):
+    def _unpack_gts(packed):
+        return _unpack_gts_in_memory(packed, num_samples)
+
+    if isinstance(packed, da.Array):
+        packed = packed.rechunk({1: -1})
+        chunks = (packed.chunks[0], (num_samples,), (PACKED_PLOIDY,))
+        return da.map_blocks(_unpack_gts, packed, chunks=chunks, new_axis=2,
+                             dtype=np.int8)
+    return _unpack_gts(packed)
+
+
+def _count_packed_gts_in_memory(packed, num_samples):
+    low_bits = packed & _LOW_BITS
+    high_bits = (packed >> 1) & _LOW_BITS
+    class_masks = (~(low_bits | high_bits) & _LOW_BITS,
+                   low_bits & ~high_bits,
+                   high_bits & ~low_bits,
+                   low_bits & high_bits)
+    counts = np.stack([np.sum(_POPCOUNT[mask], axis=1, dtype=np.int64)
+                       for mask in class_masks], axis=1)
+    # the calls used to fill the last byte are missing
+    padding = packed.shape[1] * CALLS_PER_BYTE - num_samples
+    counts[:, PACKED_MISSING] -= padding
+    return counts
+
+
+def count_packed_gts(packed, num_samples):
+    '''It counts, per variation, the hom ref, het, hom alt and missing calls
+       using bitwise operations and popcounts on the packed bytes'''
+    def _count_packed_gts(packed):
+        return _count_packed_gts_in_memory(packed, num_samples)
+
+    if isinstance(packed, da.Array):
+        packed = packed.rechunk({1: -1})
+        chunks = (packed.chunks[0], (4,))
+        return da.map_blocks(_count_packed_gts, packed, chunks=chunks,
+                             dtype=np.int64)
+    return _count_packed_gts(packed)
+
+
+def count_alleles_packed(packed, num_samples, max_alleles, count_missing=True):
+    if max_alleles < 2:
+        raise ValueError('Packed genotypes have two alleles')
+    gt_counts = count_packed_gts(packed, num_samples)
+
+    def _count_alleles(gt_counts):
+        allele_counts = np.zeros((gt_counts.shape[0], max_alleles + 1),
+                                 dtype=np.int64)
+        allele_counts[:, 0] = (2 * gt_counts[:, PACKED_HOM_REF] +
+                               gt_counts[:, PACKED_HET])
+        allele_counts[:, 1] = (2 * gt_counts[:, PACKED_HOM_ALT] +
+                               gt_counts[:, PACKED_HET])
+        allele_counts[:, -1] = 2 * gt_counts[:, PACKED_MISSING]
+        if not count_missing:
+            allele_counts = allele_counts[:, :-1]
+        return allele_counts
+
+    num_alleles = max_alleles + 1 if count_missing else max_alleles
+    if isinstance(gt_counts, da.Array):
+        return da.map_blocks(_count_alleles, gt_counts,
+                             chunks=(gt_counts.chunks[0], (num_alleles,)),
+                             dtype=np.int64)
+    return _count_alleles(gt_counts)
+
+
+def _calc_kosman_sums_in_memory(packed, num_samples):
+    codes = _unpack_codes_in_memory(packed, num_samples)
+    # one bit plane per genotype class, bits along the variations
+    planes = [np.packbits(codes.T == code, axis=1)
+              for code in (PACKED_HOM_REF, PACKED_HET, PACKED_HOM_ALT)]
+    hom_ref, het, hom_alt = planes
+    called = hom_ref | het | hom_alt
+
+    sample_idxs1, sample_idxs2 = np.triu_indices(num_samples, k=1)
+    result = np.empty((sample_idxs1.size, 2), dtype=np.float64)
+    # per pair: half an allele shared costs 0.5, no allele shared 1
+    for start in range(0, sample_idxs1.size, num_samples):
+        idxs1 = sample_idxs1[start: start + num_samples]
+        idxs2 = sample_idxs2[start: start + num_samples]
+        one_allele_diff = ((hom_ref[idxs1] & het[idxs2]) |
+                           (het[idxs1] & hom_ref[idxs2]) |
+                           (het[idxs1] & hom_alt[idxs2]) |
+                           (hom_alt[idxs1] & het[idxs2]))
+        two_allele_diff = ((hom_ref[idxs1] & hom_alt[idxs2]) |
+                           (hom_alt[idxs1] & hom_ref[idxs2]))
+        result[start: start + num_samples, 0] = (
+            0.5 * np.sum(_POPCOUNT[one_allele_diff], axis=1) +
+            np.sum(_POPCOUNT[two_allele_diff], axis=1))
+        result[start: start + num_samples, 1] = np.sum(
+            _POPCOUNT[called[idxs1] & called[idxs2]], axis=1)
+    return result.reshape((1,) + result.shape)
+
+
+def calc_kosman_sums_packed(packed, num_samples):
+    '''It returns, for every pair of samples (in combinations order), the
+       sum of the Kosman distances along the variations and the number of
+       variations called in both samples'''
+    def _calc_kosman_sums(packed):
+        return _calc_kosman_sums_in_memory(packed, num_samples)
+
+    num_pairs = num_samples * (num_samples - 1) // 2
+    if isinstance(packed, da.Array):
+        packed = packed.rechunk({1: -1})
+        chunks = ((1,) * packed.numblocks[0], (num_pairs,), (2,))
+        sums = da.map_blocks(_calc_kosman_sums, packed, chunks=chunks,
+                             new_axis=2, dtype=np.float64)
+    else:
+        sums = _calc_kosman_sums(packed)
+    return va.sum(sums, axis=0)
@@ -0,0 +1,146 @@
+import math
+
+import numpy as np
+import dask
+import dask.array as da
+
+from variation6 import MISSING_VALUES
+
+DEF_SKETCH_COMPRESSION = 200
+
+
+def _get_values_to_sketch(array):
+    values = np.asarray(array).ravel()
+    try:
+        missing_value = MISSING_VALUES[values.dtype]
+    except (KeyError, TypeError, ValueError):
+        missing_value = None
+    if missing_value is not None and not math.isnan(missing_value):
+        values = values[values != missing_value]
+    values = values.astype(np.float64)
+    return values[~np.isnan(values)]
+
+
+class QuantileSketch:
+    '''A mergeable t-digest like sketch of the distribution of a set of
+       values.
+
+       The values are kept as weighted centroids. While the distinct values
+       fit in the sketch the quantiles are exact, afterwards the centroids
+       are merged, keeping the tails more precise than the center.'''
+
+    def __init__(self, compression=DEF_SKETCH_COMPRESSION, means=None,
+                 weights=None, min_value=np.inf, max_value=-np.inf,
+                 is_exact=True):
+        self.compression = compression
+        self.is_exact = is_exact
+        self.means = np.empty((0,)) if means is None else means
+        self.weights = np.empty((0,)) if weights is None else weights
+        self.min_value = min_value
+        self.max_value = max_value
+
+    @classmethod
+    def from_array(cls, array, compression=DEF_SKETCH_COMPRESSION):
+        sketch = cls(compression=compression)
+        sketch.add(array)
+        return sketch
+
+    @property
+    def num_values(self):
+        return np.sum(self.weights)
+
+    def _set_centroids(self, means, weights):
+        # the centroids with the same value are joined
+        means, idxs = np.unique(means, return_inverse=True)
+        weights = np.bincount(idxs.ravel(), weights=weights,
+                              minlength=means.size)
+        if means.size > self.compression:
+            means, weights = self._compress(means, weights)
+            self.is_exact = False
+        self.means, self.weights = means, weights
+
+    def _compress(self, means, weights):
+        total = np.sum(weights)
+        mid_quantiles = (np.cumsum(weights) - weights / 2) / total
+        # k1 scale function, the clusters are smaller in the tails
+        ks = self.compression / (2 * np.pi) * np.arcsin(2 * mid_quantiles - 1)
+        clusters = np.floor(ks - ks[0]).astype(np.int64)
+        cluster_weights = np.bincount(clusters, weights=weights)
+        cluster_sums = np.bincount(clusters, weights=weights * means)
+        has_values = cluster_weights > 0
+        return (cluster_sums[has_values] / cluster_weights[has_values],
+                cluster_weights[has_values])
+
+    def add(self, array):
+        values = _get_values_to_sketch(array)
+        if not values.size:
+            return
+        values, counts = np.unique(values, return_counts=True)
+        self.min_value = min(self.min_value, values[0])
+        self.max_value = max(self.max_value, values[-1])
+        self._set_centroids(np.concatenate([self.means, values]),
+                            np.concatenate([self.weights,
+                                            counts.astype(np.float64)]))
+
+    def merge(self, other):
+        self.is_exact = self.is_exact and other.is_exact
+        self.min_value = min(self.min_value, other.min_value)
+        self.max_value = max(self.max_value, other.max_value)
+        self._set_centroids(np.concatenate([self.means, other.means]),
+                            np.concatenate([self.weights, other.weights]))
+
+    def __add__(self, other):
+        sketch = QuantileSketch(compression=max(self.compression,
+                                                other.compression),
+                                means=self.means, weights=self.weights,
+                                min_value=self.min_value,
+                                max_value=self.max_value,
+                                is_exact=self.is_exact)
+        sketch.merge(other)
+        return sketch
+
+    def quantile(self, quantiles):
+        '''It returns the estimated value of the given quantiles, nan if the
+           sketch is empty'''
+        quantiles = np.asarray(quantiles, dtype=np.float64)
+        if not self.means.size:
+            return np.full(quantiles.shape, np.nan)
+        total = self.num_values
+        cum_weights = np.cumsum(self.weights)
+        if self.is_exact:
+            # every distinct value spans the positions of its copies in the
+            # sorted values, so the interpolation matches np.quantile
+            positions = np.stack([cum_weights - self.weights,
+                                  cum_weights - 1], axis=1).ravel()
+            values = np.repeat(self.means, 2)
+        else:
+            # the centroids are placed at their centers
+            positions = np.concatenate([[0], cum_weights - (self.weights + 1) / 2,
+                                        [total - 1]])
+            values = np.concatenate([[self.min_value], self.means,
+                                     [self.max_value]])
+        return np.interp(quantiles * (total - 1), positions, values)
+
+
+def _merge_sketches(sketch1, sketch2):
+    return sketch1 + sketch2
+
+
+def calc_quantile_sketch(array, compression=DEF_SKETCH_COMPRESSION):
+    '''It sketches the distribution of the non missing values of the array.
+
+       For dask arrays every block is sketched and the sketches are merged
+       in a tree reduction, the result is a delayed sketch.'''
+    if not isinstance(array, da.Array):
+        return QuantileSketch.from_array(array, compression=compression)
+
+    sketches = [dask.delayed(QuantileSketch.from_array)(block,
+                                                        compression=compression)
+                for block in array.to_delayed().ravel()]
+    while len(sketches) > 1:
+        merged = [dask.delayed(_merge_sketches)(sketch1, sketch2)
+                  for sketch1, sketch2 in zip(sketches[::2], sketches[1::2])]
+        if len(sketches) % 2:
+            merged.append(sketches[-1])
+        sketches = merged
+    return sketches[0]
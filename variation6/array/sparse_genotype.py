@@ -0,0 +1,146 @@
+import numpy as np
+
+from variation6 import MISSING_INT
+
+
+class SparseGenotypes:
+    '''Genotypes of an in memory chunk of variations stored as CSR.
+
+       Only the calls that are not homozygous for the reference allele are
+       stored: for variation i the columns of its calls are
+       indices[indptr[i]:indptr[i + 1]] and their alleles are the same rows
+       of calls. For datasets with mostly hom ref calls every computation
+       scales with the number of non reference calls.'''
+
+    ndim = 3
+
+    def __init__(self, indptr, indices, calls, num_samples):
+        self.indptr = indptr
+        self.indices = indices
+        self.calls = calls
+        self.num_samples = num_samples
+
+    @classmethod
+    def from_dense(cls, gts):
+        is_stored = np.any(gts != 0, axis=2)
+        rows, cols = np.nonzero(is_stored)
+        num_vars = gts.shape[0]
+        indptr = np.zeros(num_vars + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=num_vars), out=indptr[1:])
+        return cls(indptr, cols, gts[rows, cols], num_samples=gts.shape[1])
+
+    def to_dense(self):
+        gts = np.zeros(self.shape, dtype=self.dtype)
+        gts[self.row_ids, self.indices] = self.calls
+        return gts
+
+    @property
+    def num_variations(self):
+        return self.indptr.size - 1
+
+    @property
+    def shape(self):
+        return (self.num_variations, self.num_samples, self.calls.shape[1])
+
+    @property
+    def dtype(self):
+        return self.calls.dtype
+
+    @property
+    def nbytes(self):
+        return self.indptr.nbytes + self.indices.nbytes + self.calls.nbytes
+
+    @property
+    def row_ids(self):
+        return np.repeat(np.arange(self.num_variations),
+                         np.diff(self.indptr))
+
+    def __getitem__(self, index):
+        # only the variations can be selected
+        if isinstance(index, tuple):
+            index = index[0]
+        rows = np.arange(self.num_variations)[index]
+        if rows.ndim == 0:
+            raise IndexError('An array or a slice is required to index rows')
+
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        indptr = np.zeros(rows.size + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        stored_idxs = (np.repeat(starts - indptr[:-1], lengths) +
+                       np.arange(indptr[-1]))
+        return SparseGenotypes(indptr, self.indices[stored_idxs],
+                               self.calls[stored_idxs],
+                               num_samples=self.num_samples)
+
+
+def count_alleles_sparse(gts, max_alleles, count_missing=True):
+    num_vars, num_samples, ploidy = gts.shape
+    num_cols = max_alleles + 1
+
+    allele_rows = np.repeat(gts.row_ids, ploidy)
+    alleles = gts.calls.ravel()
+    is_missing = alleles == MISSING_INT
+    cols = np.where(is_missing, max_alleles, alleles)
+    is_counted = np.logical_or(is_missing,
+                               np.logical_and(alleles >= 0,
+                                              alleles < max_alleles))
+    flat_idxs = allele_rows[is_counted] * num_cols + cols[is_counted]
+    counts = np.bincount(flat_idxs, minlength=num_vars * num_cols)
+    counts = counts.reshape(num_vars, num_cols)
+
+    # the calls not stored are hom ref
+    num_not_stored = num_samples - np.diff(gts.indptr)
+    counts[:, 0] += ploidy * num_not_stored
+
+    if not count_missing:
+        counts = counts[:, :-1]
+    return counts
+
+
+def count_missing_alleles_sparse(gts, axis=1):
+    num_vars, num_samples, ploidy = gts.shape
+    is_missing = gts.calls == MISSING_INT
+    if axis == 1:
+        ids, length = gts.row_ids, num_vars
+    elif axis == 0:
+        ids, length = gts.indices, num_samples
+    else:
+        raise ValueError('axis should be 0 or 1')
+    return np.bincount(np.repeat(ids, ploidy)[is_missing.ravel()],
+                       minlength=length)
+
+
+def count_het_and_called_sparse(gts, is_masked=None):
+    '''It returns the number of het and called calls per variation.
+
+       is_masked is an optional (variations x samples) boolean array with
+       calls that should be considered missing'''
+    num_vars, num_samples, _ = gts.shape
+    row_ids = gts.row_ids
+    calls = gts.calls
+
+    is_missing = np.any(calls == MISSING_INT, axis=1)
+    is_hom = np.all(calls == calls[:, :1], axis=1)
+    is_het = np.logical_and(~is_hom, ~is_missing)
+
+    num_masked = 0
+    if is_masked is not None:
+        is_stored_masked = is_masked[row_ids, gts.indices]
+        is_het = np.logical_and(is_het, ~is_stored_masked)
+        is_missing = np.logical_and(is_missing, ~is_stored_masked)
+        num_masked = np.sum(is_masked, axis=1)
+
+    het = np.bincount(row_ids[is_het], minlength=num_vars)
+    missing = np.bincount(row_ids[is_missing], minlength=num_vars)
+    called = num_samples - missing - num_masked
+    return het, called
+
+
+def gts_as_mat012_sparse(gts):
+    gts012 = np.zeros(gts.shape[:2], dtype=np.int64)
+    calls = gts.calls
+    values = np.where(np.any(calls == 0, axis=1), 1, 2)
+    values[np.any(calls == MISSING_INT, axis=1)] = MISSING_INT
+    gts012[gts.row_ids, gts.indices] = values
+    return gts012
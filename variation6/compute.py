@@ -4,7 +4,9 @@ import dask
 import dask.array as da
 from dask.delayed import Delayed
 
-from variation6.variations import Variations
+# the module is imported instead of the class because variations uses the
+# array package, that uses compute
+from variation6 import variations
 
 
 def _collect_cargo_to_compute(data, store_variation_to_memory,
@@ -32,7 +34,7 @@ def _collect_cargo_to_compute(data, store_variation_to_memory,
                                       darrays_to_compute=darrays_to_compute,
                                       orig_dicts=orig_dicts,
                                       orig_keys=orig_keys)
-        elif isinstance(cargo, Variations):
+        elif isinstance(cargo, variations.Variations):
             variation_info['key'] = key_arg
             if store_variation_to_memory:
                 variation_info['metadata'] = cargo.metadata
@@ -71,10 +73,11 @@ def compute(data, store_variation_to_memory=False,
     for idx, computed_darray in enumerate(computed_darrays):
         key = orig_keys[idx]
         dict_in_which_the_result_was_stored = orig_dicts[idx]
-        if (isinstance(dict_in_which_the_result_was_stored, Variations) and
+        if (isinstance(dict_in_which_the_result_was_stored,
+                           variations.Variations) and
                 store_variation_to_memory):
             if in_memory_variations is None:
-                in_memory_variations = Variations(metadata=variation_info['metadata'])
+                in_memory_variations = variations.Variations(metadata=variation_info['metadata'])
             if key == 'samples':
                 in_memory_variations.samples = computed_darray
             else:
@@ -0,0 +1,199 @@
+import ast
+import operator
+from functools import reduce
+
+import numpy as np
+import dask.array as da
+
+from variation6 import (GT_FIELD, GT_PACKED_FIELD, DP_FIELD, CHROM_FIELD,
+                        POS_FIELD, QUAL_FIELD, MAF_STAT_FIELD_NAME,
+                        MAF_STAT_FIELD, MAC_STAT_FIELD_NAME, MAC_STAT_FIELD,
+                        CALL_RATE_STAT_FIELD_NAME, CALL_RATE_STAT_FIELD,
+                        OBS_HET_STAT_FIELD_NAME, OBS_HET_STAT_FIELD,
+                        MIN_NUM_GENOTYPES_FOR_POP_STAT)
+from variation6.variations import Variations
+import variation6.array as va
+from variation6.stats.variant_stats import (get_variant_stat,
+                                            get_stored_variant_stat,
+                                            get_stat_params)
+
+# the names that can be used in an expression and the field that they refer
+# to
+FIELD_NAMES = {'chrom': CHROM_FIELD, 'pos': POS_FIELD, 'qual': QUAL_FIELD}
+STAT_NAMES = {MAF_STAT_FIELD_NAME: MAF_STAT_FIELD,
+              MAC_STAT_FIELD_NAME: MAC_STAT_FIELD,
+              CALL_RATE_STAT_FIELD_NAME: CALL_RATE_STAT_FIELD,
+              OBS_HET_STAT_FIELD_NAME: OBS_HET_STAT_FIELD}
+
+_COMPARISONS = {ast.Eq: operator.eq, ast.NotEq: operator.ne,
+                ast.Lt: operator.lt, ast.LtE: operator.le,
+                ast.Gt: operator.gt, ast.GtE: operator.ge}
+
+
+class FilterExpressionError(ValueError):
+    pass
+
+
+def _as_comparable(value, other):
+    # the string constants are compared with the bytes arrays as bytes
+    if (isinstance(value, str) and isinstance(other, np.ndarray) and
+            other.dtype.kind == 'S'):
+        return value.encode()
+    return value
+
+
+def _compare(op, value1, value2):
+    value1, value2 = (_as_comparable(value1, value2),
+                      _as_comparable(value2, value1))
+    with np.errstate(invalid='ignore'):
+        return np.asarray(op(value1, value2), dtype=bool)
+
+
+class FilterExpression:
+    '''A boolean expression over per variation stats and fields, like
+       "call_rate >= 0.8 and maf >= 0.05 and chrom != 'chrUn'".
+
+       It is parsed only once and it is evaluated with a dict with the value
+       of every name used. The comparisons with nan are False, as in the
+       filters.'''
+
+    def __init__(self, expression):
+        self.expression = expression
+        try:
+            tree = ast.parse(expression, mode='eval')
+        except SyntaxError as error:
+            raise FilterExpressionError(f'Invalid filter expression: {expression}') from error
+        self.names = []
+        self._evaluate = self._compile(tree.body)
+        if not self.names:
+            raise FilterExpressionError(f'The filter expression does not use any stat or field: {expression}')
+
+    def _compile(self, node):
+        if isinstance(node, ast.BoolOp):
+            funcs = [self._compile(value) for value in node.values]
+            logical_op = (np.logical_and if isinstance(node.op, ast.And)
+                          else np.logical_or)
+            return lambda values: reduce(logical_op, [func(values)
+                                                      for func in funcs])
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            func = self._compile(node.operand)
+            return lambda values: np.logical_not(func(values))
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            func = self._compile(node.operand)
+            return lambda values: -func(values)
+        elif isinstance(node, ast.Compare):
+            return self._compile_comparison(node)
+        elif isinstance(node, ast.Name):
+            name = node.id
+            if name not in FIELD_NAMES and name not in STAT_NAMES:
+                raise FilterExpressionError(f'Unknown name in filter expression: {name}')
+            if name not in self.names:
+                self.names.append(name)
+            return lambda values: values[name]
+        elif (isinstance(node, ast.Constant) and
+              isinstance(node.value, (int, float, str))):
+            value = node.value
+            return lambda values: value
+        msg = f'Unsupported syntax in filter expression: {ast.dump(node)}'
+        raise FilterExpressionError(msg)
+
+    def _compile_comparison(self, node):
+        try:
+            ops = [_COMPARISONS[type(op)] for op in node.ops]
+        except KeyError:
+            msg = f'Unsupported comparison in filter expression: {self.expression}'
+            raise FilterExpressionError(msg)
+        funcs = [self._compile(operand)
+                 for operand in [node.left] + node.comparators]
+
+        def _evaluate(values):
+            operands = [func(values) for func in funcs]
+            results = [_compare(op, value1, value2)
+                       for op, value1, value2 in zip(ops, operands,
+                                                     operands[1:])]
+            return reduce(np.logical_and, results)
+        return _evaluate
+
+    def evaluate(self, values):
+        return self._evaluate(values)
+
+
+def _get_fields_to_read(variations, names, stat_params):
+    fields = []
+    for name in names:
+        if name in FIELD_NAMES:
+            if FIELD_NAMES[name] not in variations:
+                raise FilterExpressionError(f'Field required by the filter expression not found: {name}')
+            fields.append(FIELD_NAMES[name])
+            continue
+
+        field = STAT_NAMES[name]
+        params = get_stat_params(field, **stat_params)
+        if get_stored_variant_stat(variations, field, **params) is not None:
+            fields.append(field)
+            continue
+        # the stat has to be calculated from the genotypes
+        fields.append(GT_PACKED_FIELD if variations.has_packed_gts
+                      else GT_FIELD)
+        if (field == OBS_HET_STAT_FIELD and
+                (stat_params['min_call_dp_for_het_call'] is not None or
+                 stat_params['max_call_dp_for_het_call'] is not None)):
+            fields.append(DP_FIELD)
+    return list(dict.fromkeys(fields))
+
+
+def _evaluate_expression_in_memory(expression, fields, samples, metadata,
+                                   stat_params, *arrays):
+    variations = Variations(samples=samples, metadata=metadata)
+    for field, array in zip(fields, arrays):
+        variations[field] = array
+    values = {}
+    for name in expression.names:
+        if name in FIELD_NAMES:
+            values[name] = variations[FIELD_NAMES[name]]
+        else:
+            values[name] = get_variant_stat(variations, STAT_NAMES[name],
+                                            **stat_params)
+    return np.asarray(expression.evaluate(values), dtype=bool)
+
+
+def calc_expression_mask(variations, expression, max_alleles=None,
+                         min_num_genotypes=MIN_NUM_GENOTYPES_FOR_POP_STAT,
+                         min_call_dp_for_het_call=None,
+                         max_call_dp_for_het_call=None):
+    '''It evaluates the filter expression for every variation.
+
+       The fields and stats required by the expression are collected once
+       and all of them are calculated, or read if they are stored, and
+       evaluated by one function per chunk of variations.'''
+    if not isinstance(expression, FilterExpression):
+        expression = FilterExpression(expression)
+    stat_params = {'max_alleles': max_alleles,
+                   'min_num_genotypes': min_num_genotypes,
+                   'min_call_dp_for_het_call': min_call_dp_for_het_call,
+                   'max_call_dp_for_het_call': max_call_dp_for_het_call}
+    if (max_alleles is None and
+            any(name in (MAF_STAT_FIELD_NAME, MAC_STAT_FIELD_NAME)
+                for name in expression.names)):
+        raise ValueError('max_alleles is required to calculate the maf and mac')
+
+    fields = _get_fields_to_read(variations, expression.names, stat_params)
+    samples = va.make_sure_array_is_in_memory(variations.samples)
+    arrays = [variations._arrays[field] for field in fields]
+
+    def _evaluate(*arrays):
+        return _evaluate_expression_in_memory(expression, fields, samples,
+                                              variations.metadata,
+                                              stat_params, *arrays)
+
+    if not any(isinstance(array, da.Array) for array in arrays):
+        return _evaluate(*arrays)
+
+    args = []
+    for array in arrays:
+        if array.ndim > 1:
+            # every block has all the samples of its variations
+            array = array.rechunk({axis: -1 for axis in range(1, array.ndim)})
+        args.extend((array, 'ijk'[:array.ndim]))
+    return da.blockwise(_evaluate, 'i', *args, dtype=bool, concatenate=True,
+                        meta=np.array((), dtype=bool))
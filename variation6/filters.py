@@ -1,21 +1,30 @@
 import sys
 from collections import OrderedDict
+from functools import partial
+from pathlib import Path
+from tempfile import TemporaryDirectory
 
 import numpy as np
-import dask
+import dask.array as da
 
-from variation6 import (GT_FIELD, DP_FIELD, H5PY, MISSING_INT, QUAL_FIELD,
-                        PUBLIC_CALL_GROUP, N_KEPT, N_FILTERED_OUT,
-                        FLT_VARS, CHROM_FIELD, POS_FIELD,
+from variation6 import (GT_FIELD, GT_PACKED_FIELD, DP_FIELD, H5PY, MISSING_INT,
+                        GQ_FIELD, AD_FIELD, RO_FIELD, AO_FIELD,
+                        N_CALLS_SET_TO_MISSING, N_ITERATIONS, DEF_CHUNK_SIZE,
+                        PUBLIC_CALL_GROUP, PUBLIC_VARIANT_STATS_GROUP, N_KEPT,
+                        N_FILTERED_OUT, FLT_VARS, CHROM_FIELD, POS_FIELD,
                         MIN_NUM_GENOTYPES_FOR_POP_STAT, ALT_FIELD, FLT_STATS,
                         FLT_ID, COUNT, BIN_EDGES, N_SAMPLES_KEPT,
-                        N_SAMPLES_FILTERED_OUT, HIST_RANGE, ZARR, H5PY)
-from variation6.variations import Variations
+                        N_SAMPLES_FILTERED_OUT, HIST_RANGE, ZARR, H5PY,
+                        MAF_STAT_FIELD, MAC_STAT_FIELD, CALL_RATE_STAT_FIELD,
+                        OBS_HET_STAT_FIELD, SWEEP_STATS, SWEEP_THRESHOLDS)
+from variation6.variations import Variations, normalize_name
 import variation6.array as va
 from variation6.stats.diversity import (calc_missing_gt, calc_maf_by_allele_count,
-                                        calc_mac, calc_maf_by_gt,
                                         calc_missing_gt_per_sample, count_alleles,
-                                        calc_obs_het, DEF_NUM_BINS)
+                                        DEF_NUM_BINS)
+from variation6.stats.hwe import calc_hwe_pvalues
+from variation6.stats.variant_stats import get_variant_stat
+from variation6.filter_expression import calc_expression_mask
 from variation6.in_out.zarr import load_zarr, prepare_zarr_storage
 from variation6.in_out.hdf5 import load_hdf5, prepare_hdf5_storage
 from variation6.compute import compute
@@ -26,10 +35,10 @@ from variation6 import utils_file
 def remove_low_call_rate_vars(variations, min_call_rate, rates=True,
                               filter_id='call_rate', calc_histogram=False,
                               n_bins=DEF_NUM_BINS, limits=None):
-    num_missing_gts = calc_missing_gt(variations, rates=rates)
     if rates:
-        num_called = 1 - num_missing_gts
+        num_called = get_variant_stat(variations, CALL_RATE_STAT_FIELD)
     else:
+        num_missing_gts = calc_missing_gt(variations, rates=rates)
         num_called = utils_array.get_shape_item(variations.gt, 1)  - num_missing_gts
 
     selected_vars = num_called >= min_call_rate
@@ -80,37 +89,239 @@ def remove_low_call_rate_samples(variations, min_call_rate, rates=True,
     return {FLT_VARS: variations, FLT_ID: filter_id, FLT_STATS:flt_stats}
 
 
-def stack_in_memory(array, axis):
-    return np.stack([array, array], axis)
+def _calc_het_allele_balance(gts, allele_depths):
+    # the fraction of reads of a call that support its less covered allele
+    allele_depths = np.where(allele_depths == MISSING_INT, 0, allele_depths)
+    num_alleles = allele_depths.shape[2]
+    gts_idxs = np.clip(gts, 0, num_alleles - 1)
+    call_allele_depths = np.take_along_axis(allele_depths, gts_idxs, axis=2)
+    depths = np.sum(allele_depths, axis=2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        balance = np.min(call_allele_depths, axis=2) / depths
+
+    is_het = np.any(gts != gts[:, :, :1], axis=2)
+    is_het = np.logical_and(is_het, np.all(gts != MISSING_INT, axis=2))
+    balance[~is_het] = np.nan
+    return balance
+
+
+def _calc_call_mask_in_memory(gts, dps, gqs, ads, ros, aos, min_dp=None,
+                              max_dp=None, min_gq=None,
+                              min_het_allele_balance=None):
+    is_masked = np.zeros(gts.shape[:2], dtype=bool)
+    if min_dp is not None:
+        is_masked |= dps < min_dp
+    if max_dp is not None:
+        is_masked |= dps > max_dp
+    if min_gq is not None:
+        is_masked |= gqs < min_gq
+    if min_het_allele_balance is not None:
+        if ads is None:
+            ads = np.concatenate([ros[:, :, None], aos], axis=2)
+        balance = _calc_het_allele_balance(gts, ads)
+        with np.errstate(invalid='ignore'):
+            is_masked |= balance < min_het_allele_balance
+    return is_masked
+
+
+def _set_masked_calls_to_missing_in_memory(gts, is_masked):
+    return np.where(is_masked[:, :, None], MISSING_INT, gts).astype(gts.dtype)
+
+
+def _count_masked_calls_in_memory(gts, is_masked):
+    was_missing = np.all(gts == MISSING_INT, axis=2)
+    num_masked = np.sum(np.logical_and(is_masked, ~was_missing))
+    return np.array(num_masked, dtype=np.int64).reshape(1, 1)
+
+
+def set_calls_to_missing(variations, min_dp=None, max_dp=None, min_gq=None,
+                         min_het_allele_balance=None,
+                         filter_id='calls_to_missing'):
+    '''It sets to missing the genotypes of the calls that fail any of the
+       given conditions.
+
+       All the conditions are evaluated in one pass over every block and the
+       genotypes are masked for any ploidy. The allele balance of a het call
+       is the fraction of its reads that support its less covered allele, it
+       is calculated from AD or, if not available, from RO and AO.'''
+    gts = variations[GT_FIELD]
+    fields = {'dps': DP_FIELD if min_dp is not None or max_dp is not None else None,
+              'gqs': GQ_FIELD if min_gq is not None else None,
+              'ads': None, 'ros': None, 'aos': None}
+    for field in (fields['dps'], fields['gqs']):
+        if field is not None and field not in variations:
+            raise ValueError(f'{field} is required to set the calls to missing')
+    if min_het_allele_balance is not None:
+        if AD_FIELD in variations:
+            fields['ads'] = AD_FIELD
+        elif RO_FIELD in variations and AO_FIELD in variations:
+            fields['ros'] = RO_FIELD
+            fields['aos'] = AO_FIELD
+        else:
+            raise ValueError('AD or RO and AO are required to calculate the allele balance')
+    arrays = {key: None if field is None else variations[field]
+              for key, field in fields.items()}
+
+    def _calc_call_mask(gts, dps, gqs, ads, ros, aos):
+        return _calc_call_mask_in_memory(gts, dps, gqs, ads, ros, aos,
+                                         min_dp=min_dp, max_dp=max_dp,
+                                         min_gq=min_gq,
+                                         min_het_allele_balance=min_het_allele_balance)
+
+    if isinstance(gts, da.Array):
+        gts = gts.rechunk({2: -1})
+        indexes = {'dps': 'ij', 'gqs': 'ij', 'ads': 'ijl', 'ros': 'ij',
+                   'aos': 'ijm'}
+        args = [gts, 'ijk']
+        for key in fields:
+            array = arrays[key]
+            args.extend((None, None) if array is None else (array, indexes[key]))
+        is_masked = da.blockwise(_calc_call_mask, 'ij', *args,
+                                 concatenate=True, dtype=bool)
+        new_gts = da.blockwise(_set_masked_calls_to_missing_in_memory, 'ijk',
+                               gts, 'ijk', is_masked, 'ij', dtype=gts.dtype)
+        num_masked = da.blockwise(_count_masked_calls_in_memory, 'ij',
+                                  gts, 'ijk', is_masked, 'ij',
+                                  concatenate=True, dtype=np.int64,
+                                  adjust_chunks={'i': 1, 'j': 1}).sum()
+    else:
+        is_masked = _calc_call_mask(gts, **arrays)
+        new_gts = _set_masked_calls_to_missing_in_memory(gts, is_masked)
+        num_masked = _count_masked_calls_in_memory(gts, is_masked)[0, 0]
 
+    variations[GT_FIELD] = new_gts
 
-def _gt_to_missing(variations, field, min_value):
-    gts = variations[GT_FIELD]
-    calls_setted_to_missing = variations[field] < min_value
-    axis = 2
+    return {FLT_VARS: variations, FLT_ID: filter_id,
+            FLT_STATS: {N_CALLS_SET_TO_MISSING: num_masked}}
 
-    def _stack_in_memory(array):
-        return stack_in_memory(array, axis=axis)
 
-    # as we can not slice using arrays of diferente dimensions, we need to
-    # create one with same dimensions with stack
-    p2 = va.map_blocks(_stack_in_memory, calls_setted_to_missing, dtype='i4',
-                       new_axis=2)
+def min_depth_gt_to_missing(variations, min_depth):
+    return set_calls_to_missing(variations, min_dp=min_depth,
+                                filter_id='min_depth_gt_to_missing')
 
-    gts[p2] = MISSING_INT
-    # va.assign_with_masking_value(gts, MISSING_INT, p2)
 
-    variations[GT_FIELD] = gts
+def min_qual_gt_to_missing(variations, min_qual):
+    # the genotype quality is the call level quality
+    return set_calls_to_missing(variations, min_gq=min_qual,
+                                filter_id='min_qual_gt_to_missing')
 
-    return {FLT_VARS: variations}
 
+def _pack_missing_gts_in_memory(gts):
+    return np.packbits(np.any(gts == MISSING_INT, axis=2), axis=1)
 
-def min_depth_gt_to_missing(variations, min_depth):
-    return _gt_to_missing(variations, field=DP_FIELD, min_value=min_depth)
 
+def _calc_missing_gt_bitmap(variations):
+    # variations x samples bitmap of the missing calls, 8 samples per byte
+    gts = variations[GT_FIELD]
+    if isinstance(gts, da.Array):
+        gts = gts.rechunk({1: -1, 2: -1})
+        num_bytes = (gts.shape[1] + 7) // 8
+        bitmap = da.map_blocks(_pack_missing_gts_in_memory, gts,
+                               drop_axis=2, dtype=np.uint8,
+                               chunks=(gts.chunks[0], (num_bytes,)))
+    else:
+        bitmap = _pack_missing_gts_in_memory(gts)
+    return va.make_sure_array_is_in_memory(bitmap)
+
+
+def _count_missing_gts_in_bitmap_rows(bitmap, rows, sample_mask,
+                                      num_vars_per_block=DEF_CHUNK_SIZE):
+    num_missing = np.zeros(sample_mask.size, dtype=np.int64)
+    for start in range(0, rows.size, num_vars_per_block):
+        block = bitmap[rows[start: start + num_vars_per_block]]
+        is_missing = np.unpackbits(block, axis=1, count=sample_mask.size)
+        num_missing += np.sum(is_missing, axis=0, dtype=np.int64)
+    num_missing[~sample_mask] = 0
+    return num_missing
+
+
+def _count_missing_gts_per_var_in_bitmap(bitmap,
+                                         num_vars_per_block=DEF_CHUNK_SIZE):
+    # the rows are unpacked by blocks to keep the bits of only a few
+    # variations in memory
+    num_missing = np.empty(bitmap.shape[0], dtype=np.int64)
+    for start in range(0, bitmap.shape[0], num_vars_per_block):
+        block = bitmap[start: start + num_vars_per_block]
+        num_missing[start: start + num_vars_per_block] = np.sum(np.unpackbits(block, axis=1),
+                                                                axis=1, dtype=np.int64)
+    return num_missing
+
+
+def _count_missing_gts_in_bitmap_cols(bitmap, cols):
+    bits = (bitmap[:, cols // 8] >> (7 - cols % 8)[None, :]) & 1
+    return np.sum(bits, axis=1, dtype=np.int64)
+
+
+def remove_low_call_rate_vars_and_samples(variations, min_var_call_rate,
+                                          min_sample_call_rate,
+                                          max_iterations=None,
+                                          filter_id='joint_call_rate',
+                                          calc_histogram=False,
+                                          n_bins=DEF_NUM_BINS, limits=None):
+    '''It removes the variations and samples with low call rate
+       alternately until both call rates are stable.
+
+       The missing calls are read only once and kept in memory as a bitmap.
+       In every iteration the missing counts are updated using only the
+       bits of the removed variations and samples.
+
+       The samples to keep have to be known to build the filtered
+       variations, so the bitmap is computed when this function is called,
+       not when the result is computed. Every task required to get the
+       genotypes is run then and again when the result is computed.'''
+    bitmap = _calc_missing_gt_bitmap(variations)
+    num_vars = bitmap.shape[0]
+    num_samples = variations.num_samples
+
+    var_mask = np.ones(num_vars, dtype=bool)
+    sample_mask = np.ones(num_samples, dtype=bool)
+    num_missing_per_var = _count_missing_gts_per_var_in_bitmap(bitmap)
+    num_missing_per_sample = _count_missing_gts_in_bitmap_rows(bitmap,
+                                                               np.arange(num_vars),
+                                                               sample_mask)
+
+    num_iterations = 0
+    while max_iterations is None or num_iterations < max_iterations:
+        num_iterations += 1
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var_call_rates = 1 - num_missing_per_var / np.sum(sample_mask)
+        vars_to_remove = np.flatnonzero(np.logical_and(var_mask,
+                                                       var_call_rates < min_var_call_rate))
+        var_mask[vars_to_remove] = False
+        num_missing_per_sample -= _count_missing_gts_in_bitmap_rows(bitmap,
+                                                                    vars_to_remove,
+                                                                    sample_mask)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sample_call_rates = 1 - num_missing_per_sample / np.sum(var_mask)
+        samples_to_remove = np.flatnonzero(np.logical_and(sample_mask,
+                                                          sample_call_rates < min_sample_call_rate))
+        sample_mask[samples_to_remove] = False
+        num_missing_per_var -= _count_missing_gts_in_bitmap_cols(bitmap,
+                                                                 samples_to_remove)
+        if not vars_to_remove.size and not samples_to_remove.size:
+            break
+
+    variations = variations.get_vars(var_mask)
+    variations = keep_samples_with_mask(variations, sample_mask)[FLT_VARS]
+
+    flt_stats = {N_KEPT: int(np.sum(var_mask)),
+                 N_FILTERED_OUT: int(num_vars - np.sum(var_mask)),
+                 N_SAMPLES_KEPT: int(np.sum(sample_mask)),
+                 N_SAMPLES_FILTERED_OUT: int(num_samples - np.sum(sample_mask)),
+                 N_ITERATIONS: num_iterations}
 
-def min_qual_gt_to_missing(variations, min_qual):
-    return _gt_to_missing(variations, field=QUAL_FIELD, min_value=min_qual)
+    if calc_histogram:
+        # the call rates of all variations in the kept samples
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var_call_rates = 1 - num_missing_per_var / np.sum(sample_mask)
+        limits = (0, 1) if limits is None else limits
+        counts, bin_edges = va.histogram(var_call_rates, n_bins=n_bins,
+                                         limits=limits)
+        flt_stats[COUNT] = counts
+        flt_stats[BIN_EDGES] = bin_edges
+        flt_stats[HIST_RANGE] = [min_var_call_rate]
+    return {FLT_VARS: variations, FLT_ID: filter_id, FLT_STATS: flt_stats}
 
 
 def keep_samples(variations, samples):
@@ -122,33 +333,127 @@ def remove_samples(variations, samples):
 
 
 def keep_samples_with_mask(variations, sample_mask):
-    orig_sample_names = list(va.make_sure_array_is_in_memory(variations.samples))
-    desired_samples = [sample for keep, sample in zip(sample_mask, orig_sample_names) if keep]
-    return _filter_samples(variations, desired_samples)
+    sample_mask = va.make_sure_array_is_in_memory(sample_mask)
+    sample_cols = np.flatnonzero(sample_mask)
+    return _filter_samples_by_cols(variations, sample_cols)
 
 
-def _str_list_to_byte_list(str_list):
-    return [item.encode() if isinstance(item, str) else item for item in str_list]
+def _filter_samples(variations, desired_samples, reverse=False):
+    sample_index = variations.sample_index
+    desired_samples = [normalize_name(sample)
+                       for sample in desired_samples]
 
+    if reverse:
+        samples_to_remove = set(desired_samples)
+        sample_cols = [idx for sample, idx in sample_index.items()
+                       if sample not in samples_to_remove]
+    else:
+        try:
+            sample_cols = [sample_index[sample] for sample in desired_samples]
+        except KeyError as error:
+            raise ValueError(f'Sample not found in variations: {error.args[0]}')
 
-def _filter_samples(variations, desired_samples, reverse=False):
-    desired_samples = _str_list_to_byte_list(desired_samples)
+    return _filter_samples_by_cols(variations, np.array(sample_cols, dtype=int))
 
-    orig_sample_names = va.make_sure_array_is_in_memory(variations.samples)
 
-    if reverse:
-        desired_samples = [sample for sample in orig_sample_names if sample not in desired_samples]
+def _group_cols_in_contiguous_slices(sample_cols):
+    sorted_cols = np.sort(sample_cols)
+    run_starts = np.flatnonzero(np.diff(sorted_cols) != 1) + 1
+    run_starts = np.concatenate(([0], run_starts))
+    run_ends = np.concatenate((run_starts[1:], [sorted_cols.size]))
+    slices = [slice(sorted_cols[start], sorted_cols[end - 1] + 1)
+              for start, end in zip(run_starts, run_ends)]
 
-    orig_sample_names = list(orig_sample_names)
-    sample_cols = np.array([orig_sample_names.index(sample) for sample in desired_samples])
-    sample_cols = list(sample_cols)
+    if np.all(sorted_cols == sample_cols):
+        order = None
+    else:
+        # position of each requested column in the sorted gathered array
+        order = np.searchsorted(sorted_cols, sample_cols)
+    return slices, order
+
+
+def _take_sample_cols_in_memory(array, col_slices, order):
+    if len(col_slices) == 1:
+        array = array[:, col_slices[0]]
+    else:
+        array = np.concatenate([array[:, col_slice] for col_slice in col_slices],
+                               axis=1)
+    if order is not None:
+        array = array[:, order]
+    return array
+
+
+def _localize_col_slices(col_slices, start, end):
+    return [slice(max(col_slice.start, start) - start,
+                  min(col_slice.stop, end) - start)
+            for col_slice in col_slices
+            if col_slice.start < end and col_slice.stop > start]
+
+
+def _take_sample_cols(array, sample_cols):
+    if not sample_cols.size:
+        return array[:, sample_cols]
+    col_slices, order = _group_cols_in_contiguous_slices(sample_cols)
+
+    if not isinstance(array, da.Array):
+        return _take_sample_cols_in_memory(array, col_slices, order)
+
+    if len(array.chunks[1]) == 1:
+        sample_chunks_orders = [order]
+    else:
+        # the reordering is done once all sample chunks have been gathered
+        sample_chunks_orders = [None] * len(array.chunks[1])
+
+    # every tile is gathered in its own task, so the chunks along both axes
+    # are kept as they were, only the sample chunks are shrunk
+    sample_chunk_limits = np.cumsum((0,) + array.chunks[1])
+    gathered = []
+    for sample_chunk_idx, chunk_order in enumerate(sample_chunks_orders):
+        start = sample_chunk_limits[sample_chunk_idx]
+        end = sample_chunk_limits[sample_chunk_idx + 1]
+        local_slices = _localize_col_slices(col_slices, start, end)
+        if not local_slices:
+            continue
+        num_cols = sum(col_slice.stop - col_slice.start
+                       for col_slice in local_slices)
+
+        def _take_sample_cols_in_block(block, local_slices=local_slices,
+                                       chunk_order=chunk_order):
+            return _take_sample_cols_in_memory(block, local_slices,
+                                               chunk_order)
+
+        sample_chunk = array.blocks[:, sample_chunk_idx]
+        chunks = ((sample_chunk.chunks[0], (num_cols,)) +
+                  sample_chunk.chunks[2:])
+        # with meta dask does not call the function with an empty block,
+        # that can not be indexed by the sample order
+        gathered.append(va.map_blocks(_take_sample_cols_in_block,
+                                      sample_chunk, chunks=chunks,
+                                      dtype=array.dtype,
+                                      meta=np.empty((0,) * array.ndim,
+                                                    dtype=array.dtype)))
+    array = da.concatenate(gathered, axis=1)
+
+    if len(sample_chunks_orders) > 1 and order is not None:
+        array = array[:, order]
+    return array
+
+
+def _filter_samples_by_cols(variations, sample_cols):
+    orig_sample_names = va.make_sure_array_is_in_memory(variations.samples)
+    new_samples = orig_sample_names[sample_cols]
 
-    new_variations = Variations(samples=np.array(desired_samples),
+    new_variations = Variations(samples=new_samples,
                                 metadata=variations.metadata)
     for field, array in variations._arrays.items():
-        if PUBLIC_CALL_GROUP in field:            
-            with dask.config.set(**{'array.slicing.split_large_chunks': False}):
-                array = array[:, sample_cols]
+        if field.startswith(PUBLIC_VARIANT_STATS_GROUP):
+            # the stats were calculated with the previous samples
+            continue
+        if field == GT_PACKED_FIELD:
+            gts = _take_sample_cols(variations[GT_FIELD], sample_cols)
+            array = va.pack_gts(gts)
+        elif PUBLIC_CALL_GROUP in field:
+            array = _take_sample_cols(array, sample_cols)
         new_variations[field] = array
     return {FLT_VARS: new_variations}
 
@@ -216,8 +521,8 @@ def filter_by_maf(variations, max_alleles, max_allowable_maf=None,
                   min_allowable_maf=None, filter_id='filter_by_maf',
                   min_num_genotypes=MIN_NUM_GENOTYPES_FOR_POP_STAT,
                   calc_histogram=False, n_bins=DEF_NUM_BINS, limits=None):
-    mafs = calc_maf_by_gt(variations, max_alleles=max_alleles,
-                          min_num_genotypes=min_num_genotypes)
+    mafs = get_variant_stat(variations, MAF_STAT_FIELD, max_alleles=max_alleles,
+                            min_num_genotypes=min_num_genotypes)
 
     result = _select_vars(variations, mafs, min_allowable_maf,
                           max_allowable_maf)
@@ -243,8 +548,8 @@ def filter_by_mac(variations, max_alleles, max_allowable_mac=None,
                   min_allowable_mac=None, filter_id='filter_by_mac',
                   min_num_genotypes=MIN_NUM_GENOTYPES_FOR_POP_STAT,
                   calc_histogram=False, n_bins=DEF_NUM_BINS, limits=None):
-    macs = calc_mac(variations, max_alleles=max_alleles,
-                    min_num_genotypes=min_num_genotypes)
+    macs = get_variant_stat(variations, MAC_STAT_FIELD, max_alleles=max_alleles,
+                            min_num_genotypes=min_num_genotypes)
     # print(compute(macs))
 
     result = _select_vars(variations, macs, min_allowable_mac, max_allowable_mac)
@@ -299,25 +604,80 @@ def remove_variations_in_regions(variations, regions,
     return _filter_by_snp_position(variations, regions, filter_id, reverse=True)
 
 
-def _select_variations_in_region(variations, regions):
-    chroms = variations[CHROM_FIELD]
-    poss = variations[POS_FIELD]
+_MIN_POS = np.iinfo(np.int64).min
+_MAX_POS = np.iinfo(np.int64).max
+
+
+def _merge_regions(regions):
+    '''It returns, per chromosome, the sorted starts and ends of the
+       regions once the overlapping ones have been merged.
 
-    in_any_region = None
+       A region with just a chromosome covers all of it.'''
+    regions_by_chrom = {}
     for region in regions:
-        desired_chrom = region[0]
-        if isinstance(desired_chrom, (tuple, list)):
+        chrom = region[0]
+        if isinstance(chrom, (tuple, list)):
             raise ValueError('Malformed region: ' + str(region))
-        in_this_region = chroms[:] == desired_chrom
         if len(region) > 1:
-            in_this_region = va.logical_and(in_this_region,
-                                            va.logical_and(region[1] <= poss, poss < region[2]))
-        if in_any_region is None:
-            in_any_region = in_this_region
+            start, end = region[1], region[2]
         else:
-            in_any_region = va.logical_or(in_any_region, in_this_region)
+            start, end = _MIN_POS, _MAX_POS
+        chrom = normalize_name(chrom)
+        regions_by_chrom.setdefault(chrom, []).append((start, end))
+
+    merged_regions = {}
+    for chrom, chrom_regions in regions_by_chrom.items():
+        chrom_regions.sort()
+        starts, ends = [], []
+        for start, end in chrom_regions:
+            if starts and start <= ends[-1]:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        merged_regions[chrom] = (np.array(starts, dtype=np.int64),
+                                 np.array(ends, dtype=np.int64))
+    return merged_regions
+
+
+def _select_variations_in_regions_in_memory(chroms, poss, merged_regions):
+    in_regions = np.zeros(chroms.shape, dtype=bool)
+    if not chroms.size:
+        return in_regions
+
+    for chrom in np.unique(chroms):
+        chrom_regions = merged_regions.get(normalize_name(chrom))
+        if chrom_regions is None:
+            continue
+        starts, ends = chrom_regions
+        is_chrom = chroms == chrom
+        chrom_poss = poss[is_chrom]
+
+        # only the regions that overlap with the positions of the chunk
+        first = np.searchsorted(ends, chrom_poss.min(), side='right')
+        last = np.searchsorted(starts, chrom_poss.max(), side='right')
+        if first >= last:
+            continue
+        starts, ends = starts[first:last], ends[first:last]
+
+        region_idxs = np.searchsorted(starts, chrom_poss, side='right') - 1
+        in_region = region_idxs >= 0
+        in_region[in_region] = (chrom_poss[in_region] <
+                                ends[region_idxs[in_region]])
+        in_regions[is_chrom] = in_region
+    return in_regions
 
-    return in_any_region
+
+def _select_variations_in_region(variations, regions):
+    merged_regions = _merge_regions(regions)
+
+    def _select_variations_in_regions(chroms, poss):
+        return _select_variations_in_regions_in_memory(chroms, poss,
+                                                       merged_regions)
+
+    return va.map_blocks(_select_variations_in_regions,
+                         variations[CHROM_FIELD], variations[POS_FIELD],
+                         dtype=bool)
 
 
 def _filter_by_snp_position(variations, regions, filter_id, reverse=False):
@@ -345,9 +705,10 @@ def filter_by_obs_heterocigosis(variations, max_allowable_het=None,
                                 calc_histogram=False, n_bins=DEF_NUM_BINS,
                                 limits=None):
 
-    obs_het = calc_obs_het(variations, min_num_genotypes=min_num_genotypes,
-                           min_call_dp_for_het_call=min_call_dp_for_het_call,
-                           max_call_dp_for_het_call=max_call_dp_for_het_call)
+    obs_het = get_variant_stat(variations, OBS_HET_STAT_FIELD,
+                               min_num_genotypes=min_num_genotypes,
+                               min_call_dp_for_het_call=min_call_dp_for_het_call,
+                               max_call_dp_for_het_call=max_call_dp_for_het_call)
 
     result = _select_vars(variations, obs_het,
                           min_allowable=min_allowable_het,
@@ -369,6 +730,149 @@ def filter_by_obs_heterocigosis(variations, max_allowable_het=None,
             FLT_STATS: result[FLT_STATS]}
 
 
+def filter_by_hwe(variations, min_allowable_pvalue=None, filter_id='hwe',
+                  calc_histogram=False, n_bins=DEF_NUM_BINS, limits=None):
+    pvalues = calc_hwe_pvalues(variations)
+
+    result = _select_vars(variations, pvalues,
+                          min_allowable=min_allowable_pvalue)
+    if calc_histogram:
+        if limits is None:
+            limits = (0, 1)
+        counts, bin_edges = va.histogram(pvalues, n_bins=n_bins, limits=limits)
+        result[FLT_STATS][COUNT] = counts
+        result[FLT_STATS][BIN_EDGES] = bin_edges
+        limits = []
+        if min_allowable_pvalue is not None:
+            limits.append(min_allowable_pvalue)
+        result[FLT_STATS]['limits'] = limits
+
+    return {FLT_VARS: result[FLT_VARS], FLT_ID: filter_id,
+            FLT_STATS: result[FLT_STATS]}
+
+
+def filter_by_expression(variations, expression, max_alleles=None,
+                         filter_id='expression',
+                         min_num_genotypes=MIN_NUM_GENOTYPES_FOR_POP_STAT,
+                         min_call_dp_for_het_call=None,
+                         max_call_dp_for_het_call=None):
+    '''It keeps the variations for which the filter expression is true.
+
+       e.g. "call_rate >= 0.8 and maf >= 0.05 and chrom != 'chrUn'"
+       The names available are call_rate, maf, mac, obs_het, chrom, pos and
+       qual, and all of them are evaluated in one pass.'''
+    selected_vars = calc_expression_mask(variations, expression,
+                                         max_alleles=max_alleles,
+                                         min_num_genotypes=min_num_genotypes,
+                                         min_call_dp_for_het_call=min_call_dp_for_het_call,
+                                         max_call_dp_for_het_call=max_call_dp_for_het_call)
+    selected_variations = variations.get_vars(selected_vars)
+
+    num_selected_vars = va.count_nonzero(selected_vars)
+    num_filtered = va.count_nonzero(va.logical_not(selected_vars))
+
+    flt_stats = {N_KEPT: num_selected_vars, N_FILTERED_OUT: num_filtered}
+
+    return {FLT_VARS: selected_variations, FLT_ID: filter_id,
+            FLT_STATS: flt_stats}
+
+
+def _calc_threshold_idxs_in_memory(stats, thresholds, is_min):
+    # the index of a stat is the number of thresholds that it passes for min
+    # thresholds, and the first threshold that it passes for max thresholds
+    if is_min:
+        idxs = np.searchsorted(thresholds, stats, side='right')
+        idxs[np.isnan(stats)] = 0
+    else:
+        idxs = np.searchsorted(thresholds, stats, side='left')
+        idxs[np.isnan(stats)] = thresholds.size
+    return idxs
+
+
+def _count_threshold_cells_in_memory(cell_idxs, num_cells):
+    return np.bincount(cell_idxs, minlength=num_cells)[None, :]
+
+
+def _count_threshold_cells(cell_idxs, num_cells):
+    if not isinstance(cell_idxs, da.Array):
+        return _count_threshold_cells_in_memory(cell_idxs, num_cells)[0]
+    counts = da.blockwise(_count_threshold_cells_in_memory, 'ij', cell_idxs,
+                          'i', num_cells=num_cells, new_axes={'j': num_cells},
+                          adjust_chunks={'i': 1}, dtype=np.int64,
+                          concatenate=True)
+    return counts.sum(axis=0)
+
+
+def _take_along_axis(array, index, axis):
+    slices = [slice(None)] * array.ndim
+    slices[axis] = index
+    return array[tuple(slices)]
+
+
+def calc_filter_sweep(variations, max_alleles, min_call_rates=None,
+                      max_obs_hets=None, min_mafs=None, max_mafs=None,
+                      max_macs=None,
+                      min_num_genotypes=MIN_NUM_GENOTYPES_FOR_POP_STAT,
+                      min_call_dp_for_het_call=None,
+                      max_call_dp_for_het_call=None):
+    '''It counts the variations that would pass every combination of the
+       given thresholds.
+
+       The per variation stats are calculated, or read if they are stored,
+       only once. Every variation is assigned to a cell of a grid with one
+       axis per threshold kind and the survivors are obtained with
+       cumulative sums of the cell counts. The result has the swept stats,
+       their sorted thresholds and the counts, with one axis per stat.'''
+    sweeps = [(CALL_RATE_STAT_FIELD, min_call_rates, True),
+              (OBS_HET_STAT_FIELD, max_obs_hets, False),
+              (MAF_STAT_FIELD, min_mafs, True),
+              (MAF_STAT_FIELD, max_mafs, False),
+              (MAC_STAT_FIELD, max_macs, False)]
+    sweeps = [(field, np.sort(np.asarray(thresholds, dtype=float)), is_min)
+              for field, thresholds, is_min in sweeps
+              if thresholds is not None]
+    if not sweeps:
+        raise ValueError('At least one threshold grid is required')
+
+    # the maf can be swept by min and max, but it is calculated only once
+    stats_by_field = {}
+    for field, _, _ in sweeps:
+        if field not in stats_by_field:
+            stats_by_field[field] = get_variant_stat(variations, field,
+                                                     max_alleles=max_alleles,
+                                                     min_num_genotypes=min_num_genotypes,
+                                                     min_call_dp_for_het_call=min_call_dp_for_het_call,
+                                                     max_call_dp_for_het_call=max_call_dp_for_het_call)
+
+    cell_idxs = 0
+    grid_shape = []
+    for field, thresholds, is_min in sweeps:
+        stats = stats_by_field[field]
+        calc_idxs = partial(_calc_threshold_idxs_in_memory,
+                            thresholds=thresholds, is_min=is_min)
+        idxs = va.map_blocks(calc_idxs, stats, dtype=np.int64)
+        cell_idxs = cell_idxs * (thresholds.size + 1) + idxs
+        grid_shape.append(thresholds.size + 1)
+
+    counts = _count_threshold_cells(cell_idxs, int(np.prod(grid_shape)))
+    counts = counts.reshape(grid_shape)
+
+    for axis, (_, thresholds, is_min) in enumerate(sweeps):
+        if is_min:
+            # a variation passes a min threshold if its index is higher
+            counts = _take_along_axis(counts, slice(None, None, -1), axis)
+            counts = _take_along_axis(counts.cumsum(axis=axis),
+                                      slice(-2, None, -1), axis)
+        else:
+            # a variation passes a max threshold if its index is not higher
+            counts = _take_along_axis(counts.cumsum(axis=axis),
+                                      slice(None, -1), axis)
+
+    return {SWEEP_STATS: [field for field, _, _ in sweeps],
+            SWEEP_THRESHOLDS: [thresholds for _, thresholds, _ in sweeps],
+            COUNT: counts}
+
+
 def _reformat_task_dict(task):
 #     task = {FLT_VARS: task[FLT_VARS], task[FLT_ID]: task[FLT_STATS]}
     task = {FLT_VARS: task[FLT_VARS], task[FLT_ID]: {FLT_STATS: task[FLT_STATS]}}
@@ -384,12 +888,23 @@ def _add_task_to_pipeline(pipeline_tasks, task):
         pipeline_tasks[FLT_STATS][task[FLT_ID]] = task[FLT_STATS]
 
 
+def _compute_pipeline_into_zarr(pipeline_tasks, variations, zarr_path):
+    pipeline_tasks[FLT_VARS] = prepare_zarr_storage(variations, zarr_path)
+    compute(pipeline_tasks, store_variation_to_memory=False,
+            silence_runtime_warnings=True)
+    return load_zarr(zarr_path)
+
+
 def filter_variations(in_path, out_path, samples_to_keep=None,
                       samples_to_remove=None, regions_to_remove=None,
                       regions_to_keep=None, min_call_rate=None,
-                      min_dp_setter=None, remove_non_variable_snvs=None,
+                      min_sample_call_rate=None,
+                      min_dp_setter=None, max_dp_setter=None,
+                      min_gq_setter=None, min_het_allele_balance=None,
+                      remove_non_variable_snvs=None,
                       max_allowable_mac=None, max_allowable_het=None,
-                      min_call_dp_for_het_call=None, verbose=True,
+                      min_call_dp_for_het_call=None, min_hwe_pvalue=None,
+                      filter_expression=None, verbose=True,
                       out_fhand=sys.stdout, calc_histogram=False):
 
     in_storage_type = utils_file.get_var_file_type(in_path)
@@ -429,8 +944,11 @@ def filter_variations(in_path, out_path, samples_to_keep=None,
         task = keep_variations_in_regions(task[FLT_VARS], regions_to_keep)
         _add_task_to_pipeline(pipeline_tasks, task)
 
-    if min_dp_setter is not None:
-        task = min_depth_gt_to_missing(task[FLT_VARS], min_depth=min_dp_setter)
+    if (min_dp_setter is not None or max_dp_setter is not None or
+            min_gq_setter is not None or min_het_allele_balance is not None):
+        task = set_calls_to_missing(task[FLT_VARS], min_dp=min_dp_setter,
+                                    max_dp=max_dp_setter, min_gq=min_gq_setter,
+                                    min_het_allele_balance=min_het_allele_balance)
         _add_task_to_pipeline(pipeline_tasks, task)
 
     if remove_non_variable_snvs:
@@ -451,7 +969,24 @@ def filter_variations(in_path, out_path, samples_to_keep=None,
                              calc_histogram=calc_histogram)
         _add_task_to_pipeline(pipeline_tasks, task)
 
-    if min_call_rate:
+    tmp_dir = None
+    if min_sample_call_rate is not None:
+        if pipeline_tasks:
+            # the joint call rate filter computes the genotypes when it is
+            # called, so the previous filters are computed only once into a
+            # temporary store instead of once for the filter and once more
+            # for the output
+            tmp_dir = TemporaryDirectory()
+            zarr_path = Path(tmp_dir.name) / 'filtered.zarr'
+            task = {FLT_VARS: _compute_pipeline_into_zarr(pipeline_tasks,
+                                                          task[FLT_VARS],
+                                                          zarr_path)}
+        task = remove_low_call_rate_vars_and_samples(task[FLT_VARS],
+                                                     min_var_call_rate=min_call_rate or 0,
+                                                     min_sample_call_rate=min_sample_call_rate,
+                                                     calc_histogram=calc_histogram)
+        _add_task_to_pipeline(pipeline_tasks, task)
+    elif min_call_rate:
         task = remove_low_call_rate_vars(task[FLT_VARS],
                                          min_call_rate=min_call_rate,
                                          calc_histogram=calc_histogram)
@@ -464,12 +999,26 @@ def filter_variations(in_path, out_path, samples_to_keep=None,
                                            calc_histogram=calc_histogram)
         _add_task_to_pipeline(pipeline_tasks, task)
 
+    if min_hwe_pvalue is not None:
+        task = filter_by_hwe(task[FLT_VARS],
+                             min_allowable_pvalue=min_hwe_pvalue,
+                             calc_histogram=calc_histogram)
+        _add_task_to_pipeline(pipeline_tasks, task)
+
+    if filter_expression is not None:
+        task = filter_by_expression(task[FLT_VARS], filter_expression,
+                                    max_alleles=max_alleles,
+                                    min_call_dp_for_het_call=min_call_dp_for_het_call)
+        _add_task_to_pipeline(pipeline_tasks, task)
+
     delayed_store = prepare_storage_function(task[FLT_VARS],
                                              out_path)
     pipeline_tasks[FLT_VARS] = delayed_store
 
     result = compute(pipeline_tasks, store_variation_to_memory=False,
                      silence_runtime_warnings=True)
+    if tmp_dir is not None:
+        tmp_dir.cleanup()
 
     if verbose:
         for filter_id, task_result in result[FLT_STATS].items():
@@ -479,7 +1028,15 @@ def filter_variations(in_path, out_path, samples_to_keep=None,
                 out_fhand.write("-" * (8 + len(filter_id)) + '\n')
                 out_fhand.write(f"Processed: {total}\n")
                 out_fhand.write(f"Kept vars: {task_result[N_KEPT]}\n")
-                out_fhand.write(f"Filtered out: {task_result[N_FILTERED_OUT]}\n\n")
+                out_fhand.write(f"Filtered out: {task_result[N_FILTERED_OUT]}\n")
+                if N_SAMPLES_KEPT in task_result:
+                    out_fhand.write(f"Kept samples: {task_result[N_SAMPLES_KEPT]}\n")
+                    out_fhand.write(f"Filtered out samples: {task_result[N_SAMPLES_FILTERED_OUT]}\n")
+                out_fhand.write('\n')
+            elif N_CALLS_SET_TO_MISSING in task_result:
+                out_fhand.write(f"Filter: {filter_id}\n")
+                out_fhand.write("-" * (8 + len(filter_id)) + '\n')
+                out_fhand.write(f"Calls set to missing: {task_result[N_CALLS_SET_TO_MISSING]}\n\n")
 
     return result
 
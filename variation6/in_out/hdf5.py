@@ -4,9 +4,12 @@ import dask.array as da
 import h5py
 from h5py._hl.group import Group
 
-from variation6 import DEF_CHUNK_SIZE
 from variation6.variations import Variations
+from variation6.utils_array import (DEF_CHUNK_MEMORY_BUDGET,
+                                    plan_num_vars_per_chunk_for_fields,
+                                    is_sample_call_field)
 from variation6.in_out.zarr import (DEF_VCF_FIELDS,
+                                    _get_chunks, _get_arrays_to_store,
                                     VARIATION_ZARR_FIELD_MAPPING,
                                     ZARR_VARIATION_FIELD_MAPPING)
 
@@ -23,7 +26,14 @@ def vcf_to_hdf5(vcf_path, h5_path, fields=None):
     allel.vcf_to_hdf5(str(vcf_path), str(h5_path), fields=zarr_fields)
 
 
-def load_hdf5(path, fields=None):
+def load_hdf5(path, fields=None, num_samples_per_chunk=None,
+              num_vars_per_chunk=None, memory_budget=DEF_CHUNK_MEMORY_BUDGET,
+              expansion_factor=1):
+    '''It loads the variations stored in a hdf5.
+
+       If num_vars_per_chunk is not given, it is chosen so that a chunk of
+       all the fields takes the memory budget divided by the expansion
+       factor, see plan_num_vars_per_chunk.'''
     if fields is None:
         fields = []
     store = h5py.File(str(path), mode='r')
@@ -32,6 +42,7 @@ def load_hdf5(path, fields=None):
     variations = Variations(samples=da.from_array(samples,
                                                   chunks=samples.shape))
     metadata = {}
+    datasets = []
     for group_name, group in (store.items()):
         if isinstance(group, Group):
             for array_name, dataset in group.items():
@@ -41,12 +52,19 @@ def load_hdf5(path, fields=None):
                     continue
                 if dataset.attrs:
                     metadata[path] = dict(dataset.attrs.items())
+                datasets.append((path, dataset))
 
-                chunks = list(dataset.shape)
-                chunks[0] = DEF_CHUNK_SIZE
-                chunks = tuple(chunks)
+    if num_vars_per_chunk is None:
+        num_vars_per_chunk = plan_num_vars_per_chunk_for_fields(datasets,
+                                                                memory_budget=memory_budget,
+                                                                num_samples_per_chunk=num_samples_per_chunk,
+                                                                expansion_factor=expansion_factor)
+    for path, dataset in datasets:
+        chunks = _get_chunks(dataset.shape, num_vars_per_chunk,
+                             num_samples_per_chunk,
+                             is_call_data=is_sample_call_field(path))
 
-                variations[path] = da.from_array(dataset, chunks=chunks)
+        variations[path] = da.from_array(dataset, chunks=chunks)
 
     variations.metadata = metadata
     return variations
@@ -69,7 +87,7 @@ def _create_hdf5_dataset(h5, path, dask_array, field_metadata=None,
     return dataset
 
 
-def prepare_hdf5_storage(variations, out_path):
+def prepare_hdf5_storage(variations, out_path, pack_gts=False):
     store = h5py.File(str(out_path), mode='w')
 
     sources = []
@@ -77,13 +95,17 @@ def prepare_hdf5_storage(variations, out_path):
     metadata = variations.metadata
     # samples
     samples_array = variations.samples
+    # the filters that select samples leave them in memory
+    if not isinstance(samples_array, da.Array):
+        samples_array = da.from_array(samples_array,
+                                      chunks=samples_array.shape)
     #samples_array.compute_chunk_sizes()
 
     sources.append(samples_array)
     dataset = _create_hdf5_dataset(store, '/samples', samples_array)
     targets.append(dataset)
 
-    for path, array in variations.items():
+    for path, array in _get_arrays_to_store(variations, pack_gts).items():
         field_metadata = metadata.get(path, None)
         array.compute_chunk_sizes()
         sources.append(array)
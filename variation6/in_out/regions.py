@@ -0,0 +1,48 @@
+BED_COMMENT_PREFIXES = ('#', 'track', 'browser')
+
+
+def read_bed_regions(fhand):
+    '''It reads the intervals of a BED file as (chrom, start, end, name).
+
+       BED intervals are 0-based and half open, they are converted to the
+       1-based VCF positions keeping the end excluded.'''
+    regions = []
+    for line in fhand:
+        if isinstance(line, bytes):
+            line = line.decode()
+        line = line.strip()
+        if not line or line.startswith(BED_COMMENT_PREFIXES):
+            continue
+        items = line.split('\t')
+        name = items[3] if len(items) > 3 else None
+        regions.append((items[0], int(items[1]) + 1, int(items[2]) + 1, name))
+    return regions
+
+
+def _get_gff_name(attributes):
+    for attribute in attributes.split(';'):
+        key, _, value = attribute.strip().partition('=')
+        if key in ('ID', 'Name'):
+            return value
+    return None
+
+
+def read_gff_regions(fhand, feature_types=('gene',)):
+    '''It reads the intervals of the given feature types of a GFF3 file as
+       (chrom, start, end, name). The GFF closed intervals are converted to
+       end excluded ones.'''
+    regions = []
+    for line in fhand:
+        if isinstance(line, bytes):
+            line = line.decode()
+        line = line.strip()
+        if line.startswith('##FASTA'):
+            break
+        if not line or line.startswith('#'):
+            continue
+        items = line.split('\t')
+        if feature_types is not None and items[2] not in feature_types:
+            continue
+        name = _get_gff_name(items[8]) if len(items) > 8 else None
+        regions.append((items[0], int(items[3]), int(items[4]) + 1, name))
+    return regions
@@ -6,10 +6,11 @@ from collections import OrderedDict
 import numpy as np
 
 from variation6.in_out.zarr import load_zarr
-from variation6 import (GT_FIELD, CHROM_FIELD, POS_FIELD, ID_FIELD, REF_FIELD,
-                        ALT_FIELD, QUAL_FIELD, MISSING_INT, MISSING_STR,
-                        MISSING_FLOAT, DEF_CHUNK_SIZE)
-from variation6.compute import compute
+from variation6 import (GT_FIELD, GT_PACKED_FIELD, CHROM_FIELD, POS_FIELD,
+                        ID_FIELD, REF_FIELD, ALT_FIELD, QUAL_FIELD, MISSING_INT, MISSING_STR,
+                        MISSING_FLOAT, DEF_CHUNK_SIZE,
+                        PUBLIC_VARIANT_STATS_GROUP, DEF_NUM_PREFETCHED_CHUNKS,
+                        DEF_NUM_PREFETCH_WORKERS)
 
 VCF_FORMAT = 'VCFv4.2'
 
@@ -33,12 +34,15 @@ _CACHE_WITH_SEP_MATRICES = {}
 
 
 def zarr_to_vcf(zarr_path, out_fhand, vcf_format=VCF_FORMAT,
-                chunk_size=DEF_CHUNK_SIZE):
+                chunk_size=DEF_CHUNK_SIZE, prefetch=DEF_NUM_PREFETCHED_CHUNKS,
+                workers=DEF_NUM_PREFETCH_WORKERS):
     variations = load_zarr(zarr_path)
     _write_vcf_meta(variations, out_fhand, vcf_format)
     _write_vcf_header(variations, out_fhand)
-    for chunk in variations.iterate_chunks(chunk_size=chunk_size):
-        in_mem_chunk = compute({'vars': chunk}, store_variation_to_memory=True)['vars']
+    # the next chunks are read while the current one is written
+    for in_mem_chunk in variations.iterate_computed_chunks(chunk_size=chunk_size,
+                                                           prefetch=prefetch,
+                                                           workers=workers):
         _write_snvs(in_mem_chunk, out_fhand)
 
 
@@ -76,7 +80,9 @@ def _write_vcf_meta(variations, out_fhand, vcf_format):
             out_fhand.write(line.encode())
 
     for field, value in sorted(metadata.items()):
-        if isinstance(value, dict) and field in variations:
+        # the stored variant stats are not VCF fields
+        if (isinstance(value, dict) and field in variations and
+                not field.startswith(PUBLIC_VARIANT_STATS_GROUP)):
             group, id_ = _parse_group_id(field)
             line = _write_header_line(id_, value, group=group)
             out_fhand.write(line.encode())
@@ -212,10 +218,12 @@ def _info_arrays_to_str_array(variations):
 def _get_group_variations_paths(variations):
     grouped_paths = {'filter': [], 'info': [], 'format': [], 'calls': []}
 
-    if GT_FIELD in variations.keys():
+    if GT_FIELD in variations:
         grouped_paths['format'] = ['GT']
         grouped_paths['calls'] = [GT_FIELD]
     for key in sorted(variations.keys()):
+        if key == GT_PACKED_FIELD:
+            continue
         if 'calldata' in key:
             if 'GT' not in key:
                 grouped_paths['format'].append(key.split('/')[-1].upper())
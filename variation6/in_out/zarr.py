@@ -8,8 +8,14 @@ from dask.utils import SerializableLock
 
 from variation6 import (CHROM_FIELD, POS_FIELD, ID_FIELD, REF_FIELD, ALT_FIELD,
                         QUAL_FIELD, GT_FIELD, GQ_FIELD, DP_FIELD, AO_FIELD,
-                        RO_FIELD, AD_FIELD, DEFAULT_VARIATION_NUM_IN_CHUNK)
+                        RO_FIELD, AD_FIELD, GT_PACKED_FIELD, MAF_STAT_FIELD,
+                        MAC_STAT_FIELD, CALL_RATE_STAT_FIELD,
+                        OBS_HET_STAT_FIELD, VARIANT_STAT_FIELDS)
 from variation6.variations import Variations
+from variation6.utils_array import (plan_num_vars_per_chunk_for_fields,
+                                    is_sample_call_field,
+                                    DEF_CHUNK_MEMORY_BUDGET)
+import variation6.array as va
 
 ZARR_CHROM_FIELD_NAME = 'CHROM'
 ZARR_POS_FIELD_NAME = 'POS'
@@ -23,9 +29,15 @@ ZARR_DP_FIELD_NAME = 'DP'
 ZARR_AO_FIELD_NAME = 'AO'
 ZARR_RO_FIELD_NAME = 'RO'
 ZARR_AD_FIELD_NAME = 'AD'
+ZARR_GT_PACKED_FIELD_NAME = 'GT_PACKED'
+ZARR_MAF_STAT_FIELD_NAME = 'MAF'
+ZARR_MAC_STAT_FIELD_NAME = 'MAC'
+ZARR_CALL_RATE_STAT_FIELD_NAME = 'CALL_RATE'
+ZARR_OBS_HET_STAT_FIELD_NAME = 'OBS_HET'
 
 ZARR_VARIANTS_GROUP_NAME = 'variants'
 ZARR_CALL_GROUP_NAME = 'calldata'
+ZARR_VARIANT_STATS_GROUP_NAME = 'variant_stats'
 
 ALLELE_ZARR_DEFINITION_MAPPINGS = {
     CHROM_FIELD: {'group': ZARR_VARIANTS_GROUP_NAME, 'field': ZARR_CHROM_FIELD_NAME},
@@ -39,7 +51,12 @@ ALLELE_ZARR_DEFINITION_MAPPINGS = {
     DP_FIELD: {'group': ZARR_CALL_GROUP_NAME, 'field': ZARR_DP_FIELD_NAME},
     AO_FIELD: {'group': ZARR_CALL_GROUP_NAME, 'field': ZARR_AO_FIELD_NAME},
     RO_FIELD: {'group': ZARR_CALL_GROUP_NAME, 'field': ZARR_RO_FIELD_NAME},
-    AD_FIELD: {'group': ZARR_CALL_GROUP_NAME, 'field': ZARR_AD_FIELD_NAME}
+    AD_FIELD: {'group': ZARR_CALL_GROUP_NAME, 'field': ZARR_AD_FIELD_NAME},
+    GT_PACKED_FIELD: {'group': ZARR_CALL_GROUP_NAME, 'field': ZARR_GT_PACKED_FIELD_NAME},
+    MAF_STAT_FIELD: {'group': ZARR_VARIANT_STATS_GROUP_NAME, 'field': ZARR_MAF_STAT_FIELD_NAME},
+    MAC_STAT_FIELD: {'group': ZARR_VARIANT_STATS_GROUP_NAME, 'field': ZARR_MAC_STAT_FIELD_NAME},
+    CALL_RATE_STAT_FIELD: {'group': ZARR_VARIANT_STATS_GROUP_NAME, 'field': ZARR_CALL_RATE_STAT_FIELD_NAME},
+    OBS_HET_STAT_FIELD: {'group': ZARR_VARIANT_STATS_GROUP_NAME, 'field': ZARR_OBS_HET_STAT_FIELD_NAME}
 }
 
 VARIATION_ZARR_FIELD_MAPPING = {
@@ -47,7 +64,9 @@ VARIATION_ZARR_FIELD_MAPPING = {
 ZARR_VARIATION_FIELD_MAPPING = {value: key for key,
                                 value in VARIATION_ZARR_FIELD_MAPPING.items()}
 
-DEF_VCF_FIELDS = list(VARIATION_ZARR_FIELD_MAPPING.keys())
+DEF_VCF_FIELDS = [field for field in VARIATION_ZARR_FIELD_MAPPING
+                  if field != GT_PACKED_FIELD and
+                  field not in VARIANT_STAT_FIELDS]
 
 
 def vcf_to_zarr(vcf_path, zarr_path, fields=None):
@@ -62,10 +81,26 @@ def vcf_to_zarr(vcf_path, zarr_path, fields=None):
     allel.vcf_to_zarr(str(vcf_path), str(zarr_path), fields=zarr_fields)
 
 
-def load_zarr(path, num_vars_per_chunk=DEFAULT_VARIATION_NUM_IN_CHUNK):
+def _get_chunks(array_shape, num_vars_per_chunk, num_samples_per_chunk,
+                is_call_data):
+    chunks = [num_vars_per_chunk] + list(array_shape[1:])
+    if is_call_data and num_samples_per_chunk is not None and len(chunks) > 1:
+        chunks[1] = num_samples_per_chunk
+    return tuple(chunks)
+
+
+def load_zarr(path, num_vars_per_chunk=None, num_samples_per_chunk=None,
+              fields=None, memory_budget=DEF_CHUNK_MEMORY_BUDGET,
+              expansion_factor=1):
+    '''It loads the variations stored in a zarr.
+
+       If num_vars_per_chunk is not given, it is chosen so that a chunk of
+       all the fields takes the memory budget divided by the expansion
+       factor, see plan_num_vars_per_chunk.'''
     z_object = zarr.open_group(str(path), mode='r')
     variations = Variations(samples=da.from_zarr(z_object.samples))
     metadata = {}
+    arrays = []
     for group_name, group in (z_object.groups()):
         for array_name, array in group.arrays():
             zarr_field = f'{group_name}/{array_name}'
@@ -73,18 +108,36 @@ def load_zarr(path, num_vars_per_chunk=DEFAULT_VARIATION_NUM_IN_CHUNK):
                 field = ZARR_VARIATION_FIELD_MAPPING[zarr_field]
             except KeyError:
                 continue
+            if fields and field not in fields:
+                continue
             if array.attrs:
                 metadata[field] = dict(array.attrs.items())
-
-            chunks = (num_vars_per_chunk,) + array.shape[1:]
-            # chunks = None
-            variations[field] = da.from_zarr(array, chunks=chunks)
+            arrays.append((field, array))
+
+    if num_vars_per_chunk is None:
+        num_vars_per_chunk = plan_num_vars_per_chunk_for_fields(arrays,
+                                                                memory_budget=memory_budget,
+                                                                num_samples_per_chunk=num_samples_per_chunk,
+                                                                expansion_factor=expansion_factor)
+    for field, array in arrays:
+        # the packed genotypes are never split by sample
+        chunks = _get_chunks(array.shape, num_vars_per_chunk,
+                             num_samples_per_chunk,
+                             is_call_data=is_sample_call_field(field))
+        variations[field] = da.from_zarr(array, chunks=chunks)
     variations.metadata = metadata
 
     return variations
 
 
-def prepare_zarr_storage(variations, out_path):
+def _get_arrays_to_store(variations, pack_gts):
+    arrays = dict(variations.items())
+    if pack_gts and GT_FIELD in arrays:
+        arrays[GT_PACKED_FIELD] = va.pack_gts(arrays.pop(GT_FIELD))
+    return arrays
+
+
+def prepare_zarr_storage(variations, out_path, pack_gts=False):
     store = zarr.DirectoryStore(str(out_path))
     root = zarr.group(store=store, overwrite=True)
     metadata = variations.metadata
@@ -92,6 +145,10 @@ def prepare_zarr_storage(variations, out_path):
     targets = []
 
     samples_array = variations.samples
+    # the filters that select samples leave them in memory
+    if not isinstance(samples_array, da.Array):
+        samples_array = da.from_array(samples_array,
+                                      chunks=samples_array.shape)
     #samples_array.compute_chunk_sizes()
     sources.append(samples_array)
 
@@ -103,20 +160,22 @@ def prepare_zarr_storage(variations, out_path):
                           dtype=samples_array.dtype, object_codec=object_codec)
     targets.append(dataset)
 
-    variants = root.create_group(ZARR_VARIANTS_GROUP_NAME, overwrite=True)
-    calls = root.create_group(ZARR_CALL_GROUP_NAME, overwrite=True)
-    for field, array in variations.items():
+    groups = {group_name: root.create_group(group_name, overwrite=True)
+              for group_name in (ZARR_VARIANTS_GROUP_NAME,
+                                 ZARR_CALL_GROUP_NAME)}
+    for field, array in _get_arrays_to_store(variations, pack_gts).items():
         definition = ALLELE_ZARR_DEFINITION_MAPPINGS[field]
 
         field_metadata = metadata.get(field, None)
-        array = variations[field]
         if array is None:
             continue
         array.compute_chunk_sizes()
         sources.append(array)
 
         group_name = definition['group']
-        group = calls if group_name == ZARR_CALL_GROUP_NAME else variants
+        if group_name not in groups:
+            groups[group_name] = root.create_group(group_name, overwrite=True)
+        group = groups[group_name]
         path = os.path.sep + os.path.join(group.path, definition['field'])
 
         object_codec = None
@@ -1,20 +1,44 @@
-import math
 from itertools import combinations
 from collections import OrderedDict
 
 import numpy as np
+import dask.array as da
 import variation6.array as va
 
-from variation6 import GT_FIELD, FLT_VARS, MIN_NUM_GENOTYPES_FOR_POP_STAT
+from variation6 import (GT_FIELD, GT_PACKED_FIELD, FLT_VARS, AD_FIELD,
+                        MISSING_INT, MIN_NUM_GENOTYPES_FOR_POP_STAT)
 from variation6.filters import keep_samples
-from variation6.stats.diversity import (calc_missing_gt, calc_allele_freq,
-                                        calc_allele_freq_by_depth,
-                                        _calc_obs_het_counts)
+from variation6.stats.diversity import (calc_missing_gt,
+                                        count_alleles_by_population,
+                                        calc_obs_het_counts_by_population,
+                                        get_population_labels,
+                                        sum_by_population)
 from variation6.compute import compute
 
 
+def _calc_kosman_dist_packed(variations, min_num_snps=None,
+                             silence_runtime_warning=False):
+    samples = va.make_sure_array_is_in_memory(variations.samples,
+        silence_runtime_warnings=silence_runtime_warning)
+    sums = va.calc_kosman_sums_packed(variations[GT_PACKED_FIELD],
+                                      variations.num_samples)
+    sums = va.make_sure_array_is_in_memory(sums,
+        silence_runtime_warnings=silence_runtime_warning)
+    dist_sums, n_snps = sums[:, 0], sums[:, 1]
+
+    with np.errstate(invalid='ignore'):
+        distances = dist_sums / n_snps
+    if min_num_snps is not None:
+        distances[n_snps < min_num_snps] = 0.0
+    return list(distances), samples
+
+
 def calc_kosman_dist(variations, min_num_snps=None,
                      silence_runtime_warning=False):
+    if variations.has_packed_gts:
+        return _calc_kosman_dist_packed(variations, min_num_snps=min_num_snps,
+                                        silence_runtime_warning=silence_runtime_warning)
+
     variations_by_sample = OrderedDict()
 
     samples = va.make_sure_array_is_in_memory(variations.samples,
@@ -92,173 +116,207 @@ def _kosman(vars1, vars2):
     return result
 
 
-def calc_pop_pairwise_unbiased_nei_dists(variations, max_alleles, populations,
-                                         silence_runtime_warnings=False,
-                                         min_num_genotypes=MIN_NUM_GENOTYPES_FOR_POP_STAT):
-    pop_ids = list(range(len(populations)))
-    variations_per_pop = [keep_samples(variations, pop_samples)[FLT_VARS]
-                          for pop_samples in populations]
-
-    Jxy = {}
-    uJx = {}
-    uJy = {}
-    for pop_id1, pop_id2 in combinations(pop_ids, 2):
-        if pop_id1 not in Jxy:
-            Jxy[pop_id1] = {}
-        if pop_id1 not in uJx:
-            uJx[pop_id1] = {}
-        if pop_id1 not in uJy:
-            uJy[pop_id1] = {}
-
-        Jxy[pop_id1][pop_id2] = None
-        uJx[pop_id1][pop_id2] = None
-        uJy[pop_id1][pop_id2] = None
-
-    for pop_id1, pop_id2 in combinations(pop_ids, 2):
-        vars_for_pop1 = variations_per_pop[pop_id1]
-        vars_for_pop2 = variations_per_pop[pop_id2]
-        _accumulate_j_stats(vars_for_pop1, vars_for_pop2, max_alleles,
-                            Jxy, uJx, uJy, pop_id1, pop_id2,
-                            min_num_genotypes=min_num_genotypes)
-    computed_result = compute({'Jxy': Jxy, 'uJx':uJx, 'uJy':uJy},
-                              silence_runtime_warnings=silence_runtime_warnings)
-
-    computedJxy = computed_result['Jxy']
-    computeduJx = computed_result['uJx']
-    computeduJy = computed_result['uJy']
-
-    n_pops = len(populations)
-    dists = np.empty(int((n_pops ** 2 - n_pops) / 2))
-    dists[:] = np.nan
-    for idx, (pop_id1, pop_id2) in enumerate(combinations(pop_ids, 2)):
-        if Jxy[pop_id1][pop_id2] is None:
-            unbiased_nei_identity = math.nan
-        else:
-            with np.errstate(invalid='ignore'):
-                unbiased_nei_identity = computedJxy[pop_id1][pop_id2] / math.sqrt(computeduJx[pop_id1][pop_id2] * computeduJy[pop_id1][pop_id2])
-        nei_unbiased_distance = -math.log(unbiased_nei_identity)
-        if nei_unbiased_distance < 0:
-            nei_unbiased_distance = 0
-        dists[idx] = nei_unbiased_distance
-    return dists
+def _get_pop_pairs(num_pops):
+    pairs = list(combinations(range(num_pops), 2))
+    pops1 = np.array([pop1 for pop1, _ in pairs], dtype=int)
+    pops2 = np.array([pop2 for _, pop2 in pairs], dtype=int)
+    return pops1, pops2
 
 
-def _accumulate_j_stats(variations1, variations2, max_alleles,
-                        Jxy, uJx, uJy, pop_name1,
-                        pop_name2, min_num_genotypes=None):
-    res = _calc_j_stats_per_locus(variations1, variations2, max_alleles,
-                                  min_num_genotypes=min_num_genotypes)
-    xUb_per_locus, yUb_per_locus, Jxy_per_locus = res
-    # print('per locus')
-    # print(xUb_per_locus, yUb_per_locus, Jxy_per_locus)
+def _calc_allele_freqs_by_population_in_memory(allele_counts, ploidy,
+                                               min_num_genotypes):
+    num_alleles = np.sum(allele_counts, axis=2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        allele_freqs = allele_counts / num_alleles[:, :, None]
+    if min_num_genotypes is not None:
+        allele_freqs[num_alleles / ploidy < min_num_genotypes] = np.nan
+    return allele_freqs
+
+
+def _calc_allele_freqs_by_population(variations, populations, max_alleles,
+                                     min_num_genotypes):
+    allele_counts = count_alleles_by_population(variations, populations,
+                                                max_alleles,
+                                                count_missing=False)
+    ploidy = variations.ploidy
+
+    def _calc_allele_freqs(allele_counts):
+        return _calc_allele_freqs_by_population_in_memory(allele_counts,
+                                                          ploidy,
+                                                          min_num_genotypes)
+
+    return va.map_blocks(_calc_allele_freqs, allele_counts, dtype=np.float64)
+
+
+def calc_unbiased_nei_components(variations, max_alleles, populations,
+                                 min_num_genotypes=MIN_NUM_GENOTYPES_FOR_POP_STAT):
+    '''It calculates, per variation, the Jxy of every pair of populations
+       and the unbiased Jx of every population.
+
+       The sums of these components along the variations are the sufficient
+       statistics of the unbiased Nei distance.'''
+    allele_freqs = _calc_allele_freqs_by_population(variations, populations,
+                                                    max_alleles,
+                                                    min_num_genotypes)
+    pops1, pops2 = _get_pop_pairs(len(populations))
+    pop_sizes = np.array([len(pop_samples) for pop_samples in populations])
+
+    unbiased_js = (((2 * pop_sizes * va.sum(allele_freqs ** 2, axis=2)) - 1) /
+                   (2 * pop_sizes - 1))
+    jxys = va.sum(allele_freqs[:, pops1] * allele_freqs[:, pops2], axis=2)
+    return {'jxy': jxys, 'unbiased_j': unbiased_js}
+
+
+def calc_unbiased_nei_dists_from_sums(sums):
+    '''It calculates the unbiased Nei distances from the sums of its
+       components, the leading axes of the sums, if any, are kept'''
+    unbiased_js = sums['unbiased_j']
+    pops1, pops2 = _get_pop_pairs(unbiased_js.shape[-1])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        unbiased_nei_identities = sums['jxy'] / np.sqrt(unbiased_js[..., pops1] *
+                                                        unbiased_js[..., pops2])
+        dists = -np.log(unbiased_nei_identities)
+    dists[dists < 0] = 0
+    return dists
 
-    if xUb_per_locus is None:
-        return
 
+def _sum_components(components, silence_runtime_warnings):
     # sum over all loci
-    if Jxy[pop_name1][pop_name2] is None:
-        Jxy[pop_name1][pop_name2] = va.nansum(Jxy_per_locus)
-        uJx[pop_name1][pop_name2] = va.nansum(xUb_per_locus)
-        uJy[pop_name1][pop_name2] = va.nansum(yUb_per_locus)
-    else:
-        Jxy[pop_name1][pop_name2] += va.nansum(Jxy_per_locus)
-        uJx[pop_name1][pop_name2] += va.nansum(xUb_per_locus)
-        uJy[pop_name1][pop_name2] += va.nansum(yUb_per_locus)
+    sums = {name: va.nansum(values, axis=0)
+            for name, values in components.items()}
+    return compute(sums, silence_runtime_warnings=silence_runtime_warnings)
 
 
-def _calc_j_stats_per_locus(variations1, variations2, max_alleles,
-                            min_num_genotypes=MIN_NUM_GENOTYPES_FOR_POP_STAT):
-    res = _calc_allele_freq_and_unbiased_J_per_locus(variations1,
-                                                     max_alleles=max_alleles,
-                                                     min_num_genotypes=min_num_genotypes)
-    allele_freq1, xUb_per_locus = res
+def calc_pop_pairwise_unbiased_nei_dists(variations, max_alleles, populations,
+                                         silence_runtime_warnings=False,
+                                         min_num_genotypes=MIN_NUM_GENOTYPES_FOR_POP_STAT):
+    components = calc_unbiased_nei_components(variations, max_alleles,
+                                              populations,
+                                              min_num_genotypes=min_num_genotypes)
+    sums = _sum_components(components, silence_runtime_warnings)
+    return calc_unbiased_nei_dists_from_sums(sums)
+
+
+def _remove_missing_depths(allele_depths):
+    return np.where(allele_depths == MISSING_INT, 0, allele_depths)
+
+
+def calc_nei_by_depth_components(variations, populations):
+    '''It calculates, per variation, the Jxy of every pair of populations
+       and the Jx of every population using the allele depths'''
+    allele_depths = va.map_blocks(_remove_missing_depths,
+                                  variations[AD_FIELD],
+                                  dtype=variations[AD_FIELD].dtype)
+    allele_depths = sum_by_population(allele_depths,
+                                      get_population_labels(variations,
+                                                            populations),
+                                      len(populations))
+    allele_freqs = allele_depths / va.sum(allele_depths, axis=2)[:, :, None]
+    pops1, pops2 = _get_pop_pairs(len(populations))
+
+    # The real Jxy is usually divided by num_snps, but it does not
+    # not matter for the calculation
+    return {'jxy': va.nansum(allele_freqs[:, pops1] * allele_freqs[:, pops2],
+                             axis=2),
+            'jxx': va.nansum(allele_freqs ** 2, axis=2)}
+
+
+def calc_nei_by_depth_dists_from_sums(sums):
+    '''It calculates the Nei distances by depth from the sums of its
+       components, the leading axes of the sums, if any, are kept'''
+    jxxs = sums['jxx']
+    pops1, pops2 = _get_pop_pairs(jxxs.shape[-1])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dists = -np.log(sums['jxy'] / np.sqrt(jxxs[..., pops1] *
+                                              jxxs[..., pops2]))
+    dists[dists == 0] = 0
+    return dists
 
-    res = _calc_allele_freq_and_unbiased_J_per_locus(variations2,
-                                                     max_alleles=max_alleles,
-                                                     min_num_genotypes=min_num_genotypes)
-    allele_freq2, yUb_per_locus = res
 
-    if allele_freq2 is None or allele_freq1 is None:
-        return None, None, None
+def calc_pop_pairwise_nei_dists_by_depth(variations, populations,
+                                         silence_runtime_warnings=False):
+    components = calc_nei_by_depth_components(variations, populations)
+    sums = _sum_components(components, silence_runtime_warnings)
+    return calc_nei_by_depth_dists_from_sums(sums)
 
-    Jxy_per_locus = va.sum(allele_freq1 * allele_freq2, axis=1)
 
-    return xUb_per_locus, yUb_per_locus, Jxy_per_locus
+def _calc_pairwise_dest_in_memory(allele_freqs, het_counts, ploidy, pops1,
+                                  pops2, min_num_genotypes):
+    num_pops = 2
+    allele_freqs1 = allele_freqs[:, pops1]
+    allele_freqs2 = allele_freqs[:, pops2]
 
+    exp_het1 = 1 - np.sum(allele_freqs1 ** ploidy, axis=2)
+    exp_het2 = 1 - np.sum(allele_freqs2 ** ploidy, axis=2)
+    hs_per_var = (exp_het1 + exp_het2) / 2
 
-def _calc_allele_freq_and_unbiased_J_per_locus(variations, max_alleles,
-                                               min_num_genotypes):
-    try:
-        allele_freq = calc_allele_freq(variations, max_alleles=max_alleles,
-                                       min_num_genotypes=min_num_genotypes)
-    except ValueError:
-        allele_freq = None
-        xUb_per_locus = None
+    global_allele_freq = (allele_freqs1 + allele_freqs2) / 2
+    ht_per_var = 1 - np.sum(global_allele_freq ** ploidy, axis=2)
 
-    if allele_freq is not None:
-        n_indi = variations[GT_FIELD].shape[1]
-        xUb_per_locus = ((2 * n_indi * va.sum(allele_freq ** 2, axis=1)) - 1) / (2 * n_indi - 1)
+    called_gts = het_counts[:, :, 1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        obs_het = het_counts[:, :, 0] / called_gts
+    called_gts1, called_gts2 = called_gts[:, pops1], called_gts[:, pops2]
+    called_gts_hmean = hmean(np.stack([called_gts1, called_gts2]), axis=0)
 
-    return allele_freq, xUb_per_locus
+    obs_het = np.stack([obs_het[:, pops1], obs_het[:, pops2]])
+    mean_obs_het_per_var = np.full(obs_het.shape[1:], np.nan)
+    is_called = np.any(~np.isnan(obs_het), axis=0)
+    mean_obs_het_per_var[is_called] = np.nanmean(obs_het[:, is_called], axis=0)
 
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corrected_hs = (called_gts_hmean / (called_gts_hmean - 1)) * (hs_per_var - (mean_obs_het_per_var / (2 * called_gts_hmean)))
+        corrected_ht = ht_per_var + (corrected_hs / (called_gts_hmean * num_pops)) - (mean_obs_het_per_var / (2 * called_gts_hmean * num_pops))
 
-def calc_pop_pairwise_nei_dists_by_depth(variations, populations,
-                                         silence_runtime_warnings=False):
+    not_enough_gts = np.logical_or(called_gts1 < min_num_genotypes,
+                                   called_gts2 < min_num_genotypes)
+    corrected_hs[not_enough_gts] = np.nan
+    corrected_ht[not_enough_gts] = np.nan
+    return np.stack([corrected_hs, corrected_ht], axis=1)
+
+
+def calc_dest_components(variations, max_alleles, populations,
+                         min_num_genotypes=MIN_NUM_GENOTYPES_FOR_POP_STAT,
+                         min_call_dp_for_het=0):
+    '''It calculates, per variation and pair of populations, the corrected
+       Hs and Ht and whether the variation has been used'''
+    ploidy = variations.ploidy
+    allele_freqs = _calc_allele_freqs_by_population(variations, populations,
+                                                    max_alleles,
+                                                    min_num_genotypes=0)
+    het_counts = calc_obs_het_counts_by_population(variations, populations,
+                                                   min_call_dp_for_het_call=min_call_dp_for_het)
+    pops1, pops2 = _get_pop_pairs(len(populations))
+
+    def _calc_pairwise_dest(allele_freqs, het_counts):
+        return _calc_pairwise_dest_in_memory(allele_freqs, het_counts, ploidy,
+                                             pops1, pops2, min_num_genotypes)
+
+    if isinstance(allele_freqs, da.Array):
+        allele_freqs = allele_freqs.rechunk({1: -1, 2: -1})
+        het_counts = het_counts.rechunk({0: allele_freqs.chunks[0],
+                                         1: -1, 2: -1})
+        corrected_h = da.map_blocks(_calc_pairwise_dest, allele_freqs,
+                                    het_counts, dtype=np.float64,
+                                    meta=np.array((), dtype=np.float64),
+                                    chunks=(allele_freqs.chunks[0], (2,),
+                                            (pops1.size,)))
+    else:
+        corrected_h = _calc_pairwise_dest(allele_freqs, het_counts)
+
+    corrected_hs = corrected_h[:, 0]
+    return {'hs': corrected_hs, 'ht': corrected_h[:, 1],
+            'num_vars': va.logical_not(va.isnan(corrected_hs))}
 
-    variations_per_pop = [keep_samples(variations, pop_samples)[FLT_VARS]
-                          for pop_samples in populations]
-
-    jxy = {}
-    jxx = {}
-    jyy = {}
-    for pop_i, pop_j in combinations(range(len(populations)), 2):
-        pop_i_vars = variations_per_pop[pop_i]
-        pop_j_vars = variations_per_pop[pop_j]
-
-        freq_al_i = calc_allele_freq_by_depth(pop_i_vars)
-        freq_al_j = calc_allele_freq_by_depth(pop_j_vars)
-
-        chunk_jxy = va.nansum(freq_al_i * freq_al_j)
-        chunk_jxx = va.nansum(freq_al_i ** 2)
-        chunk_jyy = va.nansum(freq_al_j ** 2)
-
-        pop_idx = pop_i, pop_j
-        if pop_idx not in jxy:
-            jxy[pop_idx] = 0
-            jxx[pop_idx] = 0
-            jyy[pop_idx] = 0
-
-        # The real Jxy is usually divided by num_snps, but it does not
-        # not matter for the calculation
-        jxy[pop_idx] += chunk_jxy
-        jxx[pop_idx] += chunk_jxx
-        jyy[pop_idx] += chunk_jyy
-
-    computed_result = compute({'jxy': jxy, 'jxx':jxx, 'uJy':jyy},
-                              silence_runtime_warnings=silence_runtime_warnings)
-
-    computedjxy = computed_result['jxy']
-    computedjxx = computed_result['jxx']
-    computedjyy = computed_result['jyy']
-
-    n_pops = len(populations)
-    dists = np.zeros(int((n_pops ** 2 - n_pops) / 2))
-    index = 0
-    for pop_idx in combinations(range(len(populations)), 2):
-        pjxy = computedjxy[pop_idx]
-        pjxx = computedjxx[pop_idx]
-        pjyy = computedjyy[pop_idx]
-
-        try:
-            nei = math.log(pjxy / math.sqrt(pjxx * pjyy))
-            if nei != 0:
-                nei = -nei
-        except ValueError:
-            nei = float('inf')
-
-        dists[index] = nei
-        index += 1
 
+def calc_dest_dists_from_sums(sums):
+    '''It calculates the Dest distances from the sums of its components,
+       the leading axes of the sums, if any, are kept'''
+    num_pops = 2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corrected_hs = sums['hs'] / sums['num_vars']
+        corrected_ht = sums['ht'] / sums['num_vars']
+        dists = (num_pops / (num_pops - 1)) * ((corrected_ht - corrected_hs) / (1 - corrected_hs))
     return dists
 
 
@@ -266,119 +324,11 @@ def calc_dset_pop_distance(variations, max_alleles, populations,
                            min_num_genotypes=MIN_NUM_GENOTYPES_FOR_POP_STAT,
                            min_call_dp_for_het=0, silence_runtime_warnings=False):
     '''This is an implementation of the formulas proposed in GenAlex'''
-    pop_ids = list(range(len(populations)))
-    variations_per_pop = [keep_samples(variations, pop_samples)[FLT_VARS]
-                          for pop_samples in populations]
-
-    accumulated_dists = {}
-    accumulated_hs = {}
-    accumulated_ht = {}
-    num_vars = {}
-
-    for pop_id1, pop_id2 in combinations(pop_ids, 2):
-        vars_for_pop1 = variations_per_pop[pop_id1]
-        vars_for_pop2 = variations_per_pop[pop_id2]
-
-        res = _calc_pairwise_dest(vars_for_pop1, vars_for_pop2,
-                                  max_alleles=max_alleles,
-                                  min_call_dp_for_het=min_call_dp_for_het,
-                                  min_num_genotypes=min_num_genotypes)
-
-        res['corrected_hs']
-        res['corrected_ht']
-        num_vars_in_chunk = va.count_nonzero(~va.isnan(res['corrected_hs']))
-
-        hs_in_chunk = va.nansum(res['corrected_hs'])
-        ht_in_chunk = va.nansum(res['corrected_ht'])
-
-        key = (pop_id1, pop_id2)
-        if key in accumulated_dists:
-            accumulated_hs[key] += hs_in_chunk
-            accumulated_ht[key] += ht_in_chunk
-            num_vars[key] += num_vars_in_chunk
-        else:
-            accumulated_hs[key] = hs_in_chunk
-            accumulated_ht[key] = ht_in_chunk
-            num_vars[key] = num_vars_in_chunk
-
-    task = {'accumulated_hs': accumulated_hs,
-            'accumulated_ht':accumulated_ht,
-            'num_vars': num_vars}
-
-    result = compute(task, silence_runtime_warnings=silence_runtime_warnings)
-    computed_accumulated_hs = result['accumulated_hs']
-    computed_accumulated_ht = result['accumulated_ht']
-    computed_num_vars = result['num_vars']
-
-    tot_n_pops = len(populations)
-    dists = np.empty(int((tot_n_pops ** 2 - tot_n_pops) / 2))
-    dists[:] = np.nan
-    num_pops = 2
-    for idx, (pop_id1, pop_id2) in enumerate(combinations(pop_ids, 2)):
-        key = pop_id1, pop_id2
-        if key in accumulated_hs:
-            with np.errstate(invalid='ignore'):
-                corrected_hs = computed_accumulated_hs[key] / computed_num_vars[key]
-                corrected_ht = computed_accumulated_ht[key] / computed_num_vars[key]
-            dest = (num_pops / (num_pops - 1)) * ((corrected_ht - corrected_hs) / (1 - corrected_hs))
-        else:
-            dest = np.nan
-        dists[idx] = dest
-    return dists
-
-
-def _calc_pairwise_dest(vars_for_pop1, vars_for_pop2, max_alleles,
-                        min_call_dp_for_het, min_num_genotypes):
-    num_pops = 2
-    ploidy = vars_for_pop1.ploidy
-
-    allele_freq1 = calc_allele_freq(vars_for_pop1, max_alleles=max_alleles,
-                                    min_num_genotypes=0)
-    allele_freq2 = calc_allele_freq(vars_for_pop2, max_alleles=max_alleles,
-                                    min_num_genotypes=0)
-
-    exp_het1 = 1 - va.sum(allele_freq1 ** ploidy, axis=1)
-    exp_het2 = 1 - va.sum(allele_freq2 ** ploidy, axis=1)
-
-    hs_per_var = (exp_het1 + exp_het2) / 2
-
-    global_allele_freq = (allele_freq1 + allele_freq2) / 2
-    global_exp_het = 1 - va.sum(global_allele_freq ** ploidy, axis=1)
-    ht_per_var = global_exp_het
-
-    obs_het1_counts, called_gts1 = _calc_obs_het_counts(vars_for_pop1,
-                                                        axis=1,
-                                                        min_call_dp_for_het_call=min_call_dp_for_het)
-    obs_het1 = obs_het1_counts / called_gts1
-    obs_het2_counts, called_gts2 = _calc_obs_het_counts(vars_for_pop2,
-                                                        axis=1,
-                                                        min_call_dp_for_het_call=min_call_dp_for_het)
-    obs_het2 = obs_het2_counts / called_gts2
-
-    called_gts = va.stack([called_gts1, called_gts2], as_type_of=called_gts1)
-
-    try:
-        called_gts_hmean = hmean(called_gts, axis=0)
-    except ValueError:
-        called_gts_hmean = None
-
-    if called_gts_hmean is None:
-        num_vars = vars_for_pop1.num_variations
-        corrected_hs = va.full((num_vars,), np.nan, as_type_of=vars_for_pop1[GT_FIELD])
-        corrected_ht = va.full((num_vars,), np.nan, as_type_of=vars_for_pop1[GT_FIELD])
-    else:
-        mean_obs_het_per_var = va.nanmean(va.stack([obs_het1, obs_het2],
-                                                   as_type_of=obs_het1), axis=0)
-        corrected_hs = (called_gts_hmean / (called_gts_hmean - 1)) * (hs_per_var - (mean_obs_het_per_var / (2 * called_gts_hmean)))
-
-        corrected_ht = ht_per_var + (corrected_hs / (called_gts_hmean * num_pops)) - (mean_obs_het_per_var / (2 * called_gts_hmean * num_pops))
-
-        not_enough_gts = va.logical_or(called_gts1 < min_num_genotypes,
-                                          called_gts2 < min_num_genotypes)
-        corrected_hs[not_enough_gts] = np.nan
-        corrected_ht[not_enough_gts] = np.nan
-
-    return {'corrected_hs': corrected_hs, 'corrected_ht': corrected_ht}
+    components = calc_dest_components(variations, max_alleles, populations,
+                                      min_num_genotypes=min_num_genotypes,
+                                      min_call_dp_for_het=min_call_dp_for_het)
+    sums = _sum_components(components, silence_runtime_warnings)
+    return calc_dest_dists_from_sums(sums)
 
 
 def hmean(array, axis=0, dtype=None):
@@ -1,25 +1,44 @@
 import numpy
+import dask.array as da
 
 import variation6.array as va
 
 from variation6 import (GT_FIELD, MISSING_GT, AO_FIELD, MISSING_INT,
                         RO_FIELD, DP_FIELD, EmptyVariationsError,
                         MIN_NUM_GENOTYPES_FOR_POP_STAT,
-                        ALT_FIELD, AD_FIELD)
+                        ALT_FIELD, AD_FIELD, GT_PACKED_FIELD)
 from variation6.plot import plot_histogram
 from variation6.compute import compute
 from variation6.in_out.zarr import load_zarr
 from variation6.array.array_calculations import DEF_NUM_BINS
+from variation6.array.genotype import PACKED_MISSING, PACKED_HET
 from variation6 import utils_array
+from variation6.variations import normalize_name
 
 MIN_DP_FOR_CALL_HET = 20
 
 
+def _count_packed_gts(variations):
+    return va.count_packed_gts(variations[GT_PACKED_FIELD],
+                               variations.num_samples)
+
+
 def calc_missing_gt(variations, rates=True):
+    if variations.has_packed_gts:
+        # the packed calls are never partially missing, so every missing
+        # call has all its alleles missing
+        num_missing_gts = _count_packed_gts(variations)[:, PACKED_MISSING]
+        if rates:
+            num_missing_gts = num_missing_gts / variations.num_samples
+        return num_missing_gts
+
     gts = variations[GT_FIELD]
     ploidy = variations.ploidy
-    bool_gts = gts == MISSING_GT
-    num_missing_gts = bool_gts.sum(axis=(1, 2)) / ploidy
+    if isinstance(gts, va.SparseGenotypes):
+        num_missing_gts = va.count_missing_alleles_sparse(gts, axis=1) / ploidy
+    else:
+        bool_gts = gts == MISSING_GT
+        num_missing_gts = bool_gts.sum(axis=(1, 2)) / ploidy
     if rates:
         num_missing_gts = num_missing_gts / utils_array.get_shape_item(gts, 1)
     return num_missing_gts
@@ -28,8 +47,11 @@ def calc_missing_gt(variations, rates=True):
 def calc_missing_gt_per_sample(variations, rates=True):
     gts = variations[GT_FIELD]
     ploidy = variations.ploidy
-    bool_gts = gts == MISSING_GT
-    num_missing_gts = bool_gts.sum(axis=(0, 2)) / ploidy
+    if isinstance(gts, va.SparseGenotypes):
+        num_missing_gts = va.count_missing_alleles_sparse(gts, axis=0) / ploidy
+    else:
+        bool_gts = gts == MISSING_GT
+        num_missing_gts = bool_gts.sum(axis=(0, 2)) / ploidy
     if rates:
         num_missing_gts = num_missing_gts / utils_array.get_shape_item(gts, 0)
     return num_missing_gts
@@ -82,21 +104,150 @@ def count_alleles(gts, max_alleles, count_missing=True):
     def _count_alleles(gts):
         return _count_alleles_in_memory(gts, max_alleles, count_missing=count_missing)
 
-    try:
-        chunks = va.reduce_chunk_dimensions(gts)
-    except IndexError:
+    if isinstance(gts, va.SparseGenotypes):
+        return va.count_alleles_sparse(gts, max_alleles,
+                                       count_missing=count_missing)
+
+    if gts.ndim < 3:
         raise EmptyVariationsError()
 
-    allele_counts_by_snp = va.map_blocks(_count_alleles, gts, chunks=chunks,
-                                         drop_axis=(2,))
+    num_alleles = max_alleles + 1 if count_missing else max_alleles
+    # the counts of every block of samples are added for each variation
+    allele_counts_by_snp = va.map_blocks_and_sum_along_samples(_count_alleles,
+                                                               gts,
+                                                               dtype=numpy.int64,
+                                                               tail_shape=(num_alleles,))
     return allele_counts_by_snp
 
 
-def calc_maf_by_gt(variations, max_alleles,
-                   min_num_genotypes=MIN_NUM_GENOTYPES_FOR_POP_STAT):
+def get_population_labels(variations, populations):
+    '''It returns, for every sample, the index of its population, -1 for
+       the samples that are not in any population'''
+    sample_index = variations.sample_index
+    labels = numpy.full(variations.num_samples, -1, dtype=numpy.int64)
+    for pop_idx, pop_samples in enumerate(populations):
+        for sample in pop_samples:
+            try:
+                labels[sample_index[normalize_name(sample)]] = pop_idx
+            except KeyError as error:
+                raise ValueError(f'Sample not found in variations: {error.args[0]}')
+    return labels
+
+
+def _sum_by_population_in_memory(array, pop_labels, num_pops):
+    # one hot samples x pops matrix, the samples without pop are ignored
+    pop_matrix = (pop_labels[:, None] == numpy.arange(num_pops))
+    if array.dtype == bool or numpy.issubdtype(array.dtype, numpy.integer):
+        array = array.astype(numpy.int64)
+        pop_matrix = pop_matrix.astype(numpy.int64)
+    else:
+        pop_matrix = pop_matrix.astype(array.dtype)
+    summed = numpy.tensordot(array, pop_matrix, axes=([1], [0]))
+    return numpy.moveaxis(summed, -1, 1)
+
+
+def sum_by_population(array, pop_labels, num_pops):
+    '''It adds, for every variation, the values of the samples of each
+       population.
+
+       array is variations x samples x ..., pop_labels has the population
+       index of every sample, as returned by get_population_labels, and the
+       result is variations x pops x ... The blocks of samples are reduced
+       independently and then added.'''
+    if not isinstance(array, da.Array):
+        return _sum_by_population_in_memory(array, pop_labels, num_pops)
+
+    def _sum_by_population(block, pop_labels):
+        summed = _sum_by_population_in_memory(block, pop_labels, num_pops)
+        return summed[:, None]
+
+    dtype = numpy.float64 if numpy.issubdtype(array.dtype, numpy.floating) else numpy.int64
+    tail_index = 'klmn'[:array.ndim - 2]
+    pop_labels = da.from_array(pop_labels, chunks=(array.chunks[1],))
+    partial_sums = da.blockwise(_sum_by_population, 'ijp' + tail_index,
+                                array, 'ij' + tail_index, pop_labels, 'j',
+                                dtype=dtype, new_axes={'p': num_pops},
+                                adjust_chunks={'j': 1})
+    return partial_sums.sum(axis=1)
+
+
+def _count_alleles_per_sample_in_memory(gts, max_alleles, count_missing=True,
+                                        only_hets=False):
+    alleles = list(range(max_alleles))
+    if count_missing:
+        alleles.append(MISSING_INT)
+    if only_hets:
+        is_het = numpy.any(gts != gts[:, :, :1], axis=2)
+        is_het = numpy.logical_and(is_het,
+                                   numpy.all(gts != MISSING_INT, axis=2))
+    counts = numpy.empty(gts.shape[:2] + (len(alleles),), dtype=numpy.int64)
+    for idx, allele in enumerate(alleles):
+        if only_hets:
+            counts[:, :, idx] = numpy.logical_and(numpy.any(gts == allele, axis=2),
+                                                  is_het)
+        else:
+            counts[:, :, idx] = numpy.count_nonzero(gts == allele, axis=2)
+    return counts
+
+
+def _count_alleles_by_population(variations, populations, max_alleles,
+                                 count_missing=True, only_hets=False):
     gts = variations[GT_FIELD]
+    if isinstance(gts, va.SparseGenotypes):
+        gts = gts.to_dense()
+    num_alleles = max_alleles + 1 if count_missing else max_alleles
+
+    def _count_alleles_per_sample(gts):
+        return _count_alleles_per_sample_in_memory(gts, max_alleles,
+                                                   count_missing=count_missing,
+                                                   only_hets=only_hets)
+
+    if isinstance(gts, da.Array):
+        gts = gts.rechunk({2: -1})
+        counts = da.map_blocks(_count_alleles_per_sample, gts,
+                               dtype=numpy.int64,
+                               chunks=gts.chunks[:2] + ((num_alleles,),))
+    else:
+        counts = _count_alleles_per_sample(gts)
+    return sum_by_population(counts,
+                             get_population_labels(variations, populations),
+                             len(populations))
+
+
+def count_alleles_by_population(variations, populations, max_alleles,
+                                count_missing=True):
+    '''It counts the alleles of every population in one pass over the
+       genotypes, the result is a variations x pops x alleles array.
 
-    allele_counts_by_snp = count_alleles(gts, max_alleles, count_missing=False)
+       populations is a list with the samples of every population.'''
+    return _count_alleles_by_population(variations, populations, max_alleles,
+                                        count_missing=count_missing)
+
+
+def count_hets_by_allele_and_population(variations, populations,
+                                        max_alleles):
+    '''It counts, for every population and allele, the het calls that
+       carry the allele'''
+    return _count_alleles_by_population(variations, populations, max_alleles,
+                                        count_missing=False, only_hets=True)
+
+
+def count_alleles_in_variations(variations, max_alleles, count_missing=True):
+    '''It counts the alleles of every variation from the packed genotypes,
+       if they are available, or from the genotypes'''
+    if variations.has_packed_gts:
+        return va.count_alleles_packed(variations[GT_PACKED_FIELD],
+                                       variations.num_samples, max_alleles,
+                                       count_missing=count_missing)
+    return count_alleles(variations[GT_FIELD], max_alleles,
+                         count_missing=count_missing)
+
+
+def calc_maf_by_gt(variations, max_alleles,
+                   min_num_genotypes=MIN_NUM_GENOTYPES_FOR_POP_STAT):
+    allele_counts_by_snp = count_alleles_in_variations(variations,
+                                                       max_alleles,
+                                                       count_missing=False)
     max_ = va.max(allele_counts_by_snp, axis=1)
     sum_ = va.sum(allele_counts_by_snp, axis=1)
 
@@ -106,19 +257,14 @@ def calc_maf_by_gt(variations, max_alleles,
     return _mask_stats_with_few_samples(mafs, variations, min_num_genotypes)
 
 
-def _calc_mac(gts, max_alleles):
-    gt_counts = count_alleles(gts, max_alleles=max_alleles)
-    if gt_counts is None:
-        return numpy.array([])
-
+def _calc_mac(gt_counts, num_samples, ploidy):
+    gt_counts = numpy.copy(gt_counts)
     missing_allele_idx = -1  # it's allways in the last position
     num_missing = numpy.copy(gt_counts[:, missing_allele_idx])
     gt_counts[:, missing_allele_idx] = 0
 
     max_ = va.amax(gt_counts, axis=1)
 
-    num_samples = gts.shape[1]
-    ploidy = gts.shape[2]
     num_chroms = num_samples * ploidy
     mac = num_samples - (num_chroms - num_missing - max_) / ploidy
 
@@ -129,21 +275,21 @@ def _calc_mac(gts, max_alleles):
 
 def calc_mac(variations, max_alleles,
              min_num_genotypes=MIN_NUM_GENOTYPES_FOR_POP_STAT):
-    gts = variations[GT_FIELD]
-    # determine output chunks - preserve axis0; change axis1, axis2
-#     chunks = (gts.chunks[0])
-    chunks = None
+    gt_counts = count_alleles_in_variations(variations, max_alleles)
+    num_samples = variations.num_samples
+    ploidy = variations.ploidy
 
-    def _private_calc_mac(gts):
-        return _calc_mac(gts, max_alleles=max_alleles)
+    def _private_calc_mac(gt_counts):
+        return _calc_mac(gt_counts, num_samples=num_samples, ploidy=ploidy)
 
-    macs = va.map_blocks(_private_calc_mac, gts, chunks=chunks,
-                                 drop_axis=(1, 2), dtype=numpy.float64)
+    macs = va.map_blocks(_private_calc_mac, gt_counts, drop_axis=1,
+                         dtype=numpy.float64)
 
     return _mask_stats_with_few_samples(macs, variations, min_num_genotypes)
 
 
-def _call_is_hom_in_memory(gts):
+def call_is_hom_in_memory(gts):
+    '''It tells if every call has all its alleles equal'''
     is_hom = va.create_full_array_in_memory(gts.shape[:-1], True,
                                             dtype=bool)
     for idx in range(1, gts.shape[2]):
@@ -154,7 +300,7 @@ def _call_is_hom_in_memory(gts):
 def _call_is_hom(variations, is_missing=None):
     gts = variations[GT_FIELD]
 
-    is_hom = va.map_blocks(_call_is_hom_in_memory, gts, drop_axis=2)
+    is_hom = va.map_blocks(call_is_hom_in_memory, gts, drop_axis=2)
     if is_missing is not None:
         is_hom[is_missing] = False
     return is_hom
@@ -170,30 +316,92 @@ def _call_is_het(variations, is_missing=None):
     return is_het
 
 
-def _calc_obs_het_counts(variations, axis, min_call_dp_for_het_call,
-                         max_call_dp_for_het_call=None):
-    is_missing = va.any(variations[GT_FIELD] == MISSING_INT, axis=2)
-
+def _get_dp_mask_for_het_call(variations, min_call_dp_for_het_call,
+                              max_call_dp_for_het_call=None):
+    is_masked = None
     if min_call_dp_for_het_call is not None or max_call_dp_for_het_call is not None:
         dps = variations[DP_FIELD]
         if min_call_dp_for_het_call is not None:
-            low_dp = dps < min_call_dp_for_het_call
-            is_missing = va.logical_or(is_missing, low_dp)
+            is_masked = dps < min_call_dp_for_het_call
         if max_call_dp_for_het_call is not None:
             high_dp = dps > max_call_dp_for_het_call
-            is_missing = va.logical_or(is_missing, high_dp)
+            if is_masked is None:
+                is_masked = high_dp
+            else:
+                is_masked = va.logical_or(is_masked, high_dp)
+    return is_masked
+
+
+def _calc_obs_het_counts(variations, axis, min_call_dp_for_het_call,
+                         max_call_dp_for_het_call=None):
+    is_missing = va.any(variations[GT_FIELD] == MISSING_INT, axis=2)
+
+    is_masked = _get_dp_mask_for_het_call(variations, min_call_dp_for_het_call,
+                                          max_call_dp_for_het_call)
+    if is_masked is not None:
+        is_missing = va.logical_or(is_missing, is_masked)
     is_het = _call_is_het(variations, is_missing=is_missing)
 
     return (va.sum(is_het, axis=axis),
             va.sum(va.logical_not(is_missing), axis=axis))
 
 
+def count_genotype_classes(variations):
+    '''It counts, per variation, the hom ref, het and hom alt calls, the
+       result is a variations x 3 array.
+
+       The calls homozygous for any alternative allele are counted as hom
+       alt.'''
+    if variations.has_packed_gts:
+        return _count_packed_gts(variations)[:, :PACKED_MISSING]
+
+    gts = variations[GT_FIELD]
+    is_missing = va.any(gts == MISSING_INT, axis=2)
+    is_het = _call_is_het(variations, is_missing=is_missing)
+    num_hom_refs = va.sum(va.all(gts == 0, axis=2), axis=1)
+    num_hets = va.sum(is_het, axis=1)
+    num_called = va.sum(va.logical_not(is_missing), axis=1)
+    return va.stack([num_hom_refs, num_hets,
+                     num_called - num_hom_refs - num_hets], axis=1,
+                    as_type_of=num_hets)
+
+
+def calc_obs_het_counts_by_population(variations, populations,
+                                      min_call_dp_for_het_call=None,
+                                      max_call_dp_for_het_call=None):
+    '''It returns a variations x pops x 2 array with the number of het and
+       called gts of every population'''
+    is_missing = va.any(variations[GT_FIELD] == MISSING_INT, axis=2)
+    is_masked = _get_dp_mask_for_het_call(variations, min_call_dp_for_het_call,
+                                          max_call_dp_for_het_call)
+    if is_masked is not None:
+        is_missing = va.logical_or(is_missing, is_masked)
+    is_het = _call_is_het(variations, is_missing=is_missing)
+    counts = va.stack([is_het, va.logical_not(is_missing)], axis=2,
+                      as_type_of=is_het)
+    return sum_by_population(counts,
+                             get_population_labels(variations, populations),
+                             len(populations))
+
+
 def calc_obs_het(variations, min_num_genotypes=MIN_NUM_GENOTYPES_FOR_POP_STAT,
                  min_call_dp_for_het_call=0, max_call_dp_for_het_call=None):
 
-    het, called_gts = _calc_obs_het_counts(variations, axis=1,
-                                           min_call_dp_for_het_call=min_call_dp_for_het_call,
-                                           max_call_dp_for_het_call=max_call_dp_for_het_call)
+    if (variations.has_packed_gts and not min_call_dp_for_het_call and
+            max_call_dp_for_het_call is None):
+        gt_counts = _count_packed_gts(variations)
+        het = gt_counts[:, PACKED_HET]
+        called_gts = variations.num_samples - gt_counts[:, PACKED_MISSING]
+    elif isinstance(variations[GT_FIELD], va.SparseGenotypes):
+        is_masked = _get_dp_mask_for_het_call(variations,
+                                              min_call_dp_for_het_call,
+                                              max_call_dp_for_het_call)
+        het, called_gts = va.count_het_and_called_sparse(variations[GT_FIELD],
+                                                         is_masked=is_masked)
+    else:
+        het, called_gts = _calc_obs_het_counts(variations, axis=1,
+                                               min_call_dp_for_het_call=min_call_dp_for_het_call,
+                                               max_call_dp_for_het_call=max_call_dp_for_het_call)
     with numpy.errstate(invalid='ignore'):
         het = het / called_gts
 
@@ -207,6 +415,9 @@ def calc_called_gt(variations, rates=True):
         missing = calc_missing_gt(variations, rates=rates)
 
         return 1 - missing
+    elif (variations.has_packed_gts or
+          isinstance(variations[GT_FIELD], va.SparseGenotypes)):
+        return variations.num_samples - calc_missing_gt(variations, rates=False)
     else:
         ploidy = variations.ploidy
         bool_gts = variations[GT_FIELD] != MISSING_GT
@@ -228,7 +439,8 @@ def calc_allele_freq(variations, max_alleles,
     gts = variations[GT_FIELD]
     if gts.shape[0] == 0:
         return va.empty_array(variations)
-    allele_counts = count_alleles(gts, max_alleles, count_missing=False)
+    allele_counts = count_alleles_in_variations(variations, max_alleles,
+                                                count_missing=False)
     if allele_counts is None:
         raise ValueError('No alleles, everything is missing data')
     total_counts = va.sum(allele_counts, axis=1)
@@ -323,41 +535,122 @@ def calc_diversities(variations, max_alleles, min_num_genotypes,
     return diversities
 
 
+SUMMARY_CALLED = 'called'
+SUMMARY_MAC = 'mac'
+SUMMARY_MAF = 'maf'
+SUMMARY_OBS_HET = 'obs_heterocigosity'
+SUMMARY_STATS = (SUMMARY_CALLED, SUMMARY_MAC, SUMMARY_MAF, SUMMARY_OBS_HET)
+
+
+def _calc_summary_stats_in_memory(gts, dps, max_alleles, min_num_genotypes,
+                                  min_call_dp_for_het_call):
+    num_samples, ploidy = gts.shape[1:]
+    allele_counts = _count_alleles_in_memory(gts, max_alleles,
+                                             count_missing=True)
+    num_called_gts = num_samples - allele_counts[:, -1] / ploidy
+    has_few_gts = num_called_gts < min_num_genotypes
+
+    macs = _calc_mac(allele_counts, num_samples=num_samples, ploidy=ploidy)
+    macs[has_few_gts] = numpy.nan
+
+    allele_counts = allele_counts[:, :-1]
+    with numpy.errstate(invalid='ignore'):
+        mafs = numpy.max(allele_counts, axis=1) / numpy.sum(allele_counts,
+                                                            axis=1)
+    mafs[has_few_gts] = numpy.nan
+
+    is_missing = numpy.any(gts == MISSING_INT, axis=2)
+    if dps is not None and min_call_dp_for_het_call is not None:
+        is_missing = numpy.logical_or(is_missing,
+                                      dps < min_call_dp_for_het_call)
+    is_het = numpy.logical_and(numpy.logical_not(call_is_hom_in_memory(gts)),
+                               numpy.logical_not(is_missing))
+    num_called_for_het = numpy.sum(numpy.logical_not(is_missing), axis=1)
+    with numpy.errstate(invalid='ignore'):
+        obs_het = numpy.sum(is_het, axis=1) / num_called_for_het
+    obs_het[num_called_for_het < min_num_genotypes] = numpy.nan
+
+    return {SUMMARY_CALLED: num_called_gts / num_samples, SUMMARY_MAC: macs,
+            SUMMARY_MAF: mafs, SUMMARY_OBS_HET: obs_het}
+
+
+def _calc_summary_histograms_in_memory(gts, dps, stats_to_calc, bin_edges,
+                                       **kwargs):
+    stats = _calc_summary_stats_in_memory(gts, dps, **kwargs)
+    counts = numpy.zeros((len(stats_to_calc), bin_edges.shape[1] - 1),
+                         dtype=numpy.int64)
+    for idx, kind in enumerate(stats_to_calc):
+        counts[idx] = va.histogram(stats[kind], n_bins=bin_edges.shape[1] - 1,
+                                   limits=(bin_edges[idx][0],
+                                           bin_edges[idx][-1]))[0]
+    return counts
+
+
+def calc_summary_histograms(variations, max_alleles,
+                            stats_to_calc=SUMMARY_STATS,
+                            min_call_dp_for_het_call=MIN_DP_FOR_CALL_HET,
+                            min_num_genotypes=MIN_NUM_GENOTYPES_FOR_POP_STAT,
+                            num_bins=DEF_NUM_BINS):
+    '''It calculates the histograms of the called rate, mac, maf and
+       observed heterozygosity in one pass over the genotypes and depths.
+
+       The allele counts and missing calls are shared by all stats and every
+       block of variations is reduced to its fixed bin counts, so the per
+       variation stats are never kept. The result is a dict with the counts
+       and edges of every stat.'''
+    if not stats_to_calc:
+        return {}
+    num_samples = variations.num_samples
+    limits = {SUMMARY_CALLED: (0, 1), SUMMARY_MAC: (0, num_samples),
+              SUMMARY_MAF: (0, 1), SUMMARY_OBS_HET: (0, 1)}
+    bin_edges = numpy.array([numpy.linspace(*limits[kind], num_bins + 1)
+                             for kind in stats_to_calc])
+    kwargs = {'stats_to_calc': stats_to_calc, 'bin_edges': bin_edges,
+              'max_alleles': max_alleles,
+              'min_num_genotypes': min_num_genotypes,
+              'min_call_dp_for_het_call': min_call_dp_for_het_call}
+
+    gts = variations[GT_FIELD]
+    dps = variations[DP_FIELD]
+    if isinstance(gts, da.Array):
+        def _calc_histograms(gts, dps=None):
+            return _calc_summary_histograms_in_memory(gts, dps, **kwargs)[None, ...]
+
+        args = [gts, 'ijp']
+        if dps is not None:
+            args.extend([dps, 'ij'])
+        partial_counts = da.blockwise(_calc_histograms, 'ikb', *args,
+                                      dtype=numpy.int64,
+                                      new_axes={'k': len(stats_to_calc),
+                                                'b': num_bins},
+                                      adjust_chunks={'i': 1},
+                                      concatenate=True)
+        counts = partial_counts.sum(axis=0)
+    else:
+        counts = _calc_summary_histograms_in_memory(gts, dps, **kwargs)
+
+    return {kind: {'counts': counts[idx], 'edges': bin_edges[idx]}
+            for idx, kind in enumerate(stats_to_calc)}
+
+
 def summarize_variations(in_zarr_path, out_dir_path, draw_missing_rate=True,
                          draw_mac=True, draw_maf=True, draw_obs_het=True,
                          min_call_dp_for_het_call=MIN_DP_FOR_CALL_HET,
                          min_num_genotypes=MIN_NUM_GENOTYPES_FOR_POP_STAT,
                          num_bins=DEF_NUM_BINS, silence_runtime_warnings=True):
-    stats = {}
     variations = load_zarr(in_zarr_path)
     max_alleles = variations[ALT_FIELD].shape[1]
     num_variations = variations.num_variations
     num_samples = variations.num_samples
 
-    if draw_missing_rate:
-        _stats = calc_called_gt(variations, rates=True)
-        counts, edges = va.histogram(_stats, n_bins=num_bins, limits=(0, 1))
-        stats['called'] = {'counts': counts, 'edges': edges}
-
-    if draw_mac:
-        _stats = calc_mac(variations, max_alleles, min_num_genotypes)
-        counts, edges = va.histogram(_stats, n_bins=num_bins,
-                                     limits=(0, variations.num_samples))
-        stats['mac'] = {'counts': counts, 'edges': edges}
-
-    if draw_maf:
-        _stats = calc_maf_by_gt(variations, max_alleles, min_num_genotypes)
-        counts, edges = va.histogram(_stats, n_bins=num_bins,
-                                     limits=(0, 1))
-        stats['maf'] = {'counts': counts, 'edges': edges}
-
-    if draw_obs_het:
-        _stats = calc_obs_het(
-            variations, min_num_genotypes=min_num_genotypes,
-            min_call_dp_for_het_call=min_call_dp_for_het_call)
-        counts, edges = va.histogram(_stats, n_bins=num_bins,
-                                     limits=(0, 1))
-        stats['obs_heterocigosity'] = {'counts': counts, 'edges': edges}
+    stats_to_draw = {SUMMARY_CALLED: draw_missing_rate, SUMMARY_MAC: draw_mac,
+                     SUMMARY_MAF: draw_maf, SUMMARY_OBS_HET: draw_obs_het}
+    stats_to_calc = [kind for kind in SUMMARY_STATS if stats_to_draw[kind]]
+    stats = calc_summary_histograms(variations, max_alleles,
+                                    stats_to_calc=stats_to_calc,
+                                    min_call_dp_for_het_call=min_call_dp_for_het_call,
+                                    min_num_genotypes=min_num_genotypes,
+                                    num_bins=num_bins)
 
     computed_stats = compute(stats,
                              silence_runtime_warnings=silence_runtime_warnings)
@@ -0,0 +1,168 @@
+from itertools import combinations
+
+import dask
+import dask.array as da
+import numpy as np
+
+import variation6.array as va
+from variation6.compute import compute
+from variation6.stats.diversity import (count_alleles_by_population,
+                                        count_hets_by_allele_and_population)
+from variation6.stats.windows import (calc_window_sums, WINDOW_CHROM,
+                                      WINDOW_START, WINDOW_END,
+                                      WINDOW_NUM_VARIATIONS, WINDOW_SUMS)
+
+FST_HUDSON = 'hudson'
+FST_WEIR_COCKERHAM = 'weir_cockerham'
+FST_METHODS = (FST_HUDSON, FST_WEIR_COCKERHAM)
+WINDOW_FST = 'fst'
+
+
+def _calc_hudson_components(allele_counts1, allele_counts2):
+    num_alleles1 = np.sum(allele_counts1, axis=1)
+    num_alleles2 = np.sum(allele_counts2, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        within1 = ((num_alleles1 ** 2 - np.sum(allele_counts1 ** 2, axis=1)) /
+                   (num_alleles1 * (num_alleles1 - 1)))
+        within2 = ((num_alleles2 ** 2 - np.sum(allele_counts2 ** 2, axis=1)) /
+                   (num_alleles2 * (num_alleles2 - 1)))
+        between = ((num_alleles1 * num_alleles2 -
+                    np.sum(allele_counts1 * allele_counts2, axis=1)) /
+                   (num_alleles1 * num_alleles2))
+    numerator = between - (within1 + within2) / 2
+    return numerator, between
+
+
+def _calc_weir_cockerham_components(allele_counts, het_counts):
+    # allele_counts and het_counts are variations x pops x alleles, the
+    # individuals are diploid
+    num_pops = allele_counts.shape[1]
+    num_indis = np.sum(allele_counts, axis=2) / 2
+    total_indis = np.sum(num_indis, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_indis = total_indis / num_pops
+        n_c = ((total_indis - np.sum(num_indis ** 2, axis=1) / total_indis) /
+               (num_pops - 1))
+        freqs = allele_counts / (2 * num_indis[:, :, None])
+        het_freqs = het_counts / num_indis[:, :, None]
+        weights = num_indis[:, :, None]
+        mean_freqs = np.nansum(weights * freqs, axis=1) / total_indis[:, None]
+        s2 = (np.nansum(weights * (freqs - mean_freqs[:, None, :]) ** 2, axis=1) /
+              (mean_indis[:, None] * (num_pops - 1)))
+        mean_het_freqs = (np.nansum(weights * het_freqs, axis=1) /
+                          total_indis[:, None])
+
+        mean_indis = mean_indis[:, None]
+        freq_var = (mean_freqs * (1 - mean_freqs) -
+                    (num_pops - 1) / num_pops * s2)
+        a = (mean_indis / n_c[:, None] *
+             (s2 - 1 / (mean_indis - 1) * (freq_var - mean_het_freqs / 4)))
+        b = (mean_indis / (mean_indis - 1) *
+             (freq_var - (2 * mean_indis - 1) / (4 * mean_indis) * mean_het_freqs))
+        c = mean_het_freqs / 2
+    return np.sum(a, axis=1), np.sum(a + b + c, axis=1)
+
+
+def _calc_fst_components_in_memory(allele_counts, het_counts, method):
+    num_pops = allele_counts.shape[1]
+    pairs = list(combinations(range(num_pops), 2))
+    components = np.empty((allele_counts.shape[0], 2, len(pairs)))
+    for pair_idx, (pop1, pop2) in enumerate(pairs):
+        if method == FST_HUDSON:
+            numerator, denominator = _calc_hudson_components(allele_counts[:, pop1],
+                                                             allele_counts[:, pop2])
+        else:
+            pops = [pop1, pop2]
+            numerator, denominator = _calc_weir_cockerham_components(allele_counts[:, pops],
+                                                                     het_counts[:, pops])
+        components[:, 0, pair_idx] = numerator
+        components[:, 1, pair_idx] = denominator
+    return components
+
+
+def calc_fst_components(variations, populations, max_alleles,
+                        method=FST_HUDSON):
+    '''It calculates, per variation and pair of populations (in combinations
+       order), the numerator and denominator of the Fst estimator.
+
+       The allele counts of all populations are obtained in one pass over the
+       genotypes. The result is a variations x 2 x pairs array, the Fst of a
+       set of variations is the ratio of the sums of both components.
+       Weir and Cockerham requires diploid genotypes.'''
+    if method not in FST_METHODS:
+        raise ValueError(f'Unknown Fst method: {method}')
+    if method == FST_WEIR_COCKERHAM and variations.ploidy != 2:
+        raise ValueError('Weir and Cockerham Fst requires diploid genotypes')
+
+    allele_counts = count_alleles_by_population(variations, populations,
+                                                max_alleles,
+                                                count_missing=False)
+    if method == FST_WEIR_COCKERHAM:
+        het_counts = count_hets_by_allele_and_population(variations,
+                                                         populations,
+                                                         max_alleles)
+    else:
+        het_counts = allele_counts
+
+    def _calc_fst_components(allele_counts, het_counts):
+        return _calc_fst_components_in_memory(allele_counts, het_counts,
+                                              method)
+
+    if not isinstance(allele_counts, da.Array):
+        return _calc_fst_components(allele_counts, het_counts)
+
+    num_pairs = len(populations) * (len(populations) - 1) // 2
+    allele_counts = allele_counts.rechunk({1: -1, 2: -1})
+    het_counts = het_counts.rechunk(allele_counts.chunks)
+    return da.map_blocks(_calc_fst_components, allele_counts, het_counts,
+                         dtype=np.float64,
+                         chunks=(allele_counts.chunks[0], (2,), (num_pairs,)))
+
+
+def calc_fst_per_variant(variations, populations, max_alleles,
+                         method=FST_HUDSON):
+    '''It returns a variations x pairs of populations Fst array'''
+    components = calc_fst_components(variations, populations, max_alleles,
+                                     method=method)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return components[:, 0] / components[:, 1]
+
+
+def calc_pop_pairwise_fst(variations, populations, max_alleles,
+                          method=FST_HUDSON, silence_runtime_warnings=False):
+    '''It calculates the Fst of every pair of populations (in combinations
+       order) as the ratio of the sums of its components along the
+       variations'''
+    components = calc_fst_components(variations, populations, max_alleles,
+                                     method=method)
+    sums = {'numerator': va.nansum(components[:, 0], axis=0),
+            'denominator': va.nansum(components[:, 1], axis=0)}
+    sums = compute(sums, silence_runtime_warnings=silence_runtime_warnings)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums['numerator'] / sums['denominator']
+
+
+def _calc_fst_from_window_sums(window_sums, num_pairs):
+    sums = window_sums[WINDOW_SUMS]
+    table = {key: window_sums[key] for key in (WINDOW_CHROM, WINDOW_START,
+                                               WINDOW_END,
+                                               WINDOW_NUM_VARIATIONS)}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        table[WINDOW_FST] = sums[:, :num_pairs] / sums[:, num_pairs:]
+    return table
+
+
+def calc_fst_by_window(variations, populations, max_alleles, window_size,
+                       step=None, by_snps=False, method=FST_HUDSON):
+    '''It calculates the Fst of every pair of populations in sliding windows,
+       the fst column is a windows x pairs array'''
+    components = calc_fst_components(variations, populations, max_alleles,
+                                     method=method)
+    num_pairs = components.shape[2]
+    stats = ([components[:, 0, idx] for idx in range(num_pairs)] +
+             [components[:, 1, idx] for idx in range(num_pairs)])
+    window_sums = calc_window_sums(variations, stats, window_size, step=step,
+                                   by_snps=by_snps)
+    if isinstance(window_sums, dict):
+        return _calc_fst_from_window_sums(window_sums, num_pairs)
+    return dask.delayed(_calc_fst_from_window_sums)(window_sums, num_pairs)
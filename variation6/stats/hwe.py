@@ -0,0 +1,126 @@
+import numpy as np
+import dask.array as da
+
+from variation6.stats.diversity import count_genotype_classes
+
+# relative tolerance used to consider two genotype configurations equally
+# likely
+HWE_PROB_TOLERANCE = 1e-7
+# max number of het probabilities calculated at once, the tables of
+# probabilities of many samples with different missing rates are large
+HWE_MAX_PROB_TABLE_SIZE = 2 ** 22
+
+
+def _calc_log_factorials(max_num):
+    log_factorials = np.zeros(max_num + 1)
+    log_factorials[1:] = np.cumsum(np.log(np.arange(1, max_num + 1)))
+    return log_factorials
+
+
+def _calc_het_probs(num_gts, num_rare_alleles):
+    # It calculates, for every (number of genotypes, number of rare alleles)
+    # pair, the probability of having 0 to max num rare alleles hets under
+    # HWE (Wigginton et al. 2005)
+    max_num_hets = int(np.max(num_rare_alleles, initial=0))
+    log_factorials = _calc_log_factorials(int(np.max(num_gts, initial=0)))
+
+    num_gts = num_gts[:, None]
+    num_rare_alleles = num_rare_alleles[:, None]
+    num_hets = np.arange(max_num_hets + 1)[None, :]
+    num_rare_homs = (num_rare_alleles - num_hets) // 2
+    num_common_homs = num_gts - num_hets - num_rare_homs
+    is_possible = np.logical_and(num_hets <= num_rare_alleles,
+                                 (num_rare_alleles - num_hets) % 2 == 0)
+
+    num_hets, num_rare_homs, num_common_homs = [np.where(is_possible, nums, 0)
+                                                for nums in (num_hets,
+                                                             num_rare_homs,
+                                                             num_common_homs)]
+    log_probs = (num_hets * np.log(2) + log_factorials[num_gts] -
+                 log_factorials[num_hets] - log_factorials[num_rare_homs] -
+                 log_factorials[num_common_homs])
+    log_probs[~is_possible] = -np.inf
+    probs = np.exp(log_probs - np.max(log_probs, axis=1)[:, None])
+    return probs / np.sum(probs, axis=1)[:, None]
+
+
+def _calc_hwe_pvalue_table(het_probs):
+    # the p value of a number of hets is the sum of the probabilities of the
+    # number of hets equally or less likely
+    num_rows, num_cols = het_probs.shape
+    sorted_probs = np.sort(het_probs, axis=1)
+    cum_probs = np.cumsum(sorted_probs, axis=1).ravel()
+
+    # the rows are placed one after another to search them all at once
+    row_offsets = (np.arange(num_rows) * 2)[:, None]
+    sorted_probs = (sorted_probs + row_offsets).ravel()
+    limits = het_probs * (1 + HWE_PROB_TOLERANCE) + row_offsets
+    idxs = np.searchsorted(sorted_probs, limits.ravel(), side='right') - 1
+    return np.minimum(cum_probs[idxs].reshape((num_rows, num_cols)), 1)
+
+
+def _split_pairs_in_batches(num_rare_alleles, max_table_size):
+    # the pairs are sorted by number of rare alleles, so every batch has
+    # pairs with similar number of columns
+    order = np.argsort(num_rare_alleles, kind='stable')
+    batches = []
+    start = 0
+    while start < order.size:
+        end = start + 1
+        while end < order.size:
+            num_cols = num_rare_alleles[order[end]] + 1
+            if (end - start + 1) * num_cols > max_table_size:
+                break
+            end += 1
+        batches.append(order[start:end])
+        start = end
+    return batches
+
+
+def calc_hwe_pvalues_from_gt_counts(gt_counts,
+                                    max_table_size=HWE_MAX_PROB_TABLE_SIZE):
+    '''It calculates the HWE exact test p values from the hom ref, het and
+       hom alt counts of every variation.
+
+       The het probabilities are calculated only once for every distinct
+       number of genotypes and number of rare alleles, in batches of
+       distinct pairs with at most max_table_size probabilities.'''
+    gt_counts = np.asarray(gt_counts, dtype=np.int64)
+    pvalues = np.full(gt_counts.shape[0], np.nan)
+    if not gt_counts.shape[0]:
+        return pvalues
+
+    num_hets = gt_counts[:, 1]
+    num_gts = np.sum(gt_counts, axis=1)
+    num_rare_alleles = np.minimum(2 * gt_counts[:, 0] + num_hets,
+                                  2 * gt_counts[:, 2] + num_hets)
+    pairs, pair_idxs = np.unique(np.stack([num_gts, num_rare_alleles], axis=1),
+                                 axis=0, return_inverse=True)
+    pair_idxs = pair_idxs.ravel()
+
+    pair_batches = np.empty(pairs.shape[0], dtype=np.int64)
+    pair_rows = np.empty(pairs.shape[0], dtype=np.int64)
+    batches = _split_pairs_in_batches(pairs[:, 1], max_table_size)
+    for batch_idx, batch in enumerate(batches):
+        pair_batches[batch] = batch_idx
+        pair_rows[batch] = np.arange(batch.size)
+    var_batches = pair_batches[pair_idxs]
+    for batch_idx, batch in enumerate(batches):
+        het_probs = _calc_het_probs(pairs[batch, 0], pairs[batch, 1])
+        pvalue_table = _calc_hwe_pvalue_table(het_probs)
+        in_batch = var_batches == batch_idx
+        pvalues[in_batch] = pvalue_table[pair_rows[pair_idxs[in_batch]],
+                                         num_hets[in_batch]]
+    pvalues[num_gts == 0] = np.nan
+    return pvalues
+
+
+def calc_hwe_pvalues(variations):
+    '''It calculates, per variation, the Hardy-Weinberg equilibrium exact
+       test p value'''
+    gt_counts = count_genotype_classes(variations)
+    if isinstance(gt_counts, da.Array):
+        gt_counts = gt_counts.rechunk({1: -1})
+        return da.map_blocks(calc_hwe_pvalues_from_gt_counts, gt_counts,
+                             drop_axis=1, dtype=np.float64)
+    return calc_hwe_pvalues_from_gt_counts(gt_counts)
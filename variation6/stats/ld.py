@@ -1,38 +1,48 @@
 import math
 import itertools
 import random
+from collections import deque
 
 import numpy as np
 
 import variation6.array as va
 from variation6 import (CHROM_FIELD, POS_FIELD, GT_FIELD, MISSING_INT,
-                        ALT_FIELD, DEF_CHUNK_SIZE)
-from variation6.compute import compute
+                        ALT_FIELD, DEF_CHUNK_SIZE, DEF_NUM_PREFETCHED_CHUNKS,
+                        DEF_NUM_PREFETCH_WORKERS)
 from variation6.stats.diversity import calc_maf_by_gt
 
 DDOF = 1
 
 
-def iterate_chunk_pairs(variations, max_distance, chunk_size=DEF_CHUNK_SIZE):
-    chunks = list(variations.iterate_chunks(chunk_size))
-    computed_chunks = {}
-    for index1, chunk1 in enumerate(chunks):
-        computed1 = compute({'vars': chunk1}, store_variation_to_memory=True,
-                            silence_runtime_warnings=True)['vars']
-        computed_chunks[index1] = computed1
+def iterate_chunk_pairs(variations, max_distance, chunk_size=DEF_CHUNK_SIZE,
+                        prefetch=DEF_NUM_PREFETCHED_CHUNKS,
+                        workers=DEF_NUM_PREFETCH_WORKERS):
+    computed_chunks = variations.iterate_computed_chunks(chunk_size=chunk_size,
+                                                         prefetch=prefetch,
+                                                         workers=workers,
+                                                         silence_runtime_warnings=True)
+    # the computed chunks from chunk1 to the last one within max_distance
+    window = deque()
+    while True:
+        if not window:
+            computed1 = next(computed_chunks, None)
+            if computed1 is None:
+                break
+            window.append(computed1)
+        computed1 = window[0]
 
         chunk1_end_pos = computed1[POS_FIELD][-1]
         chunk1_end_chrom = computed1[CHROM_FIELD][-1]
 
-        for index, chunk2 in enumerate(chunks[index1:]):
-            index2 = index1 + index
-            if index2 in computed_chunks:
-                computed2 = computed_chunks[index2]
-            else:
-                computed2 = compute({'vars': chunk2},
-                                    store_variation_to_memory=True,
-                                silence_runtime_warnings=True)['vars']
-            if index2 != index1:
+        index = 0
+        while True:
+            if index == len(window):
+                computed2 = next(computed_chunks, None)
+                if computed2 is None:
+                    break
+                window.append(computed2)
+            computed2 = window[index]
+            if index:
                 chunk2_start_chrom = computed2[CHROM_FIELD][0]
                 if chunk1_end_chrom != chunk2_start_chrom:
                     break
@@ -41,12 +51,9 @@ def iterate_chunk_pairs(variations, max_distance, chunk_size=DEF_CHUNK_SIZE):
                     break
 
             yield computed1, computed2
+            index += 1
 
-        # remove from computed_chunks those with index minor than index1
-        try:
-            del computed_chunks[index1 - 1]
-        except KeyError:
-            pass
+        window.popleft()
 
 
 def calc_ld_along_genome(variations, max_distance, min_num_gts=10, max_maf=0.95):
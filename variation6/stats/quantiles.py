@@ -0,0 +1,31 @@
+import variation6.array as va
+from variation6 import DP_FIELD, GQ_FIELD, QUAL_FIELD
+
+DEF_SKETCH_FIELDS = (DP_FIELD, GQ_FIELD, QUAL_FIELD)
+
+
+def calc_quantile_sketches(variations, fields=DEF_SKETCH_FIELDS, stats=None,
+                           compression=va.DEF_SKETCH_COMPRESSION):
+    '''It sketches the distributions of the given fields and stats.
+
+       The fields absent in the variations are skipped. stats is an optional
+       dict with per variation stats, like the ones calculated in
+       diversity. The sketches are delayed for dask variations and can be
+       computed together with compute.'''
+    sketches = {}
+    for field in fields:
+        array = variations[field]
+        if array is None:
+            continue
+        sketches[field] = va.calc_quantile_sketch(array,
+                                                  compression=compression)
+    if stats is not None:
+        for key, stat in stats.items():
+            sketches[key] = va.calc_quantile_sketch(stat,
+                                                    compression=compression)
+    return sketches
+
+
+def calc_quantiles(sketches, quantiles):
+    '''It queries the given quantiles of every computed sketch'''
+    return {key: sketch.quantile(quantiles) for key, sketch in sketches.items()}
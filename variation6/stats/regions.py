@@ -0,0 +1,142 @@
+import numpy as np
+import dask.array as da
+
+import variation6.array as va
+from variation6 import (CHROM_FIELD, POS_FIELD,
+                        MIN_NUM_GENOTYPES_FOR_POP_STAT)
+from variation6.variations import normalize_name
+from variation6.stats.diversity import (calc_missing_gt, calc_maf_by_gt,
+                                        calc_obs_het, calc_expected_het,
+                                        MIN_DP_FOR_CALL_HET)
+
+REGION_CHROM = 'chrom'
+REGION_START = 'start'
+REGION_END = 'end'
+REGION_NAME = 'name'
+REGION_NUM_VARIATIONS = 'num_variations'
+REGION_MAF = 'maf'
+REGION_OBS_HET = 'obs_het'
+REGION_EXP_HET = 'exp_het'
+REGION_MISSING_GT_RATE = 'missing_gt_rate'
+
+_REGION_STATS = [REGION_MAF, REGION_OBS_HET, REGION_EXP_HET,
+                 REGION_MISSING_GT_RATE]
+
+
+def _sort_regions_by_chrom(region_chroms, region_starts):
+    regions_by_chrom = {}
+    for idx, chrom in enumerate(region_chroms):
+        regions_by_chrom.setdefault(chrom, []).append(idx)
+
+    sorted_regions = {}
+    for chrom, region_idxs in regions_by_chrom.items():
+        region_idxs = np.array(region_idxs)
+        order = np.argsort(region_starts[region_idxs], kind='stable')
+        sorted_regions[chrom] = region_idxs[order]
+    return sorted_regions
+
+
+def prepare_values_to_sum(stats):
+    '''It prepares the per variation stats to be summed: one column to count
+       the variations and, per stat, the values with nans as 0 and if the
+       value is not nan'''
+    is_valid = ~np.isnan(stats)
+    return np.concatenate([np.ones((stats.shape[0], 1)),
+                           np.where(is_valid, stats, 0), is_valid], axis=1)
+
+
+def _calc_region_sums_in_memory(chroms, poss, stats, sorted_regions,
+                                region_starts, region_ends):
+    # per region: num. variations and, per stat, the sum of the values and
+    # the number of values that are not nan
+    num_regions = region_starts.size
+    num_stats = stats.shape[1]
+    sums = np.zeros((1, num_regions, 1 + 2 * num_stats), dtype=np.float64)
+    if not chroms.size:
+        return sums
+
+    values = prepare_values_to_sum(stats)
+
+    for chrom in np.unique(chroms):
+        region_idxs = sorted_regions.get(normalize_name(chrom))
+        if region_idxs is None:
+            continue
+        is_chrom = chroms == chrom
+        chrom_poss = poss[is_chrom]
+        order = np.argsort(chrom_poss, kind='stable')
+        chrom_poss = chrom_poss[order]
+
+        # the regions are sorted by start, so the ones that start after the
+        # last position of the chunk are skipped
+        num_starting = np.searchsorted(region_starts[region_idxs],
+                                       chrom_poss[-1], side='right')
+        region_idxs = region_idxs[:num_starting]
+        region_idxs = region_idxs[region_ends[region_idxs] > chrom_poss[0]]
+        if not region_idxs.size:
+            continue
+
+        cum_values = np.zeros((chrom_poss.size + 1, values.shape[1]))
+        np.cumsum(values[is_chrom][order], axis=0, out=cum_values[1:])
+        firsts = np.searchsorted(chrom_poss, region_starts[region_idxs],
+                                 side='left')
+        lasts = np.searchsorted(chrom_poss, region_ends[region_idxs],
+                                side='left')
+        sums[0, region_idxs] += cum_values[lasts] - cum_values[firsts]
+    return sums
+
+
+def calc_stats_by_region(variations, regions, max_alleles,
+                         min_num_genotypes=MIN_NUM_GENOTYPES_FOR_POP_STAT,
+                         min_call_dp_for_het_call=MIN_DP_FOR_CALL_HET):
+    '''It calculates, per region, the number of variations and the mean maf,
+       obs and expected het and missing gt rate.
+
+       The regions are (chrom, start, end) or (chrom, start, end, name)
+       intervals, start included and end excluded, and they can overlap.
+       All regions are aggregated in one pass over the chunks and the result
+       is a dict of columns with a row per region, in the given order.'''
+    region_chroms = [normalize_name(region[0]) for region in regions]
+    region_starts = np.array([region[1] for region in regions], dtype=np.int64)
+    region_ends = np.array([region[2] for region in regions], dtype=np.int64)
+    sorted_regions = _sort_regions_by_chrom(region_chroms, region_starts)
+
+    stats = [calc_maf_by_gt(variations, max_alleles,
+                            min_num_genotypes=min_num_genotypes),
+             calc_obs_het(variations, min_num_genotypes=min_num_genotypes,
+                          min_call_dp_for_het_call=min_call_dp_for_het_call),
+             calc_expected_het(variations, max_alleles=max_alleles,
+                               min_num_genotypes=min_num_genotypes),
+             calc_missing_gt(variations, rates=True)]
+    stats = va.stack([stat.astype(np.float64) for stat in stats], axis=1,
+                     as_type_of=stats[0])
+    chroms = variations[CHROM_FIELD]
+    poss = variations[POS_FIELD]
+
+    def _calc_region_sums(chroms, poss, stats):
+        return _calc_region_sums_in_memory(chroms, poss, stats,
+                                           sorted_regions, region_starts,
+                                           region_ends)
+
+    num_cols = 1 + 2 * len(_REGION_STATS)
+    if isinstance(stats, da.Array):
+        stats = stats.rechunk({1: -1})
+        sums = da.blockwise(_calc_region_sums, 'irc', chroms, 'i', poss, 'i',
+                            stats, 'is', concatenate=True, dtype=np.float64,
+                            new_axes={'r': len(regions), 'c': num_cols},
+                            adjust_chunks={'i': 1})
+        sums = sums.sum(axis=0)
+    else:
+        sums = _calc_region_sums(chroms, poss, stats)[0]
+
+    table = {REGION_CHROM: np.array(region_chroms),
+             REGION_START: region_starts,
+             REGION_END: region_ends}
+    if any(len(region) > 3 for region in regions):
+        table[REGION_NAME] = np.array([region[3] if len(region) > 3 else None
+                                       for region in regions])
+    table[REGION_NUM_VARIATIONS] = sums[:, 0].astype(np.int64)
+    num_stats = len(_REGION_STATS)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for idx, stat in enumerate(_REGION_STATS):
+            table[stat] = sums[:, 1 + idx] / sums[:, 1 + num_stats + idx]
+    return table
@@ -0,0 +1,143 @@
+import numpy as np
+import dask.array as da
+
+from variation6.compute import compute
+from variation6.stats.windows import (calc_window_sums, WINDOW_SUMS,
+                                      WINDOW_NUM_VARIATIONS)
+
+DEFAULT_NUM_BOOTSTRAP_REPLICATES = 100
+
+
+def _nansum_block(array):
+    return np.nansum(array, axis=0, keepdims=True)
+
+
+def _calc_block_sums_in_memory(array, block_size):
+    if not array.shape[0]:
+        return np.zeros((0,) + array.shape[1:])
+    block_starts = np.arange(0, array.shape[0], block_size)
+    return np.add.reduceat(np.where(np.isnan(array), 0, array), block_starts,
+                           axis=0)
+
+
+def _calc_block_sums_by_chunk(array, block_size, variation_chunks):
+    array = array.rechunk({0: block_size if block_size else variation_chunks})
+    chunks = ((1,) * array.numblocks[0],) + array.chunks[1:]
+    return da.map_blocks(_nansum_block, array, chunks=chunks,
+                         dtype=np.float64)
+
+
+def _calc_block_sums_by_window(variations, components, window_size):
+    columns = []
+    shapes = {}
+    for name, values in components.items():
+        shapes[name] = values.shape[1:]
+        values = values.reshape((values.shape[0], -1))
+        columns.extend(values[:, idx] for idx in range(values.shape[1]))
+    window_sums = calc_window_sums(variations, columns, window_size)
+    return window_sums, shapes
+
+
+def _split_window_sums(window_sums, shapes):
+    sums = window_sums[WINDOW_SUMS][window_sums[WINDOW_NUM_VARIATIONS] > 0]
+    block_sums = {}
+    first_column = 0
+    for name, shape in shapes.items():
+        num_columns = int(np.prod(shape))
+        block_sums[name] = sums[:, first_column: first_column + num_columns].reshape((-1,) + shape)
+        first_column += num_columns
+    return block_sums
+
+
+def calc_block_sums(variations, components, block_size=None, window_size=None,
+                    silence_runtime_warnings=False):
+    '''It sums, in one pass, every per variation component along blocks of
+       variations.
+
+       components is a dict of arrays with the variations in the first axis.
+       The blocks are the chunks of the components, block_size variations or
+       genomic windows of window_size bp (the windows with no variations are
+       dropped). The result is a dict with the block sums, the blocks in the
+       first axis, that can be resampled in memory.'''
+    if block_size is not None and window_size is not None:
+        raise ValueError('block_size and window_size are incompatible')
+
+    if window_size is not None:
+        window_sums, shapes = _calc_block_sums_by_window(variations,
+                                                         components,
+                                                         window_size)
+        window_sums = compute({'sums': window_sums},
+                              silence_runtime_warnings=silence_runtime_warnings)['sums']
+        return _split_window_sums(window_sums, shapes)
+
+    block_sums = {}
+    variation_chunks = None
+    for name, values in components.items():
+        if isinstance(values, da.Array):
+            if variation_chunks is None:
+                variation_chunks = values.chunks[0]
+            block_sums[name] = _calc_block_sums_by_chunk(values, block_size,
+                                                         variation_chunks)
+        elif block_size is None:
+            raise ValueError('block_size is required for in memory components')
+        else:
+            block_sums[name] = _calc_block_sums_in_memory(values, block_size)
+    return compute(block_sums,
+                   silence_runtime_warnings=silence_runtime_warnings)
+
+
+def _get_num_blocks(block_sums):
+    num_blocks = {sums.shape[0] for sums in block_sums.values()}
+    if len(num_blocks) != 1:
+        raise ValueError('All components should have the same number of blocks')
+    return num_blocks.pop()
+
+
+def calc_bootstrap_replicates(block_sums, estimator,
+                              num_replicates=DEFAULT_NUM_BOOTSTRAP_REPLICATES,
+                              seed=None):
+    '''It calculates the estimator for bootstrap replicates of the blocks.
+
+       The estimator takes a dict with the sums of the components and should
+       keep the leading axis, the replicates.'''
+    num_blocks = _get_num_blocks(block_sums)
+    rng = np.random.default_rng(seed)
+    sampled_blocks = rng.integers(0, num_blocks,
+                                  size=(num_replicates, num_blocks))
+    # times that every block has been sampled in every replicate
+    weights = np.zeros((num_replicates, num_blocks))
+    np.add.at(weights, (np.arange(num_replicates)[:, None], sampled_blocks), 1)
+
+    sums = {name: np.tensordot(weights, values, axes=(1, 0))
+            for name, values in block_sums.items()}
+    return estimator(sums)
+
+
+def calc_jackknife_replicates(block_sums, estimator):
+    '''It calculates the estimator leaving out each of the blocks'''
+    _get_num_blocks(block_sums)
+    sums = {name: np.sum(values, axis=0) - values
+            for name, values in block_sums.items()}
+    return estimator(sums)
+
+
+def calc_estimate(block_sums, estimator):
+    '''It calculates the estimator using all blocks'''
+    sums = {name: np.sum(values, axis=0)[None, ...]
+            for name, values in block_sums.items()}
+    return estimator(sums)[0]
+
+
+def calc_jackknife_std_error(jackknife_replicates):
+    num_blocks = jackknife_replicates.shape[0]
+    mean = np.nanmean(jackknife_replicates, axis=0)
+    sum_squares = np.nansum((jackknife_replicates - mean) ** 2, axis=0)
+    return np.sqrt((num_blocks - 1) / num_blocks * sum_squares)
+
+
+def calc_percentile_interval(replicates, confidence=0.95):
+    '''It returns the lower and upper limits of the interval that includes
+       the confidence fraction of the replicates'''
+    tail = (1 - confidence) / 2 * 100
+    return (np.nanpercentile(replicates, tail, axis=0),
+            np.nanpercentile(replicates, 100 - tail, axis=0))
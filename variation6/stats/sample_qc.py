@@ -0,0 +1,125 @@
+import numpy as np
+import dask.array as da
+
+import variation6.array as va
+from variation6 import GT_FIELD, DP_FIELD, MISSING_INT
+from variation6.stats.diversity import (count_alleles_in_variations,
+                                        call_is_hom_in_memory)
+
+SAMPLE_NUM_CALLED = 'num_called'
+SAMPLE_NUM_MISSING = 'num_missing'
+SAMPLE_MISSING_RATE = 'missing_rate'
+SAMPLE_NUM_HET = 'num_het'
+SAMPLE_NUM_HOM_ALT = 'num_hom_alt'
+SAMPLE_OBS_HET = 'obs_het'
+SAMPLE_DP_MEAN = 'dp_mean'
+SAMPLE_DP_STD = 'dp_std'
+SAMPLE_INBREEDING_F = 'inbreeding_f'
+
+# columns of the per sample sums
+_NUM_CALLED = 0
+_NUM_HET = 1
+_NUM_HOM_ALT = 2
+_NUM_INFORMATIVE = 3
+_NUM_OBS_HOM = 4
+_EXP_HOM_SUM = 5
+_DP_SUM = 6
+_DP_SQUARE_SUM = 7
+_NUM_DPS = 8
+_NUM_SUMS = 9
+
+
+def _calc_expected_homs(variations, max_alleles):
+    # unbiased expected homozygosity of every variation
+    allele_counts = count_alleles_in_variations(variations, max_alleles,
+                                                count_missing=False)
+    ploidy = variations.ploidy
+    num_alleles = va.sum(allele_counts, axis=1)
+    num_called_gts = num_alleles / ploidy
+    with np.errstate(invalid='ignore', divide='ignore'):
+        allele_freqs = allele_counts / num_alleles[:, None]
+        exp_het = 1 - va.sum(allele_freqs ** ploidy, axis=1)
+        exp_het = (2 * num_called_gts / (2 * num_called_gts - 1)) * exp_het
+    exp_homs = 1 - exp_het
+    exp_homs[num_called_gts < 2] = np.nan
+    return exp_homs
+
+
+def _calc_sample_qc_sums_in_memory(gts, exp_homs, dps=None):
+    is_called = np.all(gts != MISSING_INT, axis=2)
+    is_hom = np.logical_and(call_is_hom_in_memory(gts), is_called)
+    is_het = np.logical_and(is_called, np.logical_not(is_hom))
+    is_hom_alt = np.logical_and(is_hom, gts[:, :, 0] != 0)
+    is_informative = np.logical_and(is_called, ~np.isnan(exp_homs)[:, None])
+
+    sums = np.zeros((gts.shape[1], _NUM_SUMS))
+    sums[:, _NUM_CALLED] = np.sum(is_called, axis=0)
+    sums[:, _NUM_HET] = np.sum(is_het, axis=0)
+    sums[:, _NUM_HOM_ALT] = np.sum(is_hom_alt, axis=0)
+    sums[:, _NUM_INFORMATIVE] = np.sum(is_informative, axis=0)
+    sums[:, _NUM_OBS_HOM] = np.sum(np.logical_and(is_hom, is_informative),
+                                   axis=0)
+    sums[:, _EXP_HOM_SUM] = np.sum(np.where(is_informative,
+                                            exp_homs[:, None], 0), axis=0)
+    if dps is not None:
+        has_dp = dps != MISSING_INT
+        if np.issubdtype(dps.dtype, np.floating):
+            has_dp = np.logical_and(has_dp, ~np.isnan(dps))
+        dps = np.where(has_dp, dps, 0).astype(np.float64)
+        sums[:, _DP_SUM] = np.sum(dps, axis=0)
+        sums[:, _DP_SQUARE_SUM] = np.sum(dps ** 2, axis=0)
+        sums[:, _NUM_DPS] = np.sum(has_dp, axis=0)
+    return sums
+
+
+def _calc_sample_qc_sums(gts, exp_homs, dps):
+    if not isinstance(gts, da.Array):
+        return _calc_sample_qc_sums_in_memory(gts, exp_homs, dps)
+
+    def _calc_sums(gts, exp_homs, dps=None):
+        return _calc_sample_qc_sums_in_memory(gts, exp_homs, dps)[None, ...]
+
+    args = [gts, 'ijp', exp_homs, 'i']
+    if dps is not None:
+        args.extend([dps, 'ij'])
+    # every block of variations is reduced and the partial sums are added
+    # with a tree reduction
+    partial_sums = da.blockwise(_calc_sums, 'ijk', *args, dtype=np.float64,
+                                new_axes={'k': _NUM_SUMS},
+                                adjust_chunks={'i': 1}, concatenate=True)
+    return partial_sums.sum(axis=0)
+
+
+def calc_sample_qc(variations, max_alleles):
+    '''It calculates, in one pass over the genotypes and depths, the
+       missingness, heterozygosity, depth and inbreeding coefficient of
+       every sample.
+
+       F is calculated as (O - E) / (N - E) using the homozygous calls, the
+       unbiased expected homozygosity of the variations and the number of
+       called variations of the sample. The result is a dict with a per
+       sample array for every stat.'''
+    gts = variations[GT_FIELD]
+    dps = variations[DP_FIELD]
+    exp_homs = _calc_expected_homs(variations, max_alleles)
+    sums = _calc_sample_qc_sums(gts, exp_homs, dps)
+
+    num_vars = variations.num_variations
+    num_called = sums[:, _NUM_CALLED]
+    num_dps = sums[:, _NUM_DPS]
+    exp_homs = sums[:, _EXP_HOM_SUM]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dp_means = sums[:, _DP_SUM] / num_dps
+        dp_vars = sums[:, _DP_SQUARE_SUM] / num_dps - dp_means ** 2
+        qc = {SAMPLE_NUM_CALLED: num_called,
+              SAMPLE_NUM_MISSING: num_vars - num_called,
+              SAMPLE_MISSING_RATE: (num_vars - num_called) / num_vars,
+              SAMPLE_NUM_HET: sums[:, _NUM_HET],
+              SAMPLE_NUM_HOM_ALT: sums[:, _NUM_HOM_ALT],
+              SAMPLE_OBS_HET: sums[:, _NUM_HET] / num_called,
+              SAMPLE_INBREEDING_F: ((sums[:, _NUM_OBS_HOM] - exp_homs) /
+                                    (sums[:, _NUM_INFORMATIVE] - exp_homs))}
+        if dps is not None:
+            qc[SAMPLE_DP_MEAN] = dp_means
+            qc[SAMPLE_DP_STD] = np.sqrt(np.maximum(dp_vars, 0))
+    return qc
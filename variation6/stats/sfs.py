@@ -0,0 +1,188 @@
+import numpy as np
+import dask.array as da
+
+import variation6.array as va
+from variation6.compute import compute
+from variation6.stats.diversity import (count_alleles_by_population,
+                                        count_alleles_in_variations)
+
+
+def _calc_log_combs(n, k, log_factorials):
+    is_valid = np.logical_and(k >= 0, k <= n)
+    n = np.where(is_valid, n, 0)
+    k = np.where(is_valid, k, 0)
+    log_combs = log_factorials[n] - log_factorials[k] - log_factorials[n - k]
+    return np.where(is_valid, log_combs, -np.inf)
+
+
+def calc_projection_probs(num_alleles, num_derived_alleles, projection):
+    '''It calculates, for every site, the hypergeometric probability of
+       sampling 0 to projection derived alleles when projecting the site to
+       projection alleles.
+
+       The sites with less than projection alleles get no probability.'''
+    num_alleles = np.asarray(num_alleles, dtype=np.int64)
+    num_derived_alleles = np.asarray(num_derived_alleles, dtype=np.int64)
+    max_num_alleles = max(int(np.max(num_alleles, initial=0)), projection)
+    log_factorials = np.zeros(max_num_alleles + 1)
+    log_factorials[1:] = np.cumsum(np.log(np.arange(1, max_num_alleles + 1)))
+
+    num_alleles = num_alleles[:, None]
+    num_derived_alleles = num_derived_alleles[:, None]
+    sampled_derived_alleles = np.arange(projection + 1)[None, :]
+    with np.errstate(invalid='ignore'):
+        log_probs = (_calc_log_combs(num_derived_alleles,
+                                     sampled_derived_alleles, log_factorials) +
+                     _calc_log_combs(num_alleles - num_derived_alleles,
+                                     projection - sampled_derived_alleles,
+                                     log_factorials) -
+                     _calc_log_combs(num_alleles, projection, log_factorials))
+        probs = np.exp(log_probs)
+    probs[num_alleles[:, 0] < projection] = 0
+    return probs
+
+
+def fold_sfs(sfs):
+    '''It folds an unfolded site frequency spectrum.
+
+       The minor allele is decided with the number of derived alleles along
+       all the populations, as in dadi, so the entry (i, j) is joined with
+       (n1 - i, n2 - j) and the entries with as many derived as ancestral
+       alleles are split between both. The folded out entries of a joint
+       spectrum are set to 0, a 1D spectrum is returned with only its first
+       n // 2 + 1 entries.'''
+    sfs = np.asarray(sfs, dtype=np.float64)
+    num_alleles = sum(sfs.shape) - sfs.ndim
+    num_derived_alleles = np.sum(np.indices(sfs.shape), axis=0)
+    pair_sums = sfs + np.flip(sfs)
+    folded = np.where(num_derived_alleles < num_alleles / 2, pair_sums, 0)
+    folded = np.where(num_derived_alleles == num_alleles / 2, pair_sums / 2,
+                      folded)
+    if sfs.ndim == 1:
+        folded = folded[:num_alleles // 2 + 1]
+    return folded
+
+
+def _count_alleles_and_derived_alleles(variations, populations, max_alleles):
+    if populations is None:
+        allele_counts = count_alleles_in_variations(variations, max_alleles,
+                                                    count_missing=False)
+        allele_counts = allele_counts[:, None, :]
+    else:
+        allele_counts = count_alleles_by_population(variations, populations,
+                                                    max_alleles,
+                                                    count_missing=False)
+    # The reference allele is taken as the ancestral one
+    num_alleles = va.sum(allele_counts, axis=2)
+    num_derived_alleles = num_alleles - allele_counts[:, :, 0]
+    counts = va.stack([num_alleles, num_derived_alleles], axis=2,
+                      as_type_of=num_alleles)
+    if isinstance(counts, da.Array):
+        counts = counts.rechunk({1: -1, 2: -1})
+    return counts
+
+
+def _map_blocks_and_sum_along_variations(func, counts, shape):
+    if not isinstance(counts, da.Array):
+        return func(counts)
+    num_blocks = counts.numblocks[0]
+    sums = da.map_blocks(lambda block: func(block)[None, ...], counts,
+                         dtype=np.float64,
+                         chunks=((1,) * num_blocks,) + tuple((size,) for size in shape),
+                         drop_axis=(1, 2), new_axis=tuple(range(1, len(shape) + 1)))
+    return da.sum(sums, axis=0)
+
+
+def _count_alleles_and_derived_alleles_pairs(counts, max_num_alleles):
+    # it counts how many sites have every combination of number of alleles
+    # and number of derived alleles
+    codes = counts[:, 0, 0] * (max_num_alleles + 1) + counts[:, 0, 1]
+    return np.bincount(codes.astype(np.int64),
+                       minlength=(max_num_alleles + 1) ** 2).astype(np.float64)
+
+
+def _calc_sfs_from_pair_counts(pair_counts, max_num_alleles, projection):
+    pair_counts = pair_counts.reshape((max_num_alleles + 1,
+                                       max_num_alleles + 1))
+    num_alleles, num_derived_alleles = np.nonzero(pair_counts)
+    probs = calc_projection_probs(num_alleles, num_derived_alleles,
+                                  projection)
+    return np.sum(probs * pair_counts[num_alleles, num_derived_alleles][:, None],
+                  axis=0)
+
+
+def calc_sfs(variations, max_alleles, population=None, projection=None,
+             folded=False, silence_runtime_warnings=False):
+    '''It calculates the site frequency spectrum of a population or of all
+       samples.
+
+       The reference allele is taken as the ancestral one and the rest of
+       alleles are counted as derived. The sites with missing genotypes are
+       projected to projection alleles (by default all the alleles of the
+       population) with a hypergeometric sampling, the sites with less called
+       alleles are not used. The sites are counted per chunk and the counts
+       are added up along the chunks.'''
+    populations = None if population is None else [population]
+    num_samples = variations.num_samples if population is None else len(population)
+    max_num_alleles = num_samples * variations.ploidy
+    if projection is None:
+        projection = max_num_alleles
+    if projection > max_num_alleles:
+        raise ValueError('projection should not be larger than the number of alleles')
+
+    counts = _count_alleles_and_derived_alleles(variations, populations,
+                                                max_alleles)
+
+    def _count_pairs(counts):
+        return _count_alleles_and_derived_alleles_pairs(counts,
+                                                        max_num_alleles)
+
+    pair_counts = _map_blocks_and_sum_along_variations(_count_pairs, counts,
+                                                       ((max_num_alleles + 1) ** 2,))
+    pair_counts = compute({'pair_counts': pair_counts},
+                          silence_runtime_warnings=silence_runtime_warnings)['pair_counts']
+    sfs = _calc_sfs_from_pair_counts(pair_counts, max_num_alleles, projection)
+    if folded:
+        sfs = fold_sfs(sfs)
+    return sfs
+
+
+def _calc_joint_sfs_in_memory(counts, projections):
+    probs1 = calc_projection_probs(counts[:, 0, 0], counts[:, 0, 1],
+                                   projections[0])
+    probs2 = calc_projection_probs(counts[:, 1, 0], counts[:, 1, 1],
+                                   projections[1])
+    return np.einsum('si,sj->ij', probs1, probs2)
+
+
+def calc_joint_sfs(variations, max_alleles, populations, projections=None,
+                   folded=False, silence_runtime_warnings=False):
+    '''It calculates the joint site frequency spectrum of two populations,
+       the result is a (projection1 + 1) x (projection2 + 1) array.
+
+       The projection is done as in calc_sfs. When folded the minor allele
+       is decided with the alleles of both populations, see fold_sfs.'''
+    if len(populations) != 2:
+        raise ValueError('The joint site frequency spectrum requires two populations')
+    max_nums_alleles = [len(population) * variations.ploidy
+                        for population in populations]
+    if projections is None:
+        projections = max_nums_alleles
+    if any(projection > max_num_alleles
+           for projection, max_num_alleles in zip(projections, max_nums_alleles)):
+        raise ValueError('projection should not be larger than the number of alleles')
+
+    counts = _count_alleles_and_derived_alleles(variations, populations,
+                                                max_alleles)
+
+    def _calc_joint_sfs(counts):
+        return _calc_joint_sfs_in_memory(counts, projections)
+
+    sfs = _map_blocks_and_sum_along_variations(_calc_joint_sfs, counts,
+                                               (projections[0] + 1,
+                                                projections[1] + 1))
+    sfs = compute({'sfs': sfs},
+                  silence_runtime_warnings=silence_runtime_warnings)['sfs']
+    if folded:
+        sfs = fold_sfs(sfs)
+    return sfs
@@ -0,0 +1,135 @@
+import json
+
+import zarr
+import dask.array as da
+from dask.utils import SerializableLock
+
+from variation6 import (ALT_FIELD, MAF_STAT_FIELD, MAC_STAT_FIELD,
+                        CALL_RATE_STAT_FIELD, OBS_HET_STAT_FIELD,
+                        VARIANT_STAT_FIELDS, MIN_NUM_GENOTYPES_FOR_POP_STAT)
+from variation6.in_out.zarr import (load_zarr, ALLELE_ZARR_DEFINITION_MAPPINGS,
+                                    ZARR_VARIANT_STATS_GROUP_NAME)
+from variation6.stats.diversity import (calc_maf_by_gt, calc_mac,
+                                        calc_called_gt, calc_obs_het)
+
+STAT_PARAMS_KEY = 'stat_params'
+
+
+def get_stat_params(field, max_alleles, min_num_genotypes,
+                    min_call_dp_for_het_call, max_call_dp_for_het_call):
+    '''It returns the parameters that are used to calculate the stat'''
+    if field == CALL_RATE_STAT_FIELD:
+        return {}
+    if field == OBS_HET_STAT_FIELD:
+        return {'min_num_genotypes': min_num_genotypes,
+                'min_call_dp_for_het_call': min_call_dp_for_het_call,
+                'max_call_dp_for_het_call': max_call_dp_for_het_call}
+    return {'max_alleles': max_alleles,
+            'min_num_genotypes': min_num_genotypes}
+
+
+def create_stat_fingerprint(params):
+    '''It returns the string that identifies the parameters used to
+       calculate a stat'''
+    return json.dumps(params, sort_keys=True)
+
+
+def _calc_variant_stat(variations, field, max_alleles, min_num_genotypes,
+                       min_call_dp_for_het_call, max_call_dp_for_het_call):
+    if field == MAF_STAT_FIELD:
+        return calc_maf_by_gt(variations, max_alleles=max_alleles,
+                              min_num_genotypes=min_num_genotypes)
+    elif field == MAC_STAT_FIELD:
+        return calc_mac(variations, max_alleles=max_alleles,
+                        min_num_genotypes=min_num_genotypes)
+    elif field == CALL_RATE_STAT_FIELD:
+        return calc_called_gt(variations, rates=True)
+    elif field == OBS_HET_STAT_FIELD:
+        return calc_obs_het(variations, min_num_genotypes=min_num_genotypes,
+                            min_call_dp_for_het_call=min_call_dp_for_het_call,
+                            max_call_dp_for_het_call=max_call_dp_for_het_call)
+    raise ValueError(f'Unknown variant stat: {field}')
+
+
+def calc_variant_stats(variations, max_alleles,
+                       min_num_genotypes=MIN_NUM_GENOTYPES_FOR_POP_STAT,
+                       min_call_dp_for_het_call=None,
+                       max_call_dp_for_het_call=None):
+    '''It calculates the MAF, MAC, call rate and observed heterozygosity of
+       every variation.
+
+       It returns a dict with the stats and a dict with the fingerprint of
+       the parameters used to calculate every stat.'''
+    stats = {field: _calc_variant_stat(variations, field, max_alleles,
+                                       min_num_genotypes,
+                                       min_call_dp_for_het_call,
+                                       max_call_dp_for_het_call)
+             for field in VARIANT_STAT_FIELDS}
+    fingerprints = {field: create_stat_fingerprint(get_stat_params(field,
+                                                                   max_alleles,
+                                                                   min_num_genotypes,
+                                                                   min_call_dp_for_het_call,
+                                                                   max_call_dp_for_het_call))
+                    for field in stats}
+    return stats, fingerprints
+
+
+def get_stored_variant_stat(variations, field, **params):
+    '''It returns the stored stat if it was calculated with the given
+       parameters, None otherwise'''
+    if field not in variations:
+        return None
+    field_metadata = variations.metadata.get(field) or {}
+    if field_metadata.get(STAT_PARAMS_KEY) != create_stat_fingerprint(params):
+        return None
+    return variations[field]
+
+
+def get_variant_stat(variations, field, max_alleles=None,
+                     min_num_genotypes=MIN_NUM_GENOTYPES_FOR_POP_STAT,
+                     min_call_dp_for_het_call=None,
+                     max_call_dp_for_het_call=None):
+    '''It returns the stored stat if it was calculated with the same
+       parameters, otherwise it calculates it from the genotypes'''
+    params = get_stat_params(field, max_alleles, min_num_genotypes,
+                             min_call_dp_for_het_call,
+                             max_call_dp_for_het_call)
+    stat = get_stored_variant_stat(variations, field, **params)
+    if stat is None:
+        stat = _calc_variant_stat(variations, field, max_alleles,
+                                  min_num_genotypes, min_call_dp_for_het_call,
+                                  max_call_dp_for_het_call)
+    return stat
+
+
+def store_variant_stats(zarr_path, max_alleles=None,
+                        min_num_genotypes=MIN_NUM_GENOTYPES_FOR_POP_STAT,
+                        min_call_dp_for_het_call=None,
+                        max_call_dp_for_het_call=None):
+    '''It calculates the per variation stats of a zarr store and adds them
+       to it, so that the filters can read them instead of calculating them
+       from the genotypes.
+
+       If max_alleles is not given it is taken from the ALT field.'''
+    variations = load_zarr(zarr_path)
+    if max_alleles is None:
+        max_alleles = variations[ALT_FIELD].shape[1]
+    stats, fingerprints = calc_variant_stats(variations, max_alleles,
+                                             min_num_genotypes=min_num_genotypes,
+                                             min_call_dp_for_het_call=min_call_dp_for_het_call,
+                                             max_call_dp_for_het_call=max_call_dp_for_het_call)
+
+    root = zarr.open_group(str(zarr_path), mode='r+')
+    group = root.create_group(ZARR_VARIANT_STATS_GROUP_NAME, overwrite=True)
+    sources = []
+    targets = []
+    for field, array in stats.items():
+        array = array.astype(float)
+        zarr_field = ALLELE_ZARR_DEFINITION_MAPPINGS[field]['field']
+        dataset = group.create_dataset(zarr_field, shape=array.shape,
+                                       dtype=array.dtype,
+                                       chunks=array.chunksize)
+        dataset.attrs[STAT_PARAMS_KEY] = fingerprints[field]
+        sources.append(array)
+        targets.append(dataset)
+    da.store(sources, targets, lock=SerializableLock())
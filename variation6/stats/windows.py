@@ -0,0 +1,365 @@
+import math
+
+import dask
+import dask.array as da
+import numpy as np
+
+import variation6.array as va
+from variation6 import (CHROM_FIELD, POS_FIELD,
+                        MIN_NUM_GENOTYPES_FOR_POP_STAT)
+from variation6.stats.diversity import (calc_missing_gt, calc_maf_by_gt,
+                                        calc_obs_het, calc_expected_het,
+                                        calc_unbias_expected_het,
+                                        count_alleles_in_variations,
+                                        MIN_DP_FOR_CALL_HET)
+from variation6.stats.regions import prepare_values_to_sum
+
+WINDOW_CHROM = 'chrom'
+WINDOW_START = 'start'
+WINDOW_END = 'end'
+WINDOW_NUM_VARIATIONS = 'num_variations'
+WINDOW_SUMS = 'sums'
+WINDOW_NUM_VALUES = 'num_values'
+
+WINDOW_PI = 'pi'
+WINDOW_EXP_HET = 'exp_het'
+WINDOW_OBS_HET = 'obs_het'
+WINDOW_NUM_POLYMORPHIC_VARS = 'num_polymorphic_vars'
+WINDOW_MISSING_GT_RATE = 'missing_gt_rate'
+WINDOW_THETA_W = 'theta_w'
+WINDOW_TAJIMA_D = 'tajima_d'
+WINDOW_NUM_SEGREGATING_SITES = 'num_segregating_sites'
+
+_BIN_CHROMS = 'chroms'
+_BIN_IDXS = 'bin_idxs'
+_BIN_MIN_POSS = 'min_poss'
+_BIN_MAX_POSS = 'max_poss'
+_BIN_VALUES = 'values'
+
+
+def _get_chrom_codes_in_appearance_order(chroms):
+    _, first_idxs, codes = np.unique(chroms, return_index=True,
+                                     return_inverse=True)
+    ranks = np.empty(first_idxs.size, dtype=np.int64)
+    ranks[np.argsort(first_idxs)] = np.arange(first_idxs.size)
+    return ranks[codes]
+
+
+def _reduce_bins(chroms, bin_idxs, min_poss, max_poss, values):
+    if not chroms.size:
+        return {_BIN_CHROMS: chroms, _BIN_IDXS: bin_idxs,
+                _BIN_MIN_POSS: min_poss, _BIN_MAX_POSS: max_poss,
+                _BIN_VALUES: values}
+
+    order = np.lexsort((bin_idxs, _get_chrom_codes_in_appearance_order(chroms)))
+    chroms, bin_idxs = chroms[order], bin_idxs[order]
+    is_bin_start = np.ones(chroms.size, dtype=bool)
+    is_bin_start[1:] = np.logical_or(chroms[1:] != chroms[:-1],
+                                     bin_idxs[1:] != bin_idxs[:-1])
+    bin_starts = np.flatnonzero(is_bin_start)
+    return {_BIN_CHROMS: chroms[bin_starts],
+            _BIN_IDXS: bin_idxs[bin_starts],
+            _BIN_MIN_POSS: np.minimum.reduceat(min_poss[order], bin_starts),
+            _BIN_MAX_POSS: np.maximum.reduceat(max_poss[order], bin_starts),
+            _BIN_VALUES: np.add.reduceat(values[order], bin_starts, axis=0)}
+
+
+def _get_chrom_runs_summary(chroms):
+    if not chroms.size:
+        return None
+    run_starts = np.flatnonzero(chroms[1:] != chroms[:-1]) + 1
+    last_run_start = run_starts[-1] if run_starts.size else 0
+    return chroms[0], chroms[-1], chroms.size - last_run_start, chroms.size
+
+
+def _calc_first_run_offsets(summaries):
+    # number of variations of the chromosome of the first variation of every
+    # chunk found in the previous chunks
+    offsets = []
+    run_chrom, run_length = None, 0
+    for summary in summaries:
+        if summary is None:
+            offsets.append(0)
+            continue
+        first_chrom, last_chrom, last_run_length, num_vars = summary
+        is_same_run = first_chrom == run_chrom
+        offsets.append(run_length if is_same_run else 0)
+        if is_same_run and last_run_length == num_vars:
+            run_length += num_vars
+        else:
+            run_chrom, run_length = last_chrom, last_run_length
+    return offsets
+
+
+def _calc_bin_sums_in_memory(chroms, poss, stats, bin_size, by_snps,
+                             first_run_offsets=None, chunk_idx=0):
+    values = prepare_values_to_sum(stats)
+    if by_snps:
+        is_run_start = np.ones(chroms.size, dtype=bool)
+        is_run_start[1:] = chroms[1:] != chroms[:-1]
+        run_ids = np.cumsum(is_run_start) - 1
+        ordinals = np.arange(chroms.size) - np.flatnonzero(is_run_start)[run_ids]
+        if first_run_offsets is not None:
+            ordinals[run_ids == 0] += first_run_offsets[chunk_idx]
+        bin_idxs = ordinals // bin_size
+    else:
+        bin_idxs = poss // bin_size
+    return _reduce_bins(chroms, bin_idxs.astype(np.int64), poss, poss, values)
+
+
+def _merge_bin_sums(bin_sums):
+    # the bins split between chunks are added
+    bin_sums = [sums for sums in bin_sums if sums[_BIN_CHROMS].size]
+    if not bin_sums:
+        return None
+    return _reduce_bins(*[np.concatenate([sums[key] for sums in bin_sums])
+                          for key in (_BIN_CHROMS, _BIN_IDXS, _BIN_MIN_POSS,
+                                      _BIN_MAX_POSS, _BIN_VALUES)])
+
+
+def _calc_windows_from_bins(bin_sums, window_size, step, by_snps, num_stats):
+    num_cols = 1 + 2 * num_stats
+    table = {WINDOW_CHROM: [], WINDOW_START: [], WINDOW_END: [],
+             WINDOW_NUM_VARIATIONS: [], WINDOW_SUMS: [], WINDOW_NUM_VALUES: []}
+    bins_per_window = window_size // step
+    if bin_sums is not None:
+        chroms = bin_sums[_BIN_CHROMS]
+        chrom_starts = np.flatnonzero(np.concatenate([[True],
+                                                      chroms[1:] != chroms[:-1]]))
+        chrom_ends = np.append(chrom_starts[1:], chroms.size)
+    else:
+        chrom_starts, chrom_ends = [], []
+
+    for chrom_start, chrom_end in zip(chrom_starts, chrom_ends):
+        bin_idxs = bin_sums[_BIN_IDXS][chrom_start:chrom_end]
+        num_bins = bin_idxs.max() + 1
+        cum_values = np.zeros((num_bins + 1, num_cols))
+        cum_values[bin_idxs + 1] = bin_sums[_BIN_VALUES][chrom_start:chrom_end]
+        np.cumsum(cum_values, axis=0, out=cum_values)
+
+        num_windows = max(1, num_bins - bins_per_window + 1)
+        first_bins = np.arange(num_windows)
+        last_bins = np.minimum(first_bins + bins_per_window, num_bins)
+        window_values = cum_values[last_bins] - cum_values[first_bins]
+
+        if by_snps:
+            # every bin has variations
+            starts = bin_sums[_BIN_MIN_POSS][chrom_start:chrom_end][first_bins]
+            ends = bin_sums[_BIN_MAX_POSS][chrom_start:chrom_end][last_bins - 1] + 1
+        else:
+            starts = first_bins * step
+            ends = starts + window_size
+
+        table[WINDOW_CHROM].append(np.repeat(chroms[chrom_start], num_windows))
+        table[WINDOW_START].append(starts)
+        table[WINDOW_END].append(ends)
+        table[WINDOW_NUM_VARIATIONS].append(window_values[:, 0])
+        table[WINDOW_SUMS].append(window_values[:, 1: 1 + num_stats])
+        table[WINDOW_NUM_VALUES].append(window_values[:, 1 + num_stats:])
+
+    if not table[WINDOW_CHROM]:
+        return {WINDOW_CHROM: np.array([]),
+                WINDOW_START: np.array([], dtype=np.int64),
+                WINDOW_END: np.array([], dtype=np.int64),
+                WINDOW_NUM_VARIATIONS: np.array([], dtype=np.int64),
+                WINDOW_SUMS: np.empty((0, num_stats)),
+                WINDOW_NUM_VALUES: np.empty((0, num_stats), dtype=np.int64)}
+    table = {key: np.concatenate(columns) for key, columns in table.items()}
+    for key in (WINDOW_START, WINDOW_END):
+        table[key] = table[key].astype(np.int64)
+    for key in (WINDOW_NUM_VARIATIONS, WINDOW_NUM_VALUES):
+        table[key] = np.round(table[key]).astype(np.int64)
+    return table
+
+
+def _has_known_chunks(array):
+    return not any(math.isnan(chunk) for chunk in array.chunks[0])
+
+
+def calc_window_sums(variations, stats, window_size, step=None, by_snps=False):
+    '''It adds the given per variation stats in sliding windows.
+
+       The windows are window_size bp long or, if by_snps, hold window_size
+       consecutive variations of a chromosome, and start every step bp or
+       variations. Each chunk reduces its variations to step sized bins and
+       the bins split between chunks are merged before adding them into
+       windows, so window_size has to be a multiple of step. The variations
+       should be sorted by chromosome and position.
+
+       The result is a table with a row per window with its chrom, start,
+       end (excluded) and number of variations and, per stat, the sum and
+       number of values that are not nan.'''
+    if step is None:
+        step = window_size
+    if window_size % step:
+        raise ValueError('The window size should be a multiple of the step')
+
+    chroms = variations[CHROM_FIELD]
+    poss = variations[POS_FIELD]
+    num_stats = len(stats)
+    stats = va.stack([stat.astype(np.float64) for stat in stats], axis=1,
+                     as_type_of=stats[0])
+
+    if not isinstance(chroms, da.Array):
+        bin_sums = _calc_bin_sums_in_memory(chroms, poss, stats, step, by_snps)
+        return _calc_windows_from_bins(_merge_bin_sums([bin_sums]),
+                                       window_size, step, by_snps, num_stats)
+
+    if _has_known_chunks(chroms) and _has_known_chunks(stats):
+        poss = poss.rechunk({0: chroms.chunks[0]})
+        stats = stats.rechunk({0: chroms.chunks[0], 1: -1})
+    else:
+        stats = stats.rechunk({1: -1})
+    chrom_chunks = chroms.to_delayed().ravel()
+    pos_chunks = poss.to_delayed().ravel()
+    stat_chunks = stats.to_delayed().ravel()
+
+    first_run_offsets = None
+    if by_snps:
+        summaries = [dask.delayed(_get_chrom_runs_summary)(chrom_chunk)
+                     for chrom_chunk in chrom_chunks]
+        first_run_offsets = dask.delayed(_calc_first_run_offsets)(summaries)
+
+    bin_sums = [dask.delayed(_calc_bin_sums_in_memory)(
+                    chrom_chunk, pos_chunk, stat_chunk, step, by_snps,
+                    first_run_offsets, chunk_idx)
+                for chunk_idx, (chrom_chunk, pos_chunk, stat_chunk)
+                in enumerate(zip(chrom_chunks, pos_chunks, stat_chunks))]
+    bin_sums = dask.delayed(_merge_bin_sums)(bin_sums)
+    return dask.delayed(_calc_windows_from_bins)(bin_sums, window_size, step,
+                                                 by_snps, num_stats)
+
+
+def _calc_diversities_from_window_sums(window_sums):
+    sums = window_sums[WINDOW_SUMS]
+    num_values = window_sums[WINDOW_NUM_VALUES]
+    window_lengths = window_sums[WINDOW_END] - window_sums[WINDOW_START]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / num_values
+        diversities = {WINDOW_PI: sums[:, 0] / window_lengths,
+                       WINDOW_EXP_HET: means[:, 1],
+                       WINDOW_OBS_HET: means[:, 2],
+                       WINDOW_NUM_POLYMORPHIC_VARS: sums[:, 3].astype(np.int64),
+                       WINDOW_MISSING_GT_RATE: means[:, 4]}
+    table = {key: window_sums[key] for key in (WINDOW_CHROM, WINDOW_START,
+                                               WINDOW_END,
+                                               WINDOW_NUM_VARIATIONS)}
+    table.update(diversities)
+    return table
+
+
+def calc_diversities_by_window(variations, max_alleles, window_size,
+                               step=None, by_snps=False,
+                               min_num_genotypes=MIN_NUM_GENOTYPES_FOR_POP_STAT,
+                               min_call_dp_for_het_call=MIN_DP_FOR_CALL_HET,
+                               polymorphic_threshold=0.95):
+    '''It calculates, per window, pi (the unbiased expected het per bp), the
+       mean expected and observed het, the number of polymorphic variations
+       and the mean missing gt rate.'''
+    mafs = calc_maf_by_gt(variations, max_alleles,
+                          min_num_genotypes=min_num_genotypes)
+    is_polymorphic = va.logical_and(mafs <= polymorphic_threshold,
+                                    va.logical_not(va.isnan(mafs)))
+    stats = [calc_unbias_expected_het(variations, max_alleles=max_alleles,
+                                      min_num_genotypes=min_num_genotypes),
+             calc_expected_het(variations, max_alleles=max_alleles,
+                               min_num_genotypes=min_num_genotypes),
+             calc_obs_het(variations, min_num_genotypes=min_num_genotypes,
+                          min_call_dp_for_het_call=min_call_dp_for_het_call),
+             is_polymorphic,
+             calc_missing_gt(variations, rates=True)]
+    window_sums = calc_window_sums(variations, stats, window_size, step=step,
+                                   by_snps=by_snps)
+    if isinstance(window_sums, dict):
+        return _calc_diversities_from_window_sums(window_sums)
+    return dask.delayed(_calc_diversities_from_window_sums)(window_sums)
+
+
+def _calc_harmonic_sums(num_alleles, power=1):
+    # sum of 1 / i ** power for i in 1..n - 1, 0 for n < 2
+    num_alleles = np.asarray(num_alleles, dtype=np.int64)
+    max_num_alleles = max(int(np.max(num_alleles, initial=0)), 1)
+    sums = np.zeros(max_num_alleles + 1)
+    sums[2:] = np.cumsum(1 / np.arange(1, max_num_alleles) ** power)
+    return sums[np.clip(num_alleles, 0, None)]
+
+
+def _calc_neutrality_stats_per_site_in_memory(allele_counts):
+    # per site: mean pairwise differences, watterson contribution, if
+    # segregating and the number of called alleles of the segregating sites
+    num_alleles = np.sum(allele_counts, axis=1)
+    is_segregating = np.sum(allele_counts > 0, axis=1) >= 2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pairwise_diffs = ((num_alleles ** 2 - np.sum(allele_counts ** 2, axis=1)) /
+                          (num_alleles * (num_alleles - 1)))
+        watterson = is_segregating / _calc_harmonic_sums(num_alleles)
+    pairwise_diffs[num_alleles < 2] = np.nan
+    watterson[num_alleles < 2] = np.nan
+    segregating_num_alleles = np.where(is_segregating, num_alleles, np.nan)
+    return np.stack([pairwise_diffs, watterson, is_segregating,
+                     segregating_num_alleles], axis=1).astype(np.float64)
+
+
+def _calc_tajima_d(pi, theta_w, num_segregating_sites, num_alleles):
+    num_alleles = np.round(num_alleles)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        a1 = _calc_harmonic_sums(np.nan_to_num(num_alleles))
+        a2 = _calc_harmonic_sums(np.nan_to_num(num_alleles), power=2)
+        b1 = (num_alleles + 1) / (3 * (num_alleles - 1))
+        b2 = (2 * (num_alleles ** 2 + num_alleles + 3) /
+              (9 * num_alleles * (num_alleles - 1)))
+        c1 = b1 - 1 / a1
+        c2 = b2 - (num_alleles + 2) / (a1 * num_alleles) + a2 / a1 ** 2
+        e1 = c1 / a1
+        e2 = c2 / (a1 ** 2 + a2)
+        variance = (e1 * num_segregating_sites +
+                    e2 * num_segregating_sites * (num_segregating_sites - 1))
+        tajima_d = (pi - theta_w) / np.sqrt(variance)
+    tajima_d[np.logical_or(num_segregating_sites == 0, ~(variance > 0))] = np.nan
+    return tajima_d
+
+
+def _calc_neutrality_stats_from_window_sums(window_sums):
+    sums = window_sums[WINDOW_SUMS]
+    num_values = window_sums[WINDOW_NUM_VALUES]
+    window_lengths = window_sums[WINDOW_END] - window_sums[WINDOW_START]
+    num_segregating_sites = np.round(sums[:, 2]).astype(np.int64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_num_alleles = sums[:, 3] / num_values[:, 3]
+    table = {key: window_sums[key] for key in (WINDOW_CHROM, WINDOW_START,
+                                               WINDOW_END,
+                                               WINDOW_NUM_VARIATIONS)}
+    table[WINDOW_PI] = sums[:, 0] / window_lengths
+    table[WINDOW_THETA_W] = sums[:, 1] / window_lengths
+    table[WINDOW_NUM_SEGREGATING_SITES] = num_segregating_sites
+    table[WINDOW_TAJIMA_D] = _calc_tajima_d(sums[:, 0], sums[:, 1],
+                                            num_segregating_sites,
+                                            mean_num_alleles)
+    return table
+
+
+def calc_neutrality_stats_by_window(variations, max_alleles, window_size,
+                                    step=None, by_snps=False):
+    '''It calculates, per window, pi and Watterson's theta per bp, the
+       number of segregating sites and Tajima's D.
+
+       Every site uses its own number of called alleles, so missing data
+       only reduces its sample size: pi adds the mean pairwise differences
+       of every site and theta adds 1 / a_n per segregating site. Tajima's D
+       variance uses the mean number of called alleles of the segregating
+       sites of the window.'''
+    allele_counts = count_alleles_in_variations(variations, max_alleles,
+                                                count_missing=False)
+    if isinstance(allele_counts, da.Array):
+        allele_counts = allele_counts.rechunk({1: -1})
+        site_stats = da.map_blocks(_calc_neutrality_stats_per_site_in_memory,
+                                   allele_counts, dtype=np.float64,
+                                   chunks=(allele_counts.chunks[0], (4,)))
+    else:
+        site_stats = _calc_neutrality_stats_per_site_in_memory(allele_counts)
+    stats = [site_stats[:, idx] for idx in range(4)]
+    window_sums = calc_window_sums(variations, stats, window_size, step=step,
+                                   by_snps=by_snps)
+    if isinstance(window_sums, dict):
+        return _calc_neutrality_stats_from_window_sums(window_sums)
+    return dask.delayed(_calc_neutrality_stats_from_window_sums)(window_sums)
@@ -41,6 +41,62 @@ class ArrayCalculationTest(unittest.TestCase):
         task = va.isnan(da_array)
         self.assertTrue(np.all(task.compute() == expected))
 
+    def test_histogram(self):
+        rng = np.random.default_rng(7)
+        np_array = rng.random(100) * 10
+        np_array[::7] = np.nan
+        expected = np.histogram(np_array[~np.isnan(np_array)], bins=7,
+                                range=(0, 10))
+        da_array = da.from_array(np_array, chunks=13)
+        for array in (np_array, da_array):
+            counts, edges = va.histogram(array, n_bins=7, limits=(0, 10))
+            self.assertTrue(np.array_equal(da.compute(counts)[0], expected[0]))
+            self.assertTrue(np.allclose(edges, expected[1]))
+
+        # the values at the limits, the missing ints and the weights
+        counts, _ = va.histogram(np.array([0, 1, 2, 2, -1, 5]), n_bins=2,
+                                 limits=(0, 2))
+        self.assertTrue(np.array_equal(counts, [1, 3]))
+        counts, _ = va.histogram(da.from_array(np.array([0.5, 1.5, np.nan])),
+                                 n_bins=2, limits=(0, 2),
+                                 weights=da.from_array(np.array([2, 3, 4])))
+        self.assertTrue(np.array_equal(counts.compute(), [2, 3]))
+
+        counts, edges = va.histogram(np.array([1, 2, 3]), n_bins=2,
+                                     limits=None)
+        self.assertTrue(np.allclose(edges, [1, 2, 3]))
+
+    def test_histogram2d(self):
+        rng = np.random.default_rng(8)
+        np_array1, np_array2 = rng.random(50), rng.random(50) * 2
+        np_array1[3] = np.nan
+        is_valid = ~np.isnan(np_array1)
+        expected = np.histogram2d(np_array1[is_valid], np_array2[is_valid],
+                                  bins=(4, 3), range=((0, 1), (0, 2)))[0]
+        for array1, array2 in ((np_array1, np_array2),
+                               (da.from_array(np_array1, chunks=9),
+                                da.from_array(np_array2, chunks=9))):
+            counts, _, _ = va.histogram2d(array1, array2, n_bins=(4, 3),
+                                          limits=((0, 1), (0, 2)))
+            self.assertTrue(np.array_equal(da.compute(counts)[0], expected))
+
+    def test_histogram_accumulator(self):
+        np_array = np.arange(10)
+        histogram = va.HistogramAccumulator.from_limits(n_bins=2,
+                                                        limits=(0, 10))
+        histogram.add(np_array[:4])
+        histogram.add(da.from_array(np_array[4:], chunks=3))
+        other = va.HistogramAccumulator(histogram.bin_edges)
+        other.add(np_array)
+        self.assertTrue(np.array_equal(histogram.counts, [5, 5]))
+        self.assertTrue(np.array_equal((histogram + other).counts, [10, 10]))
+        histogram.merge(other)
+        self.assertTrue(np.array_equal(histogram.counts, [10, 10]))
+
+        with self.assertRaises(ValueError):
+            histogram.merge(va.HistogramAccumulator.from_limits(n_bins=3,
+                                                                limits=(0, 10)))
+
     def test_amax(self):
         np_array = np.array([1, 2, 3, 4, 5])
         self.assertEqual(va.amax(np_array), 5)
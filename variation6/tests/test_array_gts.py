@@ -1,5 +1,6 @@
 import unittest
 import numpy as np
+import dask.array as da
 import variation6.array as va
 from variation6.in_out.zarr import load_zarr
 from variation6.tests import TEST_DATA_DIR
@@ -30,6 +31,68 @@ class MultivariateTest(unittest.TestCase):
         self.assertTrue(np.allclose(expected, gts012))
 
 
+class PackedGtsTest(unittest.TestCase):
+
+    def _get_gts(self):
+        a = np.array([[-1, -1], [0, 0], [0, 1], [0, 0], [0, 0], [0, 1]])
+        b = np.array([[1, 1], [-1, -1], [0, 0], [0, 0], [1, 1], [0, 1]])
+        c = np.array([[1, 1], [0, 1], [1, 0], [1, 1], [1, 1], [-1, -1]])
+        d = np.full(shape=(6, 2), fill_value=1)
+        e = np.array([[0, 0], [1, 1], [0, 0], [0, 1], [-1, -1], [1, 1]])
+        gts = np.stack((a, b, c, d, e), axis=1).astype(np.int8)
+        return gts
+
+    def test_pack_unpack(self):
+        gts = self._get_gts()
+        packed = va.pack_gts(gts)
+        self.assertEqual(packed.shape, (6, 2))
+        self.assertEqual(packed.dtype, np.uint8)
+
+        expected = gts.copy()
+        expected[gts[:, :, 0] > gts[:, :, 1]] = [0, 1]
+        expected[np.any(gts == -1, axis=2)] = -1
+        self.assertTrue(np.all(va.unpack_gts(packed, 5) == expected))
+
+        dask_packed = va.pack_gts(da.from_array(gts, chunks=(4, 2, 2)))
+        self.assertEqual(dask_packed.chunks, ((4, 2), (2,)))
+        self.assertTrue(np.all(dask_packed.compute() == packed))
+        unpacked = va.unpack_gts(dask_packed, 5)
+        self.assertTrue(np.all(unpacked.compute() == expected))
+
+        with self.assertRaises(ValueError):
+            va.pack_gts(np.array([[[0, 2]]]))
+        # the partially missing calls would be packed as missing
+        with self.assertRaises(ValueError):
+            va.pack_gts(np.array([[[0, -1]]]))
+
+    def test_packed_counts(self):
+        gts = self._get_gts()
+        packed = va.pack_gts(gts)
+        counts = va.count_packed_gts(packed, num_samples=5)
+        expected = [[1, 0, 3, 1], [1, 1, 2, 1], [2, 2, 1, 0], [2, 1, 2, 0],
+                    [1, 0, 3, 1], [0, 2, 2, 1]]
+        self.assertTrue(np.all(counts == expected))
+
+        counts = va.count_alleles_packed(da.from_array(packed, chunks=(4, 2)),
+                                         num_samples=5, max_alleles=3)
+        expected = [[2, 6, 0, 2], [3, 5, 0, 2], [6, 4, 0, 0], [5, 5, 0, 0],
+                    [2, 6, 0, 2], [2, 6, 0, 2]]
+        self.assertTrue(np.all(counts.compute() == expected))
+
+    def test_packed_kosman(self):
+        gts = self._get_gts()
+        packed = va.pack_gts(gts)
+        sums = va.calc_kosman_sums_packed(packed, num_samples=5)
+        dask_sums = va.calc_kosman_sums_packed(da.from_array(packed,
+                                                             chunks=(4, 2)),
+                                               num_samples=5).compute()
+        self.assertTrue(np.allclose(sums, dask_sums))
+        # a vs b: called in both in 4 snps, distances 0.5, 0, 1, 0
+        self.assertTrue(np.allclose(sums[0], [1.5, 4]))
+        # c vs d: 0.5 in the two hets, c last call missing
+        self.assertTrue(np.allclose(sums[7], [1, 5]))
+
+
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
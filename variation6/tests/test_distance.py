@@ -6,9 +6,10 @@ import dask.array as da
 import variation6.array as va
 from variation6.stats.distance import (calc_kosman_dist, _kosman,
                                        calc_pop_pairwise_unbiased_nei_dists,
-                                       calc_dset_pop_distance)
+                                       calc_dset_pop_distance,
+                                       calc_pop_pairwise_nei_dists_by_depth)
 from variation6.variations import Variations
-from variation6 import GT_FIELD, FLT_VARS, DP_FIELD
+from variation6 import GT_FIELD, FLT_VARS, DP_FIELD, AD_FIELD
 from variation6.filters import keep_samples
 from variation6.compute import compute
 
@@ -325,6 +326,24 @@ class NeiUnbiasedDistTest(unittest.TestCase):
         assert math.isclose(dists[0], 0.3726315908494797)
 
 
+class NeiByDepthDistTest(unittest.TestCase):
+
+    def test_nei_dist_by_depth(self):
+        ads = np.array([[[10, 0], [5, 5], [0, 10], [-1, -1]],
+                        [[-1, -1], [-1, -1], [-1, -1], [-1, -1]]])
+        pops = [[1, 2], [3, 4]]
+        for in_memory in (True, False):
+            variations = Variations()
+            samples = np.array([1, 2, 3, 4])
+            variations.samples = samples if in_memory else da.from_array(samples)
+            variations[AD_FIELD] = ads if in_memory else da.from_array(ads)
+            dists = calc_pop_pairwise_nei_dists_by_depth(variations,
+                                                         populations=pops,
+                                                         silence_runtime_warnings=True)
+            # pop freqs: [0.75, 0.25] and [0, 1]
+            assert math.isclose(dists[0], -math.log(0.25 / math.sqrt(0.625)))
+
+
 class DsetDistTest(unittest.TestCase):
 
     def test_dest_jost_distance(self):
@@ -25,7 +25,11 @@ from variation6.stats.diversity import (calc_missing_gt, calc_maf_by_gt,
                                         calc_allele_freq, calc_diversities,
                                         calc_unbias_expected_het,
                                         summarize_variations,
-                                        calc_missing_gt_per_sample)
+                                        calc_summary_histograms, calc_called_gt,
+                                        SUMMARY_CALLED, SUMMARY_MAC,
+                                        SUMMARY_MAF, SUMMARY_OBS_HET,
+                                        calc_missing_gt_per_sample,
+                                        count_alleles_by_population)
 from variation6.filters import remove_low_call_rate_vars, keep_samples
 
 
@@ -54,6 +58,30 @@ class StatsTest(unittest.TestCase):
                     [0, 0, 0, 6], [1, 1, 0, 4], [1, 3, 0, 2]]
         self.assertTrue(np.all(expected == counts.compute()))
 
+    def test_allele_count_chunked_by_samples(self):
+        variations = create_dask_variations(num_vars_per_chunk=3,
+                                            num_samples_per_chunk=1)
+        gts = variations[GT_FIELD]
+        self.assertEqual(gts.numblocks[:2], (3, 3))
+        expected = [[2, 2, 0, 2], [2, 2, 0, 2], [2, 2, 0, 2], [3, 1, 0, 2, ],
+                    [0, 0, 0, 6], [1, 1, 0, 4], [1, 3, 0, 2]]
+        counts = count_alleles(gts, max_alleles=3)
+        self.assertEqual(counts.chunks, ((3, 3, 1), (4,)))
+        self.assertTrue(np.all(expected == counts.compute()))
+
+        one_chunk_variations = create_dask_variations()
+        max_alleles = variations[ALT_FIELD].shape[1]
+        for calc_stat in (calc_mac, calc_maf_by_gt):
+            np.testing.assert_allclose(
+                calc_stat(variations, max_alleles=max_alleles,
+                          min_num_genotypes=0).compute(),
+                calc_stat(one_chunk_variations, max_alleles=max_alleles,
+                          min_num_genotypes=0).compute(), equal_nan=True)
+        np.testing.assert_allclose(
+            calc_obs_het(variations, min_num_genotypes=0).compute(),
+            calc_obs_het(one_chunk_variations, min_num_genotypes=0).compute(),
+            equal_nan=True)
+
     def test_empty_gt_allele_count(self):
         gts = np.array([])
         with self.assertRaises(EmptyVariationsError):
@@ -368,6 +396,116 @@ class ObsHetTest(unittest.TestCase):
         assert np.allclose(het, [0.5, 0])
 
 
+class SparseGtsTest(unittest.TestCase):
+
+    def _create_variations(self):
+        gts = np.array([[[0, 0], [0, 1], [0, -1], [-1, -1], [0, 0]],
+                        [[0, 0], [0, 0], [0, 0], [0, 0], [1, 1]],
+                        [[0, 0], [0, 0], [0, 0], [0, 0], [0, 0]],
+                        [[2, 2], [1, 2], [0, 0], [1, 1], [0, 2]]],
+                       dtype=np.int8)
+        dps = np.array([[5, 12, 10, 10, 10],
+                        [10, 10, 10, 10, 10],
+                        [10, 10, 10, 10, 10],
+                        [10, 10, 4, 10, 20]])
+        samples = np.array([str(i) for i in range(gts.shape[1])])
+        dense = Variations(samples=samples)
+        dense[GT_FIELD] = gts
+        dense[DP_FIELD] = dps
+        sparse = Variations(samples=samples)
+        sparse[GT_FIELD] = va.SparseGenotypes.from_dense(gts)
+        sparse[DP_FIELD] = dps
+        return dense, sparse
+
+    def test_sparse_gts(self):
+        dense, sparse = self._create_variations()
+        gts = dense[GT_FIELD]
+        self.assertTrue(np.all(sparse[GT_FIELD].to_dense() == gts))
+        self.assertTrue(np.all(va.gts_as_mat012(sparse[GT_FIELD]) ==
+                               va.gts_as_mat012(gts)))
+
+        sub_gts = sparse.get_vars([True, False, False, True])[GT_FIELD]
+        self.assertTrue(np.all(sub_gts.to_dense() == gts[[0, 3]]))
+        self.assertTrue(np.all(sparse[GT_FIELD][1:3].to_dense() == gts[1:3]))
+
+    def test_iterate_sparse_gts(self):
+        dense, sparse = self._create_variations()
+        self.assertEqual(sparse[GT_FIELD].nbytes,
+                         sum(array.nbytes for array in (sparse[GT_FIELD].indptr,
+                                                        sparse[GT_FIELD].indices,
+                                                        sparse[GT_FIELD].calls)))
+        chunks = list(sparse.iterate_chunks())
+        self.assertEqual(len(chunks), 1)
+        self.assertTrue(np.all(chunks[0][GT_FIELD].to_dense() ==
+                               dense[GT_FIELD]))
+
+        chunks = list(sparse.iterate_computed_chunks())
+        self.assertEqual(len(chunks), 1)
+        self.assertTrue(np.all(chunks[0][GT_FIELD].to_dense() ==
+                               dense[GT_FIELD]))
+
+    def test_sparse_stats(self):
+        dense, sparse = self._create_variations()
+
+        for count_missing in (True, False):
+            expected = count_alleles(dense[GT_FIELD], max_alleles=3,
+                                     count_missing=count_missing)
+            counts = count_alleles(sparse[GT_FIELD], max_alleles=3,
+                                   count_missing=count_missing)
+            self.assertTrue(np.all(counts == expected))
+
+        for rates in (True, False):
+            self.assertTrue(np.allclose(calc_missing_gt(sparse, rates=rates),
+                                        calc_missing_gt(dense, rates=rates)))
+            self.assertTrue(np.allclose(
+                calc_missing_gt_per_sample(sparse, rates=rates),
+                calc_missing_gt_per_sample(dense, rates=rates)))
+
+        for kwargs in ({}, {'min_call_dp_for_het_call': 10},
+                       {'max_call_dp_for_het_call': 11}):
+            self.assertTrue(np.allclose(calc_obs_het(sparse, min_num_genotypes=0,
+                                                     **kwargs),
+                                        calc_obs_het(dense, min_num_genotypes=0,
+                                                     **kwargs),
+                                        equal_nan=True))
+
+        self.assertTrue(np.allclose(calc_mac(sparse, max_alleles=3,
+                                             min_num_genotypes=0),
+                                    calc_mac(dense, max_alleles=3,
+                                             min_num_genotypes=0),
+                                    equal_nan=True))
+        self.assertTrue(np.allclose(calc_maf_by_gt(sparse, max_alleles=3,
+                                                   min_num_genotypes=0),
+                                    calc_maf_by_gt(dense, max_alleles=3,
+                                                   min_num_genotypes=0),
+                                    equal_nan=True))
+
+
+class AlleleCountsByPopulationTest(unittest.TestCase):
+
+    def test_count_alleles_by_population(self):
+        gts = np.array([[[0, 0], [0, 1], [1, -1], [1, 1], [0, 2]],
+                        [[-1, -1], [0, 0], [0, 0], [1, 1], [2, 2]]])
+        populations = [['a', 'c'], ['e', b'b']]
+        expected = [[[2, 1, 0, 1], [2, 1, 1, 0]],
+                    [[2, 0, 0, 2], [2, 0, 2, 0]]]
+        samples = np.array(['a', 'b', 'c', 'd', 'e'])
+        for in_memory in (True, False):
+            if in_memory:
+                variations = Variations(samples=samples)
+                variations[GT_FIELD] = gts
+            else:
+                variations = Variations(samples=da.from_array(samples))
+                variations[GT_FIELD] = da.from_array(gts, chunks=(1, 2, 2))
+            counts = count_alleles_by_population(variations, populations,
+                                                 max_alleles=3)
+            counts = va.make_sure_array_is_in_memory(counts)
+            self.assertTrue(np.all(counts == expected))
+
+        with self.assertRaises(ValueError):
+            count_alleles_by_population(variations, [['z']], max_alleles=3)
+
+
 class AlleleFreqTests(unittest.TestCase):
 
     def test_allele_freq(self):
@@ -510,6 +648,35 @@ class SummarizeStatsTests(unittest.TestCase):
                              draw_maf=False,
                              silence_runtime_warnings=True)
 
+    def test_summary_histograms(self):
+        variations = create_dask_variations(num_vars_per_chunk=2)
+        for in_memory in (False, True):
+            if in_memory:
+                variations = compute({'vars': variations},
+                                     store_variation_to_memory=True)['vars']
+            histograms = calc_summary_histograms(variations, max_alleles=3,
+                                                 min_call_dp_for_het_call=5,
+                                                 min_num_genotypes=2,
+                                                 num_bins=5)
+            stats = {SUMMARY_CALLED: calc_called_gt(variations, rates=True),
+                     SUMMARY_MAC: calc_mac(variations, max_alleles=3,
+                                           min_num_genotypes=2),
+                     SUMMARY_MAF: calc_maf_by_gt(variations, max_alleles=3,
+                                                 min_num_genotypes=2),
+                     SUMMARY_OBS_HET: calc_obs_het(variations,
+                                                   min_num_genotypes=2,
+                                                   min_call_dp_for_het_call=5)}
+            expected = {}
+            for kind, values in stats.items():
+                limits = (0, 3) if kind == SUMMARY_MAC else (0, 1)
+                counts, _ = va.histogram(values, n_bins=5, limits=limits)
+                expected[kind] = counts
+            result = compute({'histograms': histograms, 'expected': expected},
+                             silence_runtime_warnings=True)
+            for kind in stats:
+                self.assertTrue(np.array_equal(result['histograms'][kind]['counts'],
+                                               result['expected'][kind]))
+
     def test_calc_maf_by_gt2(self):
         variations = create_dask_variations()
         mafs = calc_maf_by_gt(variations, max_alleles=3,
@@ -1,31 +1,49 @@
 import unittest
+from unittest import mock
+import shutil
+from pathlib import Path
+from tempfile import TemporaryDirectory
 
 import dask.array as da
 import numpy as np
 
-from test_utils import (create_dask_variations,
+from test_utils import (create_dask_variations, create_variations,
+                        create_test_variations,
                         create_non_materialized_snp_filtered_variations)
 
-from variation6 import (GT_FIELD, DP_FIELD, MISSING_INT, FLT_VARS, N_KEPT,
+from variation6 import (GT_FIELD, DP_FIELD, GQ_FIELD, AD_FIELD, RO_FIELD,
+                        AO_FIELD, N_CALLS_SET_TO_MISSING, MISSING_INT, FLT_VARS, N_KEPT,
                         N_FILTERED_OUT, CHROM_FIELD, POS_FIELD, FLT_STATS,
                         COUNT, BIN_EDGES,
-                        N_SAMPLES_KEPT, N_SAMPLES_FILTERED_OUT)
+                        N_SAMPLES_KEPT, N_SAMPLES_FILTERED_OUT, N_ITERATIONS,
+                        MAF_STAT_FIELD, MAC_STAT_FIELD, CALL_RATE_STAT_FIELD,
+                        OBS_HET_STAT_FIELD, VARIANT_STAT_FIELDS, SWEEP_STATS,
+                        SWEEP_THRESHOLDS)
 from variation6.tests import TEST_DATA_DIR
+from variation6 import filters
 from variation6.in_out.zarr import load_zarr
 from variation6.filters import (remove_low_call_rate_vars,
                                 remove_low_call_rate_samples,
+                                remove_low_call_rate_vars_and_samples,
                                 min_depth_gt_to_missing,
+                                set_calls_to_missing,
                                 keep_samples, filter_by_maf_by_allele_count,
                                 filter_by_mac, filter_by_maf,
                                 keep_variable_variations,
                                 keep_variations_in_regions,
                                 remove_variations_in_regions, remove_samples,
-                                filter_by_obs_heterocigosis,
-                                _add_task_to_pipeline)
+                                filter_by_obs_heterocigosis, filter_by_hwe,
+                                filter_variations, calc_filter_sweep,
+                                filter_by_expression, _add_task_to_pipeline)
+from variation6.filter_expression import (FilterExpressionError,
+                                          calc_expression_mask)
 
 from variation6.compute import compute
 from variation6.variations import Variations
 from variation6.stats.diversity import DEF_NUM_BINS
+from variation6.stats.variant_stats import (calc_variant_stats,
+                                            store_variant_stats,
+                                            STAT_PARAMS_KEY)
 
 
 class MinCallFilterTest(unittest.TestCase):
@@ -202,6 +220,139 @@ class MinDepthGtToMissing(unittest.TestCase):
                     self.assertFalse(np.all(prev_gt_ == [MISSING_INT, MISSING_INT]))
 
 
+def _filter_call_rates_by_full_scans(is_missing, min_var_call_rate,
+                                     min_sample_call_rate):
+    var_mask = np.ones(is_missing.shape[0], dtype=bool)
+    sample_mask = np.ones(is_missing.shape[1], dtype=bool)
+    while True:
+        kept = is_missing[var_mask][:, sample_mask]
+        new_var_mask = var_mask.copy()
+        new_var_mask[var_mask] = 1 - np.mean(kept, axis=1) >= min_var_call_rate
+        kept = is_missing[new_var_mask][:, sample_mask]
+        new_sample_mask = sample_mask.copy()
+        new_sample_mask[sample_mask] = 1 - np.mean(kept, axis=0) >= min_sample_call_rate
+        if (np.all(new_var_mask == var_mask) and
+                np.all(new_sample_mask == sample_mask)):
+            return var_mask, sample_mask
+        var_mask, sample_mask = new_var_mask, new_sample_mask
+
+
+class JointCallRateFilterTest(unittest.TestCase):
+
+    def test_filter_vars_and_samples_by_call_rate(self):
+        rng = np.random.default_rng(6)
+        gts = np.zeros((40, 11, 2), dtype=np.int8)
+        missing_rates = rng.random(11) * 0.6
+        is_missing = rng.random((40, 11)) < missing_rates[None, :]
+        gts[is_missing] = MISSING_INT
+        expected_vars, expected_samples = _filter_call_rates_by_full_scans(is_missing,
+                                                                           0.7, 0.75)
+        for in_memory in (True, False):
+            variations = Variations()
+            samples = np.arange(11)
+            variations.samples = samples if in_memory else da.from_array(samples)
+            variations[GT_FIELD] = gts if in_memory else da.from_array(gts,
+                                                                        chunks=(9, 4, 2))
+            task = remove_low_call_rate_vars_and_samples(variations,
+                                                         min_var_call_rate=0.7,
+                                                         min_sample_call_rate=0.75)
+            if in_memory:
+                filtered = task
+            else:
+                filtered = compute(task, store_variation_to_memory=True)
+            self.assertEqual(filtered[FLT_STATS][N_KEPT], np.sum(expected_vars))
+            self.assertEqual(filtered[FLT_STATS][N_SAMPLES_KEPT],
+                             np.sum(expected_samples))
+            self.assertGreater(filtered[FLT_STATS][N_ITERATIONS], 1)
+            self.assertTrue(np.all(filtered[FLT_VARS].samples ==
+                                   samples[expected_samples]))
+            self.assertTrue(np.all(filtered[FLT_VARS][GT_FIELD] ==
+                                   gts[expected_vars][:, expected_samples]))
+
+            task = remove_low_call_rate_vars_and_samples(variations,
+                                                         min_var_call_rate=0.7,
+                                                         min_sample_call_rate=0.75,
+                                                         calc_histogram=True,
+                                                         n_bins=4)
+            self.assertEqual(np.sum(task[FLT_STATS][COUNT]), 40)
+            self.assertTrue(np.allclose(task[FLT_STATS][BIN_EDGES],
+                                        [0, 0.25, 0.5, 0.75, 1]))
+
+    def test_filter_pipeline_with_joint_call_rate(self):
+        with TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / 'out.zarr'
+            result = filter_variations(TEST_DATA_DIR / 'test.zarr', out_path,
+                                       max_allowable_mac=1, min_call_rate=0.5,
+                                       min_sample_call_rate=0.5,
+                                       calc_histogram=True, verbose=False)
+            joint_stats = result[FLT_STATS]['joint_call_rate']
+            self.assertIn(N_KEPT, result[FLT_STATS]['filter_by_mac'])
+            self.assertIn(COUNT, joint_stats)
+            out_vars = load_zarr(out_path)
+            self.assertEqual(out_vars.num_variations, joint_stats[N_KEPT])
+            self.assertEqual(out_vars.num_samples, joint_stats[N_SAMPLES_KEPT])
+
+
+class SetCallsToMissingTest(unittest.TestCase):
+
+    def _create_variations(self, in_memory, with_ro_and_ao=False,
+                           with_gq=True):
+        gts = np.array([[[0, 0, 1], [0, 1, 1], [1, 1, 1], [-1, -1, -1]],
+                        [[0, 0, 0], [0, 0, 1], [0, 0, 1], [0, 2, 2]]])
+        dps = np.array([[5, 20, 10, 10],
+                        [10, 30, 10, 10]])
+        gqs = np.array([[20, 20, 5, 20],
+                        [20, 20, 20, 20]])
+        ads = np.array([[[4, 1, 0], [10, 10, 0], [0, 10, 0], [-1, -1, -1]],
+                        [[10, 0, 0], [29, 1, 0], [5, 5, 0], [3, 0, 7]]])
+        arrays = {GT_FIELD: gts, DP_FIELD: dps}
+        if with_gq:
+            arrays[GQ_FIELD] = gqs
+        if with_ro_and_ao:
+            arrays[RO_FIELD] = ads[:, :, 0]
+            arrays[AO_FIELD] = ads[:, :, 1:]
+        else:
+            arrays[AD_FIELD] = ads
+        return create_variations(arrays, np.array(['a', 'b', 'c', 'd']),
+                                 in_memory, chunks=(1, 2, -1))
+
+    def _check_calls_to_missing(self, in_memory):
+        variations = self._create_variations(in_memory)
+        task = set_calls_to_missing(variations, min_dp=6, max_dp=25,
+                                    min_gq=10, min_het_allele_balance=0.2)
+        result = task if in_memory else compute(task,
+                                                store_variation_to_memory=True)
+        gts = result[FLT_VARS][GT_FIELD]
+        expected_missing = [[True, False, True, True],
+                            [False, True, False, False]]
+        self.assertTrue(np.all(np.all(gts == MISSING_INT, axis=2) ==
+                               expected_missing))
+        self.assertEqual(gts.shape, (2, 4, 3))
+        self.assertEqual(result[FLT_STATS][N_CALLS_SET_TO_MISSING], 3)
+
+        # allele balance from RO and AO
+        variations = self._create_variations(in_memory, with_ro_and_ao=True)
+        task = set_calls_to_missing(variations, min_het_allele_balance=0.2)
+        result = task if in_memory else compute(task,
+                                                store_variation_to_memory=True)
+        gts = result[FLT_VARS][GT_FIELD]
+        expected_missing = [[False, False, False, True],
+                            [False, True, False, False]]
+        self.assertTrue(np.all(np.all(gts == MISSING_INT, axis=2) ==
+                               expected_missing))
+        self.assertEqual(result[FLT_STATS][N_CALLS_SET_TO_MISSING], 1)
+
+        variations = self._create_variations(in_memory, with_gq=False)
+        with self.assertRaises(ValueError) as context:
+            set_calls_to_missing(variations, min_gq=10)
+        self.assertIn(GQ_FIELD, str(context.exception))
+
+    def test_set_calls_to_missing(self):
+        for in_memory in (True, False):
+            with self.subTest(in_memory=in_memory):
+                self._check_calls_to_missing(in_memory)
+
+
 class FilterSamplesTest(unittest.TestCase):
 
     def test_keep_samples(self):
@@ -260,6 +411,37 @@ class FilterSamplesTest(unittest.TestCase):
         expected = [[10], [9], [9], [-1], [-1], [ 9], [10]]
         self.assertTrue(np.all(dps == expected))
 
+    def test_keep_samples_unordered_and_as_bytes(self):
+        variations = Variations(samples=np.array(['s0', 's1', 's2', 's3']))
+        gts = np.array([[[0, 0], [1, 1], [2, 2], [3, 3]],
+                        [[0, 1], [1, 2], [2, 3], [3, 0]]])
+        variations[GT_FIELD] = gts
+        self.assertEqual(variations.sample_index,
+                         {'s0': 0, 's1': 1, 's2': 2, 's3': 3})
+
+        processed = keep_samples(variations, samples=[b's3', 's0', 's1'])
+        self.assertTrue(np.all(processed[FLT_VARS].samples == ['s3', 's0', 's1']))
+        self.assertTrue(np.all(processed[FLT_VARS][GT_FIELD] == gts[:, [3, 0, 1]]))
+
+        dask_variations = Variations(samples=da.from_array(variations.samples))
+        dask_variations[GT_FIELD] = da.from_array(gts, chunks=(1, 4, 2))
+        task = keep_samples(dask_variations, samples=['s3', 's0', 's1'])
+        kept_gts = task[FLT_VARS][GT_FIELD]
+        self.assertEqual(kept_gts.chunks[0], (1, 1))
+        self.assertTrue(np.all(kept_gts.compute() == gts[:, [3, 0, 1]]))
+
+        with self.assertRaises(ValueError):
+            keep_samples(variations, samples=['s5'])
+
+        dask_variations = Variations(samples=da.from_array(variations.samples))
+        dask_variations[GT_FIELD] = da.from_array(gts, chunks=(1, 2, 2))
+        task = keep_samples(dask_variations, samples=['s3', 's0', 's1'])
+        self.assertTrue(np.all(task[FLT_VARS][GT_FIELD].compute() == gts[:, [3, 0, 1]]))
+        task = remove_samples(dask_variations, samples=['s1'])
+        kept_gts = task[FLT_VARS][GT_FIELD]
+        self.assertEqual(kept_gts.chunks[:2], ((1, 1), (1, 2)))
+        self.assertTrue(np.all(kept_gts.compute() == gts[:, [0, 2, 3]]))
+
 
 class MafFilterTest(unittest.TestCase):
 
@@ -481,6 +663,30 @@ class FilterByPositionTest(unittest.TestCase):
         self.assertTrue(np.all(chroms == ['chr1', 'chr1', 'chr1', 'chr1',
                                           'chr1', 'chr1', 'chr1', 'chr1']))
 
+    def test_filter_by_many_overlapping_regions(self):
+        chroms = np.array([b'chr1'] * 50 + [b'chr2'] * 50)
+        poss = np.concatenate([np.arange(0, 500, 10), np.arange(0, 500, 10)])
+        regions = [('chr2', 400, 420), ('chr1', 15, 45), ('chr1', 40, 61),
+                   ('chr1', 300, 301), ('chr1', 100, 100), ('chr3',),
+                   ('chr2', 405, 410), ('chr1', 61, 70)]
+        expected = np.zeros(poss.shape, dtype=bool)
+        for chrom, start, end in [region for region in regions
+                                  if len(region) > 1]:
+            expected |= ((chroms == chrom.encode()) &
+                         (start <= poss) & (poss < end))
+
+        variations = Variations(samples=da.array(['aa', 'bb']))
+        variations[CHROM_FIELD] = da.from_array(chroms, chunks=15)
+        variations[POS_FIELD] = da.from_array(poss, chunks=15)
+        task = keep_variations_in_regions(variations, regions)
+        result = compute(task, store_variation_to_memory=True)
+        self.assertTrue(np.all(result[FLT_VARS][POS_FIELD] == poss[expected]))
+        self.assertEqual(result[FLT_STATS][N_KEPT], np.sum(expected))
+
+        task = remove_variations_in_regions(variations, regions)
+        result = compute(task, store_variation_to_memory=True)
+        self.assertTrue(np.all(result[FLT_VARS][POS_FIELD] == poss[~expected]))
+
 
 class ObsHetFiltterTest(unittest.TestCase):
 
@@ -566,6 +772,253 @@ class ObsHetFiltterTest(unittest.TestCase):
         assert np.all(filtered[FLT_VARS][GT_FIELD] == gts[[0, 2, 3]])
 
 
+class HweFilterTest(unittest.TestCase):
+
+    def test_filter_by_hwe(self):
+        # hom ref, het and hom alt counts: [5, 0, 5], [0, 10, 0], [3, 4, 3]
+        # and [10, 0, 0]
+        gts = np.array([[[0, 0]] * 5 + [[1, 1]] * 5,
+                        [[0, 1]] * 10,
+                        [[0, 0]] * 3 + [[0, 1]] * 4 + [[1, 1]] * 3,
+                        [[0, 0]] * 10])
+        for in_memory in (True, False):
+            variations = Variations()
+            samples = np.arange(10)
+            variations.samples = samples if in_memory else da.from_array(samples)
+            variations[GT_FIELD] = gts if in_memory else da.from_array(gts,
+                                                                        chunks=(3, 4, 2))
+            task = filter_by_hwe(variations, min_allowable_pvalue=0.005,
+                                 calc_histogram=True)
+            if in_memory:
+                filtered = task
+            else:
+                filtered = compute(task, store_variation_to_memory=True)
+            assert np.all(filtered[FLT_VARS][GT_FIELD] == gts[[1, 2, 3]])
+            assert filtered[FLT_STATS][N_KEPT] == 3
+            assert filtered[FLT_STATS][N_FILTERED_OUT] == 1
+            assert np.sum(filtered[FLT_STATS][COUNT]) == 4
+
+
+class StoredVariantStatsTest(unittest.TestCase):
+
+    def test_store_variant_stats(self):
+        with TemporaryDirectory() as tmpdir:
+            zarr_path = Path(tmpdir) / 'test.zarr'
+            shutil.copytree(TEST_DATA_DIR / 'test.zarr', zarr_path)
+            store_variant_stats(zarr_path)
+
+            variations = load_zarr(zarr_path)
+            stats, fingerprints = calc_variant_stats(load_zarr(TEST_DATA_DIR / 'test.zarr'),
+                                                     max_alleles=variations['/variations/alt'].shape[1])
+            stats = compute(stats)
+            for field in VARIANT_STAT_FIELDS:
+                self.assertEqual(variations.metadata[field][STAT_PARAMS_KEY],
+                                 fingerprints[field])
+                self.assertTrue(np.allclose(variations[field].compute(),
+                                            stats[field], equal_nan=True))
+
+            # the filters give the same result with and without the stats
+            results = []
+            for path in (TEST_DATA_DIR / 'test.zarr', zarr_path):
+                out_path = Path(tmpdir) / f'out{len(results)}.zarr'
+                result = filter_variations(path, out_path, min_call_rate=0.5,
+                                           max_allowable_mac=1,
+                                           verbose=False)
+                results.append(result[FLT_STATS])
+                out_vars = load_zarr(out_path)
+            self.assertEqual(results[0], results[1])
+            self.assertIn(MAC_STAT_FIELD, out_vars)
+
+    def _create_variations_with_stats(self, min_num_genotypes=2,
+                                      in_memory=False):
+        variations = create_test_variations(in_memory)
+        stats, fingerprints = calc_variant_stats(variations, max_alleles=3,
+                                                 min_num_genotypes=min_num_genotypes)
+        num_vars = variations.num_variations
+        # fake stats to check that they are used by the filters
+        for field in stats:
+            fake_stat = np.linspace(0, 1, num_vars)
+            variations[field] = fake_stat if in_memory else da.from_array(fake_stat)
+        variations.metadata.update({field: {STAT_PARAMS_KEY: fingerprint}
+                                    for field, fingerprint in fingerprints.items()})
+        return variations
+
+    def _check_filters_use_stored_stats(self, in_memory):
+        variations = self._create_variations_with_stats(in_memory=in_memory)
+        tasks = {'maf': filter_by_maf(variations, max_alleles=3,
+                                      max_allowable_maf=0.4,
+                                      min_num_genotypes=2),
+                 'mac': filter_by_mac(variations, max_alleles=3,
+                                      max_allowable_mac=0.4,
+                                      min_num_genotypes=2),
+                 'call_rate': remove_low_call_rate_vars(variations,
+                                                        min_call_rate=0.6),
+                 'obs_het': filter_by_obs_heterocigosis(variations,
+                                                        max_allowable_het=0.4,
+                                                        min_num_genotypes=2)}
+        result = compute({key: task[FLT_STATS] for key, task in tasks.items()},
+                         silence_runtime_warnings=True)
+        for key in ('maf', 'mac', 'call_rate', 'obs_het'):
+            self.assertEqual(result[key][N_KEPT] + result[key][N_FILTERED_OUT], 7)
+        self.assertEqual(result['maf'][N_KEPT], 3)
+        self.assertEqual(result['mac'][N_KEPT], 3)
+        self.assertEqual(result['call_rate'][N_KEPT], 3)
+        self.assertEqual(result['obs_het'][N_KEPT], 3)
+
+    def test_filters_use_stored_stats(self):
+        for in_memory in (True, False):
+            with self.subTest(in_memory=in_memory):
+                self._check_filters_use_stored_stats(in_memory)
+
+    def test_stale_stats_are_not_used(self):
+        variations = self._create_variations_with_stats(min_num_genotypes=5)
+        task = filter_by_maf(variations, max_allowable_maf=0.6, max_alleles=3,
+                             min_num_genotypes=2)
+        result = compute(task[FLT_STATS], silence_runtime_warnings=True)
+        self.assertEqual(result, {'n_kept': 3, 'n_filtered_out': 4})
+
+        variations = self._create_variations_with_stats()
+        variations = min_depth_gt_to_missing(variations, min_depth=0)[FLT_VARS]
+        for field in VARIANT_STAT_FIELDS:
+            self.assertNotIn(field, variations)
+
+        variations = self._create_variations_with_stats()
+        variations = keep_samples(variations,
+                                  variations.samples[:2].compute())[FLT_VARS]
+        self.assertNotIn(MAF_STAT_FIELD, variations)
+
+
+class FilterSweepTest(unittest.TestCase):
+
+    def _check_sweep(self, in_memory):
+        variations = create_test_variations(in_memory)
+        stats, _ = calc_variant_stats(variations, max_alleles=3,
+                                      min_num_genotypes=2)
+        stats = compute(stats, silence_runtime_warnings=True)
+
+        min_call_rates = [0.8, 0, 0.5]
+        max_obs_hets = [0, 0.3, 1]
+        min_mafs = [0.5, 0.7]
+        sweep = calc_filter_sweep(variations, max_alleles=3,
+                                  min_call_rates=min_call_rates,
+                                  max_obs_hets=max_obs_hets,
+                                  min_mafs=min_mafs, min_num_genotypes=2)
+        sweep = compute(sweep, silence_runtime_warnings=True)
+        self.assertEqual(sweep[SWEEP_STATS], [CALL_RATE_STAT_FIELD,
+                                              OBS_HET_STAT_FIELD,
+                                              MAF_STAT_FIELD])
+        self.assertEqual(sweep[COUNT].shape, (3, 3, 2))
+
+        with np.errstate(invalid='ignore'):
+            for idx0, min_call_rate in enumerate(sweep[SWEEP_THRESHOLDS][0]):
+                for idx1, max_het in enumerate(sweep[SWEEP_THRESHOLDS][1]):
+                    for idx2, min_maf in enumerate(sweep[SWEEP_THRESHOLDS][2]):
+                        expected = np.sum((stats[CALL_RATE_STAT_FIELD] >= min_call_rate) &
+                                          (stats[OBS_HET_STAT_FIELD] <= max_het) &
+                                          (stats[MAF_STAT_FIELD] >= min_maf))
+                        self.assertEqual(sweep[COUNT][idx0, idx1, idx2],
+                                         expected)
+
+    def test_filter_sweep(self):
+        for in_memory in (True, False):
+            with self.subTest(in_memory=in_memory):
+                self._check_sweep(in_memory)
+
+    def test_filter_sweep_by_min_and_max_maf(self):
+        variations = create_dask_variations()
+        stats, _ = calc_variant_stats(variations, max_alleles=3,
+                                      min_num_genotypes=2)
+        mafs = compute(stats, silence_runtime_warnings=True)[MAF_STAT_FIELD]
+
+        with mock.patch('variation6.filters.get_variant_stat',
+                        wraps=filters.get_variant_stat) as get_stat:
+            sweep = calc_filter_sweep(variations, max_alleles=3,
+                                      min_mafs=[0.5], max_mafs=[0.6],
+                                      min_num_genotypes=2)
+        # the maf is calculated only once for both sweeps
+        self.assertEqual(get_stat.call_count, 1)
+
+        sweep = compute(sweep, silence_runtime_warnings=True)
+        self.assertEqual(sweep[SWEEP_STATS], [MAF_STAT_FIELD, MAF_STAT_FIELD])
+        with np.errstate(invalid='ignore'):
+            expected = np.sum((mafs >= 0.5) & (mafs <= 0.6))
+        self.assertEqual(sweep[COUNT][0, 0], expected)
+
+    def test_filter_sweep_as_filter(self):
+        variations = create_dask_variations()
+        sweep = calc_filter_sweep(variations, max_alleles=3,
+                                  max_mafs=[0.6], min_num_genotypes=2)
+        self.assertEqual(compute(sweep[COUNT], silence_runtime_warnings=True)[0],
+                         3)
+
+
+class FilterExpressionTest(unittest.TestCase):
+
+    def _check_expression(self, in_memory, num_samples_per_chunk=None):
+        variations = create_test_variations(in_memory, num_vars_per_chunk=3,
+                                            num_samples_per_chunk=num_samples_per_chunk)
+        stats, _ = calc_variant_stats(variations, max_alleles=3,
+                                      min_num_genotypes=2)
+        stats['chrom'] = variations[CHROM_FIELD]
+        stats['pos'] = variations[POS_FIELD]
+        stats = compute(stats, silence_runtime_warnings=True)
+
+        expression = ("call_rate >= 0.5 and (maf <= 0.6 or obs_het > 0.2) "
+                      "and chrom != 'chr2' and not 10 < pos <= 20")
+        mask = calc_expression_mask(variations, expression, max_alleles=3,
+                                    min_num_genotypes=2)
+        mask = compute({'mask': mask}, silence_runtime_warnings=True)['mask']
+        chroms = stats['chrom'].astype(str)
+        poss = stats['pos']
+        with np.errstate(invalid='ignore'):
+            expected = ((stats[CALL_RATE_STAT_FIELD] >= 0.5) &
+                        ((stats[MAF_STAT_FIELD] <= 0.6) |
+                         (stats[OBS_HET_STAT_FIELD] > 0.2)) &
+                        (chroms != 'chr2') & ~((poss > 10) & (poss <= 20)))
+        self.assertTrue(np.array_equal(mask, expected))
+
+    def test_expression_mask(self):
+        for in_memory, num_samples_per_chunk in ((True, None), (False, None),
+                                                 (False, 2)):
+            with self.subTest(in_memory=in_memory,
+                              num_samples_per_chunk=num_samples_per_chunk):
+                self._check_expression(in_memory,
+                                       num_samples_per_chunk=num_samples_per_chunk)
+
+    def test_filter_by_expression(self):
+        variations = create_dask_variations()
+        task = filter_by_expression(variations, 'maf <= 0.6', max_alleles=3,
+                                    min_num_genotypes=2)
+        result = compute(task, store_variation_to_memory=True,
+                         silence_runtime_warnings=True)
+        self.assertEqual(result[FLT_VARS].num_variations, 3)
+        self.assertEqual(result[FLT_STATS], {'n_kept': 3, 'n_filtered_out': 4})
+
+        # a min dp of 0 also requires the depths
+        variations = create_dask_variations()
+        task = filter_by_expression(variations, 'obs_het <= 0.5',
+                                    min_call_dp_for_het_call=0,
+                                    min_num_genotypes=2)
+        result = compute(task, store_variation_to_memory=True,
+                         silence_runtime_warnings=True)
+        variations = create_dask_variations()
+        task = filter_by_obs_heterocigosis(variations, max_allowable_het=0.5,
+                                           min_call_dp_for_het_call=0,
+                                           min_num_genotypes=2)
+        expected = compute(task, store_variation_to_memory=True,
+                           silence_runtime_warnings=True)
+        self.assertEqual(result[FLT_STATS], expected[FLT_STATS])
+
+    def test_invalid_expressions(self):
+        variations = create_dask_variations()
+        for expression in ('maf >=', 'depth > 3', 'maf + 1 > 0.5', '1 > 0',
+                           'maf in (1, 2)'):
+            with self.assertRaises(FilterExpressionError):
+                calc_expression_mask(variations, expression, max_alleles=3)
+        with self.assertRaises(ValueError):
+            calc_expression_mask(variations, 'maf > 0.1')
+
+
 if __name__ == '__main__':
 #     import sys; sys.argv = ['.', 'MinDepthGtToMissing']
     unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from itertools import combinations
+
+import numpy as np
+import allel
+
+from test_utils import create_random_gts, create_random_gt_variations
+from variation6.compute import compute
+from variation6.stats.fst import (calc_pop_pairwise_fst, calc_fst_per_variant,
+                                  calc_fst_by_window, FST_HUDSON,
+                                  FST_WEIR_COCKERHAM, WINDOW_FST)
+
+
+def _create_gts():
+    gts = create_random_gts((50, 12, 2), alt_freq=0.3, missing_rate=0.1)
+    rng = np.random.default_rng(0)
+    gts[5] = 2 * (rng.random((12, 2)) < 0.5)
+    return gts
+
+
+def _create_variations(gts, in_memory):
+    return create_random_gt_variations(gts, in_memory, chunks=(7, 5, 2),
+                                       pop_limits=[4, 9])
+
+
+def _calc_expected_fsts(gts, method):
+    gts = allel.GenotypeArray(gts)
+    pop_idxs = [np.arange(4), np.arange(4, 9), np.arange(9, 12)]
+    fsts = []
+    for pop1, pop2 in combinations(pop_idxs, 2):
+        if method == FST_HUDSON:
+            numerator, denominator = allel.hudson_fst(gts.count_alleles(subpop=pop1,
+                                                                        max_allele=2),
+                                                      gts.count_alleles(subpop=pop2,
+                                                                        max_allele=2))
+        else:
+            a, b, c = allel.weir_cockerham_fst(gts, [pop1, pop2], max_allele=2)
+            numerator, denominator = a, a + b + c
+        fsts.append(np.nansum(numerator) / np.nansum(denominator))
+    return fsts
+
+
+class FstTest(unittest.TestCase):
+
+    def test_pop_pairwise_fst(self):
+        gts = _create_gts()
+        for method in (FST_HUDSON, FST_WEIR_COCKERHAM):
+            expected = _calc_expected_fsts(gts, method)
+            for in_memory in (True, False):
+                variations, populations = _create_variations(gts, in_memory)
+                fsts = calc_pop_pairwise_fst(variations, populations,
+                                             max_alleles=3, method=method,
+                                             silence_runtime_warnings=True)
+                self.assertTrue(np.allclose(fsts, expected))
+
+    def test_fst_per_variant_and_window(self):
+        gts = _create_gts()
+        variations, populations = _create_variations(gts, in_memory=False)
+        fsts = calc_fst_per_variant(variations, populations, max_alleles=3)
+        fsts = compute(fsts, silence_runtime_warnings=True)
+        self.assertEqual(fsts.shape, (50, 3))
+
+        table = calc_fst_by_window(variations, populations, max_alleles=3,
+                                   window_size=100)
+        table = compute({'table': table},
+                        silence_runtime_warnings=True)['table']
+        self.assertTrue(np.allclose(table[WINDOW_FST][0],
+                                    _calc_expected_fsts(gts, FST_HUDSON)))
+
+    def test_wrong_method(self):
+        variations, populations = _create_variations(_create_gts(),
+                                                     in_memory=True)
+        with self.assertRaises(ValueError):
+            calc_pop_pairwise_fst(variations, populations, max_alleles=3,
+                                  method='nei')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+
+import numpy as np
+import dask.array as da
+
+from variation6 import GT_FIELD
+from variation6.compute import compute
+from variation6.variations import Variations
+from variation6.stats.diversity import count_genotype_classes
+from variation6.stats.hwe import (calc_hwe_pvalues,
+                                  calc_hwe_pvalues_from_gt_counts)
+
+
+def _calc_hwe_pvalue(num_hom_refs, num_hets, num_hom_alts):
+    # straightforward implementation of Wigginton et al. 2005
+    num_rare_homs = min(num_hom_refs, num_hom_alts)
+    num_common_homs = max(num_hom_refs, num_hom_alts)
+    num_gts = num_hets + num_common_homs + num_rare_homs
+    num_rare = 2 * num_rare_homs + num_hets
+
+    probs = np.zeros(num_rare + 1)
+    mid = num_rare * (2 * num_gts - num_rare) // (2 * num_gts)
+    if (num_rare - mid) % 2:
+        mid += 1
+    probs[mid] = 1
+    curr_hets, curr_rare_homs = mid, (num_rare - mid) // 2
+    curr_common_homs = num_gts - curr_hets - curr_rare_homs
+    while curr_hets >= 2:
+        probs[curr_hets - 2] = (probs[curr_hets] * curr_hets * (curr_hets - 1) /
+                                (4 * (curr_rare_homs + 1) * (curr_common_homs + 1)))
+        curr_hets -= 2
+        curr_rare_homs += 1
+        curr_common_homs += 1
+    curr_hets, curr_rare_homs = mid, (num_rare - mid) // 2
+    curr_common_homs = num_gts - curr_hets - curr_rare_homs
+    while curr_hets <= num_rare - 2:
+        probs[curr_hets + 2] = (probs[curr_hets] * 4 * curr_rare_homs * curr_common_homs /
+                                ((curr_hets + 2) * (curr_hets + 1)))
+        curr_hets += 2
+        curr_rare_homs -= 1
+        curr_common_homs -= 1
+    probs /= np.sum(probs)
+    return min(1, np.sum(probs[probs <= probs[num_hets] * (1 + 1e-7)]))
+
+
+class HweTest(unittest.TestCase):
+
+    def test_hwe_pvalues(self):
+        rng = np.random.default_rng(4)
+        gt_counts = rng.integers(0, 30, size=(200, 3))
+        gt_counts[0] = [10, 0, 10]
+        gt_counts[1] = [0, 20, 0]
+        gt_counts[2] = [20, 0, 0]
+        expected = [_calc_hwe_pvalue(*counts) for counts in gt_counts]
+        pvalues = calc_hwe_pvalues_from_gt_counts(gt_counts)
+        self.assertTrue(np.allclose(pvalues, expected))
+        self.assertEqual(pvalues[2], 1)
+
+        # the probabilities calculated by small batches
+        pvalues = calc_hwe_pvalues_from_gt_counts(gt_counts,
+                                                  max_table_size=100)
+        self.assertTrue(np.allclose(pvalues, expected))
+
+        pvalues = calc_hwe_pvalues_from_gt_counts(np.array([[0, 0, 0]]))
+        self.assertTrue(np.isnan(pvalues[0]))
+        self.assertEqual(calc_hwe_pvalues_from_gt_counts(np.empty((0, 3))).size,
+                         0)
+
+    def test_hwe_pvalues_from_gts(self):
+        gts = np.array([[[0, 0], [0, 1], [1, 1], [-1, -1], [0, 0]],
+                        [[0, 1], [0, 1], [0, 1], [0, 1], [0, 1]],
+                        [[2, 2], [0, 2], [0, 0], [0, 0], [1, 1]]])
+        expected_counts = [[2, 1, 1], [0, 5, 0], [2, 1, 2]]
+        expected = [_calc_hwe_pvalue(*counts) for counts in expected_counts]
+        for in_memory in (True, False):
+            samples = np.arange(5)
+            variations = Variations(samples=samples if in_memory else da.from_array(samples))
+            variations[GT_FIELD] = gts if in_memory else da.from_array(gts,
+                                                                        chunks=(2, 2, 2))
+            result = compute({'counts': count_genotype_classes(variations),
+                              'pvalues': calc_hwe_pvalues(variations)})
+            self.assertTrue(np.array_equal(result['counts'], expected_counts))
+            self.assertTrue(np.allclose(result['pvalues'], expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
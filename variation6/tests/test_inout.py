@@ -10,12 +10,18 @@ import numpy as np
 import dask.array as da
 
 from variation6 import (GT_FIELD, QUAL_FIELD, FLT_VARS, VARIATION_FIELDS,
-                        CALL_FIELDS)
+                        CALL_FIELDS, GT_PACKED_FIELD)
 from variation6.tests import TEST_DATA_DIR
-from variation6.filters import remove_low_call_rate_vars
+from variation6.filters import remove_low_call_rate_vars, keep_samples
+import variation6.array as va
+from variation6.stats.diversity import (calc_missing_gt, calc_obs_het,
+                                        calc_maf_by_gt, calc_mac)
+from variation6.stats.distance import calc_kosman_dist
 from variation6.in_out.zarr import load_zarr, vcf_to_zarr, prepare_zarr_storage
 from variation6.in_out.hdf5 import vcf_to_hdf5, load_hdf5, prepare_hdf5_storage
 from variation6.in_out.vcf import zarr_to_vcf
+from variation6.utils_array import (plan_num_vars_per_chunk,
+                                    calc_bytes_per_variation)
 
 
 class TestVcfToZarr(unittest.TestCase):
@@ -65,6 +71,43 @@ class TestZarrOut(unittest.TestCase):
                         print(row, original[row, ...], new[row, ...])
                     raise
 
+    def test_save_packed_gts_to_zarr(self):
+        zarr_path = TEST_DATA_DIR / 'test.zarr'
+        variations = load_zarr(zarr_path, num_vars_per_chunk=2)
+        with TemporaryDirectory() as tmp_dir:
+            tmp_path = Path(tmp_dir)
+            delayed_store = prepare_zarr_storage(variations, tmp_path,
+                                                 pack_gts=True)
+            dask.compute(delayed_store, scheduler='sync')
+            variations2 = load_zarr(tmp_path)
+            self.assertIn(GT_PACKED_FIELD, variations2.keys())
+            self.assertNotIn(GT_FIELD, variations2.keys())
+            self.assertIn(GT_FIELD, variations2)
+            # the unpacked genotypes are reused
+            self.assertIs(variations2[GT_FIELD], variations2[GT_FIELD])
+            self.assertEqual(variations2[GT_PACKED_FIELD].shape, (7, 1))
+            self.assertTrue(np.all(variations[GT_FIELD].compute() ==
+                                   variations2[GT_FIELD].compute()))
+
+            stats = (calc_missing_gt(variations), calc_obs_het(variations),
+                     calc_maf_by_gt(variations, max_alleles=2),
+                     calc_mac(variations, max_alleles=2),
+                     calc_kosman_dist(variations)[0])
+            packed_stats = (calc_missing_gt(variations2),
+                            calc_obs_het(variations2),
+                            calc_maf_by_gt(variations2, max_alleles=2),
+                            calc_mac(variations2, max_alleles=2),
+                            calc_kosman_dist(variations2)[0])
+            for stat, packed_stat in zip(stats, packed_stats):
+                np.testing.assert_allclose(va.make_sure_array_is_in_memory(stat),
+                                           va.make_sure_array_is_in_memory(packed_stat),
+                                           equal_nan=True)
+
+            kept = keep_samples(variations2, ['upv196', 'pepo'])[FLT_VARS]
+            self.assertEqual(kept[GT_PACKED_FIELD].shape, (7, 1))
+            expected = variations[GT_FIELD].compute()[:, [2, 0]]
+            self.assertTrue(np.all(kept[GT_FIELD].compute() == expected))
+
     def test_zarr_functionament(self):
         # with shape
         np_array = np.random.randint(1, 10, size=1000)
@@ -149,6 +192,49 @@ class TestVcfTohHf5(unittest.TestCase):
         self.assertEqual(variations[GT_FIELD].shape, (7, 3, 2))
 
 
+class ChunkPlannerTest(unittest.TestCase):
+
+    def test_plan_num_vars_per_chunk(self):
+        gts = ((100000, 20000, 2), np.int8, True)
+        self.assertEqual(calc_bytes_per_variation([gts]), 40000)
+        self.assertEqual(calc_bytes_per_variation([gts],
+                                                  num_samples_per_chunk=1000),
+                         2000)
+        self.assertEqual(calc_bytes_per_variation([((10, 3), object, False)]),
+                         96)
+
+        budget = 256 * 1024 ** 2
+        # many samples, the storage chunk is split evenly
+        self.assertEqual(plan_num_vars_per_chunk([gts], memory_budget=budget,
+                                                 storage_chunk_size=65536),
+                         6554)
+        # few samples, several storage chunks by chunk
+        gts = ((100000, 50, 2), np.int8, True)
+        self.assertEqual(plan_num_vars_per_chunk([gts], memory_budget=budget,
+                                                 storage_chunk_size=65536),
+                         40 * 65536)
+        self.assertEqual(plan_num_vars_per_chunk([gts], memory_budget=100,
+                                                 min_num_vars=10), 10)
+        # room for the intermediate arrays of the calculations
+        self.assertEqual(plan_num_vars_per_chunk([gts], memory_budget=budget,
+                                                 storage_chunk_size=65536,
+                                                 expansion_factor=8),
+                         5 * 65536)
+
+    def test_load_with_planned_chunks(self):
+        variations = load_zarr(TEST_DATA_DIR / 'test.zarr',
+                               fields=[GT_FIELD, QUAL_FIELD])
+        self.assertEqual(sorted(variations.keys()), [GT_FIELD, QUAL_FIELD])
+        self.assertEqual(variations[GT_FIELD].chunks[0], (7,))
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            variations = load_hdf5(TEST_DATA_DIR / 'test.h5')
+        self.assertEqual(variations[GT_FIELD].chunks[0], (7,))
+        variations = load_hdf5(TEST_DATA_DIR / 'test.h5', num_vars_per_chunk=3)
+        self.assertEqual(variations[GT_FIELD].chunks[0], (3, 3, 1))
+
+
 class Testhdf5Out(unittest.TestCase):
 
     def test_save_to_hdf5(self):
@@ -0,0 +1,95 @@
+import unittest
+
+import numpy as np
+import dask.array as da
+
+from test_utils import create_variations
+from variation6 import DP_FIELD, GQ_FIELD, QUAL_FIELD
+from variation6.compute import compute
+from variation6.array import QuantileSketch, calc_quantile_sketch
+from variation6.stats.quantiles import calc_quantile_sketches, calc_quantiles
+
+QUANTILES = [0, 0.001, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 0.999, 1]
+
+
+def _calc_rank_errors(values, estimates, quantiles):
+    values = np.sort(values)
+    ranks = np.searchsorted(values, estimates) / values.size
+    return np.abs(ranks - np.array(quantiles))
+
+
+class QuantileSketchTest(unittest.TestCase):
+
+    def test_exact_for_few_distinct_values(self):
+        values = np.array([3, 1, -1, 2, 2, 5, 1, 2, -1, 8])
+        sketch = QuantileSketch.from_array(values)
+        expected = np.quantile(values[values != -1], QUANTILES)
+        self.assertTrue(np.allclose(sketch.quantile(QUANTILES), expected))
+        self.assertEqual(sketch.num_values, 8)
+
+        sketch = QuantileSketch.from_array(np.array([1.5, np.nan, 1.5]))
+        self.assertTrue(np.allclose(sketch.quantile([0, 0.5, 1]), 1.5))
+        sketch = QuantileSketch.from_array(np.array([np.nan]))
+        self.assertTrue(np.all(np.isnan(sketch.quantile([0.1, 0.5]))))
+
+    def test_merge(self):
+        rng = np.random.default_rng(3)
+        values = rng.lognormal(size=200000)
+        sketch = QuantileSketch.from_array(values[:1000])
+        sketch.merge(QuantileSketch.from_array(values[1000:50000]))
+        sketch = sketch + QuantileSketch.from_array(values[50000:])
+        self.assertLessEqual(sketch.means.size, sketch.compression)
+        self.assertEqual(sketch.num_values, values.size)
+
+        estimates = sketch.quantile(QUANTILES)
+        self.assertEqual(estimates[0], np.min(values))
+        self.assertEqual(estimates[-1], np.max(values))
+        self.assertTrue(np.all(_calc_rank_errors(values, estimates,
+                                                 QUANTILES) < 0.005))
+
+    def test_dask_sketch(self):
+        rng = np.random.default_rng(4)
+        values = rng.normal(size=(20000, 3))
+        values[rng.random(values.shape) < 0.1] = np.nan
+        sketch = calc_quantile_sketch(da.from_array(values,
+                                                    chunks=(1500, 2)))
+        sketch = compute(sketch)
+        not_nan_values = values[~np.isnan(values)]
+        self.assertEqual(sketch.num_values, not_nan_values.size)
+        estimates = sketch.quantile(QUANTILES)
+        self.assertTrue(np.all(_calc_rank_errors(not_nan_values, estimates,
+                                                 QUANTILES) < 0.005))
+
+
+class QuantileSketchesTest(unittest.TestCase):
+
+    def _check_sketches(self, in_memory):
+        rng = np.random.default_rng(5)
+        dps = rng.integers(0, 60, size=(300, 4))
+        dps[rng.random(dps.shape) < 0.1] = -1
+        quals = np.round(rng.random(300) * 100)
+        stat = rng.random(300)
+        variations = create_variations({DP_FIELD: dps, QUAL_FIELD: quals},
+                                       np.arange(4), in_memory,
+                                       chunks=(70, 3))
+        if not in_memory:
+            stat = da.from_array(stat, chunks=70)
+
+        sketches = calc_quantile_sketches(variations, stats={'stat': stat})
+        self.assertNotIn(GQ_FIELD, sketches)
+        quantiles = calc_quantiles(compute(sketches), [0.1, 0.5, 0.9])
+        self.assertTrue(np.allclose(quantiles[DP_FIELD],
+                                    np.quantile(dps[dps != -1],
+                                                [0.1, 0.5, 0.9])))
+        self.assertTrue(np.allclose(quantiles[QUAL_FIELD],
+                                    np.quantile(quals, [0.1, 0.5, 0.9])))
+        self.assertEqual(quantiles['stat'].shape, (3,))
+
+    def test_quantile_sketches(self):
+        for in_memory in (True, False):
+            with self.subTest(in_memory=in_memory):
+                self._check_sketches(in_memory)
+
+
+if __name__ == '__main__':
+    unittest.main()
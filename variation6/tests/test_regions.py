@@ -0,0 +1,86 @@
+import unittest
+from io import StringIO
+
+import numpy as np
+
+from test_utils import create_dask_variations
+import variation6.array as va
+from variation6 import CHROM_FIELD, POS_FIELD
+from variation6.compute import compute
+from variation6.in_out.regions import read_bed_regions, read_gff_regions
+from variation6.stats.diversity import (calc_maf_by_gt, calc_obs_het,
+                                        calc_expected_het, calc_missing_gt)
+from variation6.stats.regions import (calc_stats_by_region, REGION_NAME,
+                                      REGION_NUM_VARIATIONS, REGION_MAF,
+                                      REGION_OBS_HET, REGION_EXP_HET,
+                                      REGION_MISSING_GT_RATE)
+
+REGIONS = [('CUUC00007_TC01', 600, 660, 'gene1'),
+           ('CUUC00007_TC01', 650, 700, 'gene2'),
+           ('CUUC00029_TC01', 0, 30, 'gene3'),
+           ('CUUC00029_TC01', 100, 200, 'gene4'),
+           ('CUUC00099_TC01', 0, 1000, 'gene5')]
+
+
+class RegionStatsTest(unittest.TestCase):
+
+    def _check_region_stats(self, variations, table):
+        self.assertTrue(np.all(table[REGION_NAME] ==
+                               [region[3] for region in REGIONS]))
+        self.assertTrue(np.all(table[REGION_NUM_VARIATIONS] == [2, 2, 1, 0, 0]))
+
+        stats = {REGION_MAF: calc_maf_by_gt(variations, max_alleles=3,
+                                            min_num_genotypes=0),
+                 REGION_OBS_HET: calc_obs_het(variations, min_num_genotypes=0,
+                                              min_call_dp_for_het_call=0),
+                 REGION_EXP_HET: calc_expected_het(variations, max_alleles=3,
+                                                   min_num_genotypes=0),
+                 REGION_MISSING_GT_RATE: calc_missing_gt(variations)}
+        stats = compute(stats, silence_runtime_warnings=True)
+        chroms = va.make_sure_array_is_in_memory(variations[CHROM_FIELD])
+        poss = va.make_sure_array_is_in_memory(variations[POS_FIELD])
+        for idx, (chrom, start, end, _) in enumerate(REGIONS[:3]):
+            in_region = (chroms == chrom) & (start <= poss) & (poss < end)
+            for stat, values in stats.items():
+                self.assertAlmostEqual(table[stat][idx],
+                                       np.nanmean(values[in_region]))
+        self.assertTrue(np.all(np.isnan(table[REGION_MAF][3:])))
+
+    def test_calc_stats_by_region(self):
+        variations = create_dask_variations(num_vars_per_chunk=2)
+        table = calc_stats_by_region(variations, REGIONS, max_alleles=3,
+                                     min_num_genotypes=0,
+                                     min_call_dp_for_het_call=0)
+        table = compute(table, silence_runtime_warnings=True)
+        self._check_region_stats(variations, table)
+
+    def test_calc_stats_by_region_in_memory(self):
+        variations = create_dask_variations()
+        variations = compute({'vars': variations},
+                             store_variation_to_memory=True)['vars']
+        table = calc_stats_by_region(variations, REGIONS, max_alleles=3,
+                                     min_num_genotypes=0,
+                                     min_call_dp_for_het_call=0)
+        self._check_region_stats(variations, table)
+
+
+class ReadRegionsTest(unittest.TestCase):
+
+    def test_read_bed(self):
+        fhand = StringIO('track name=test\n'
+                         'chr1\t10\t20\tgene1\t0\t+\n'
+                         'chr2\t0\t5\n')
+        self.assertEqual(read_bed_regions(fhand), [('chr1', 11, 21, 'gene1'),
+                                                   ('chr2', 1, 6, None)])
+
+    def test_read_gff(self):
+        fhand = StringIO('##gff-version 3\n'
+                         'chr1\tsrc\tgene\t11\t20\t.\t+\t.\tID=gene1;Name=g1\n'
+                         'chr1\tsrc\texon\t11\t15\t.\t+\t.\tID=exon1\n')
+        self.assertEqual(read_gff_regions(fhand), [('chr1', 11, 21, 'gene1')])
+        fhand.seek(0)
+        self.assertEqual(len(read_gff_regions(fhand, feature_types=None)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
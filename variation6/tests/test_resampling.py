@@ -0,0 +1,119 @@
+import unittest
+
+import numpy as np
+
+from test_utils import create_random_gts, create_random_gt_variations
+from variation6.stats.distance import (calc_unbiased_nei_components,
+                                       calc_unbiased_nei_dists_from_sums,
+                                       calc_pop_pairwise_unbiased_nei_dists,
+                                       calc_dest_components,
+                                       calc_dest_dists_from_sums,
+                                       calc_dset_pop_distance)
+from variation6.stats.resampling import (calc_block_sums,
+                                         calc_bootstrap_replicates,
+                                         calc_jackknife_replicates,
+                                         calc_estimate,
+                                         calc_jackknife_std_error,
+                                         calc_percentile_interval)
+
+
+def _create_gts():
+    return create_random_gts((30, 8, 2), alt_freq=0.4, missing_rate=0.1,
+                             seed=2)
+
+
+def _create_variations(gts, in_memory):
+    return create_random_gt_variations(gts, in_memory, chunks=(10, 4, 2),
+                                       pop_limits=[3, 6], pos_step=10)
+
+
+class BlockResamplingTest(unittest.TestCase):
+
+    def test_block_sums(self):
+        gts = _create_gts()
+        block_sums = []
+        for in_memory in (True, False):
+            variations, pops = _create_variations(gts, in_memory)
+            components = calc_unbiased_nei_components(variations, 2, pops,
+                                                      min_num_genotypes=0)
+            block_sums.append(calc_block_sums(variations, components,
+                                              block_size=10 if in_memory else None,
+                                              silence_runtime_warnings=True))
+        for name in ('jxy', 'unbiased_j'):
+            self.assertEqual(block_sums[0][name].shape[0], 3)
+            self.assertTrue(np.allclose(block_sums[0][name],
+                                        block_sums[1][name]))
+
+        # genomic windows of 10 variations
+        variations, pops = _create_variations(gts, in_memory=False)
+        components = calc_unbiased_nei_components(variations, 2, pops,
+                                                  min_num_genotypes=0)
+        window_sums = calc_block_sums(variations, components, window_size=100,
+                                      silence_runtime_warnings=True)
+        self.assertTrue(np.allclose(window_sums['jxy'], block_sums[0]['jxy']))
+
+        with self.assertRaises(ValueError):
+            calc_block_sums(variations, components, block_size=10,
+                            window_size=100)
+
+    def test_nei_jackknife(self):
+        gts = _create_gts()
+        variations, pops = _create_variations(gts, in_memory=True)
+        components = calc_unbiased_nei_components(variations, 2, pops,
+                                                  min_num_genotypes=0)
+        block_sums = calc_block_sums(variations, components, block_size=10,
+                                     silence_runtime_warnings=True)
+        estimator = calc_unbiased_nei_dists_from_sums
+
+        expected = calc_pop_pairwise_unbiased_nei_dists(variations, 2, pops,
+                                                        min_num_genotypes=0,
+                                                        silence_runtime_warnings=True)
+        self.assertTrue(np.allclose(calc_estimate(block_sums, estimator),
+                                    expected))
+
+        replicates = calc_jackknife_replicates(block_sums, estimator)
+        self.assertEqual(replicates.shape, (3, 3))
+        for block in range(3):
+            keep = np.ones(gts.shape[0], dtype=bool)
+            keep[block * 10: (block + 1) * 10] = False
+            block_variations, _ = _create_variations(gts[keep], in_memory=True)
+            expected = calc_pop_pairwise_unbiased_nei_dists(block_variations,
+                                                            2, pops,
+                                                            min_num_genotypes=0,
+                                                            silence_runtime_warnings=True)
+            self.assertTrue(np.allclose(replicates[block], expected))
+        std_errors = calc_jackknife_std_error(replicates)
+        self.assertEqual(std_errors.shape, (3,))
+        self.assertTrue(np.all(std_errors >= 0))
+
+    def test_dest_bootstrap(self):
+        gts = _create_gts()
+        variations, pops = _create_variations(gts, in_memory=False)
+        components = calc_dest_components(variations, 2, pops,
+                                          min_num_genotypes=0,
+                                          min_call_dp_for_het=None)
+        block_sums = calc_block_sums(variations, components, block_size=5,
+                                     silence_runtime_warnings=True)
+        estimator = calc_dest_dists_from_sums
+        expected = calc_dset_pop_distance(variations, 2, pops,
+                                          min_num_genotypes=0,
+                                          min_call_dp_for_het=None,
+                                          silence_runtime_warnings=True)
+        self.assertTrue(np.allclose(calc_estimate(block_sums, estimator),
+                                    expected))
+
+        replicates = calc_bootstrap_replicates(block_sums, estimator,
+                                               num_replicates=50, seed=1)
+        self.assertEqual(replicates.shape, (50, 3))
+        self.assertTrue(np.allclose(replicates,
+                                    calc_bootstrap_replicates(block_sums,
+                                                              estimator,
+                                                              num_replicates=50,
+                                                              seed=1)))
+        lower, upper = calc_percentile_interval(replicates, confidence=0.9)
+        self.assertTrue(np.all(lower <= upper))
+        self.assertTrue(np.all(lower <= np.max(replicates, axis=0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+
+import numpy as np
+
+from test_utils import create_random_gts, create_variations
+from variation6 import GT_FIELD, DP_FIELD
+from variation6.compute import compute
+from variation6.variations import Variations
+from variation6.stats.diversity import calc_missing_gt_per_sample
+from variation6.stats.sample_qc import (calc_sample_qc, SAMPLE_NUM_CALLED,
+                                        SAMPLE_NUM_MISSING,
+                                        SAMPLE_MISSING_RATE, SAMPLE_NUM_HET,
+                                        SAMPLE_NUM_HOM_ALT, SAMPLE_OBS_HET,
+                                        SAMPLE_DP_MEAN, SAMPLE_DP_STD,
+                                        SAMPLE_INBREEDING_F)
+
+
+def _calc_expected_f(gts):
+    is_called = np.all(gts != -1, axis=2)
+    is_hom = np.logical_and(gts[:, :, 0] == gts[:, :, 1], is_called)
+    alt_counts = np.sum(gts == 1, axis=(1, 2))
+    num_alleles = np.sum(gts != -1, axis=(1, 2))
+    freqs = alt_counts / num_alleles
+    num_gts = num_alleles / 2
+    exp_het = (2 * num_gts / (2 * num_gts - 1)) * 2 * freqs * (1 - freqs)
+    exp_homs = 1 - exp_het
+    fs = []
+    for sample in range(gts.shape[1]):
+        called = is_called[:, sample]
+        exp_hom = np.sum(exp_homs[called])
+        fs.append((np.sum(is_hom[called, sample]) - exp_hom) /
+                  (np.sum(called) - exp_hom))
+    return fs
+
+
+class SampleQcTest(unittest.TestCase):
+
+    def _create_variations(self, in_memory):
+        gts = create_random_gts((25, 6, 2), alt_freq=0.4, missing_rate=0.2,
+                                seed=5)
+        rng = np.random.default_rng(6)
+        dps = rng.integers(0, 30, size=(25, 6))
+        dps[rng.random((25, 6)) < 0.1] = -1
+        samples = np.array([str(idx) for idx in range(6)])
+        variations = create_variations({GT_FIELD: gts, DP_FIELD: dps},
+                                       samples, in_memory,
+                                       chunks={GT_FIELD: (7, 4, 2),
+                                               DP_FIELD: (5, 3)})
+        return variations, gts, dps
+
+    def _check_sample_qc(self, in_memory):
+        variations, gts, dps = self._create_variations(in_memory)
+        qc = calc_sample_qc(variations, max_alleles=2)
+        qc['missing'] = calc_missing_gt_per_sample(variations, rates=False)
+        qc = compute(qc)
+
+        is_called = np.all(gts != -1, axis=2)
+        is_het = np.logical_and(is_called, gts[:, :, 0] != gts[:, :, 1])
+        self.assertTrue(np.array_equal(qc[SAMPLE_NUM_CALLED],
+                                       np.sum(is_called, axis=0)))
+        self.assertTrue(np.array_equal(qc[SAMPLE_NUM_MISSING], qc['missing']))
+        self.assertTrue(np.allclose(qc[SAMPLE_MISSING_RATE],
+                                    qc['missing'] / 25))
+        self.assertTrue(np.array_equal(qc[SAMPLE_NUM_HET],
+                                       np.sum(is_het, axis=0)))
+        self.assertTrue(np.array_equal(qc[SAMPLE_NUM_HOM_ALT],
+                                       np.sum(np.all(gts == 1, axis=2), axis=0)))
+        self.assertTrue(np.allclose(qc[SAMPLE_OBS_HET],
+                                    np.sum(is_het, axis=0) / np.sum(is_called, axis=0)))
+
+        masked_dps = np.ma.masked_equal(dps, -1)
+        self.assertTrue(np.allclose(qc[SAMPLE_DP_MEAN],
+                                    np.ma.mean(masked_dps, axis=0)))
+        self.assertTrue(np.allclose(qc[SAMPLE_DP_STD],
+                                    np.ma.std(masked_dps, axis=0)))
+        self.assertTrue(np.allclose(qc[SAMPLE_INBREEDING_F],
+                                    _calc_expected_f(gts)))
+
+    def test_sample_qc(self):
+        for in_memory in (True, False):
+            with self.subTest(in_memory=in_memory):
+                self._check_sample_qc(in_memory)
+
+    def test_sample_qc_without_dps(self):
+        _, gts, _ = self._create_variations(in_memory=True)
+        variations = Variations(samples=np.arange(6))
+        variations[GT_FIELD] = gts
+        qc = calc_sample_qc(variations, max_alleles=2)
+        self.assertNotIn(SAMPLE_DP_MEAN, qc)
+        self.assertEqual(qc[SAMPLE_NUM_CALLED].shape, (6,))
+
+
+if __name__ == '__main__':
+    unittest.main()
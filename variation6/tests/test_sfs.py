@@ -0,0 +1,108 @@
+import unittest
+
+import numpy as np
+import allel
+
+from test_utils import create_random_gts, create_random_gt_variations
+from variation6.stats.sfs import (calc_sfs, calc_joint_sfs,
+                                  calc_projection_probs, fold_sfs)
+
+
+def _create_gts():
+    return create_random_gts((60, 10, 2), alt_freq=0.3, seed=3)
+
+
+def _create_variations(gts, in_memory):
+    return create_random_gt_variations(gts, in_memory, chunks=(13, 4, 2),
+                                       pop_limits=[4])
+
+
+def _fold_joint_sfs_by_site(gts):
+    # every site is placed in the folded spectrum by hand
+    derived1 = np.sum(gts[:, :4] == 1, axis=(1, 2))
+    derived2 = np.sum(gts[:, 4:] == 1, axis=(1, 2))
+    sfs = np.zeros((9, 13))
+    for num_derived1, num_derived2 in zip(derived1, derived2):
+        if num_derived1 + num_derived2 < 10:
+            sfs[num_derived1, num_derived2] += 1
+        elif num_derived1 + num_derived2 > 10:
+            sfs[8 - num_derived1, 12 - num_derived2] += 1
+        else:
+            sfs[num_derived1, num_derived2] += 0.5
+            sfs[8 - num_derived1, 12 - num_derived2] += 0.5
+    return sfs
+
+
+class SfsTest(unittest.TestCase):
+
+    def test_sfs(self):
+        gts = _create_gts()
+        allele_counts = allel.GenotypeArray(gts).count_alleles(max_allele=1)
+        pop_allele_counts = allel.GenotypeArray(gts[:, :4]).count_alleles(max_allele=1)
+        for in_memory in (True, False):
+            variations, pops = _create_variations(gts, in_memory)
+            sfs = calc_sfs(variations, max_alleles=2)
+            self.assertTrue(np.array_equal(sfs,
+                                           allel.sfs(allele_counts[:, 1], n=20)))
+            sfs = calc_sfs(variations, max_alleles=2, folded=True)
+            self.assertTrue(np.array_equal(sfs, allel.sfs_folded(allele_counts,
+                                                                 n=20)))
+            sfs = calc_sfs(variations, max_alleles=2, population=pops[0])
+            self.assertTrue(np.array_equal(sfs, allel.sfs(pop_allele_counts[:, 1],
+                                                          n=8)))
+
+    def test_joint_sfs(self):
+        gts = _create_gts()
+        allele_counts1 = allel.GenotypeArray(gts[:, :4]).count_alleles(max_allele=1)
+        allele_counts2 = allel.GenotypeArray(gts[:, 4:]).count_alleles(max_allele=1)
+        for in_memory in (True, False):
+            variations, pops = _create_variations(gts, in_memory)
+            sfs = calc_joint_sfs(variations, max_alleles=2, populations=pops)
+            expected = allel.joint_sfs(allele_counts1[:, 1], allele_counts2[:, 1],
+                                       n1=8, n2=12)
+            self.assertTrue(np.array_equal(sfs, expected))
+
+            sfs = calc_joint_sfs(variations, max_alleles=2, populations=pops,
+                                 folded=True)
+            self.assertTrue(np.array_equal(sfs, _fold_joint_sfs_by_site(gts)))
+            self.assertEqual(np.sum(sfs), gts.shape[0])
+
+    def test_projection(self):
+        probs = calc_projection_probs([4, 4, 1], [2, 4, 1], projection=2)
+        self.assertTrue(np.allclose(probs, [[1 / 6, 4 / 6, 1 / 6],
+                                            [0, 0, 1],
+                                            [0, 0, 0]]))
+
+        gts = _create_gts()
+        gts[:10, :3] = -1
+        variations, pops = _create_variations(gts, in_memory=False)
+        sfs = calc_sfs(variations, max_alleles=2, projection=10)
+        self.assertEqual(sfs.shape, (11,))
+        self.assertAlmostEqual(np.sum(sfs), 60)
+        # without projection the sites with missing genotypes are not used
+        sfs = calc_sfs(variations, max_alleles=2)
+        self.assertAlmostEqual(np.sum(sfs), 50)
+
+        sfs = calc_joint_sfs(variations, max_alleles=2, populations=pops,
+                             projections=(2, 6))
+        self.assertEqual(sfs.shape, (3, 7))
+        self.assertAlmostEqual(np.sum(sfs), 60)
+
+        with self.assertRaises(ValueError):
+            calc_sfs(variations, max_alleles=2, projection=30)
+
+    def test_fold(self):
+        self.assertTrue(np.array_equal(fold_sfs(np.array([1, 2, 3, 4, 5])),
+                                       [6, 6, 3]))
+        self.assertTrue(np.array_equal(fold_sfs(np.array([1, 2, 3, 4])),
+                                       [5, 5]))
+
+        sfs = np.arange(9).reshape((3, 3))
+        expected = [[8, 8, 4],
+                    [8, 4, 0],
+                    [4, 0, 0]]
+        self.assertTrue(np.array_equal(fold_sfs(sfs), expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
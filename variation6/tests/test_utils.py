@@ -4,17 +4,74 @@ import os
 
 sys.path.insert(0, os.path.abspath('../..'))
 
+import numpy as np
+import dask.array as da
+
 from variation6.in_out.zarr import load_zarr
 from variation6.tests import TEST_DATA_DIR
 from variation6.filters import remove_low_call_rate_vars
-from variation6 import FLT_VARS, DEFAULT_VARIATION_NUM_IN_CHUNK
+from variation6.compute import compute
+from variation6.variations import Variations
+from variation6 import (FLT_VARS, DEFAULT_VARIATION_NUM_IN_CHUNK, GT_FIELD,
+                        CHROM_FIELD, POS_FIELD)
 
 
-def create_dask_variations(num_vars_per_chunk=DEFAULT_VARIATION_NUM_IN_CHUNK):
+def create_dask_variations(num_vars_per_chunk=DEFAULT_VARIATION_NUM_IN_CHUNK,
+                           num_samples_per_chunk=None):
     return load_zarr(TEST_DATA_DIR / 'test.zarr',
-                     num_vars_per_chunk=num_vars_per_chunk)
+                     num_vars_per_chunk=num_vars_per_chunk,
+                     num_samples_per_chunk=num_samples_per_chunk)
+
+
+def create_test_variations(in_memory,
+                           num_vars_per_chunk=DEFAULT_VARIATION_NUM_IN_CHUNK,
+                           num_samples_per_chunk=None):
+    '''It loads the test zarr variations, computed into memory if
+       in_memory'''
+    variations = create_dask_variations(num_vars_per_chunk=num_vars_per_chunk,
+                                        num_samples_per_chunk=num_samples_per_chunk)
+    if in_memory:
+        variations = compute({'vars': variations},
+                             store_variation_to_memory=True)['vars']
+    return variations
 
 
 def create_non_materialized_snp_filtered_variations():
     variations = create_dask_variations()
     return remove_low_call_rate_vars(variations, min_call_rate=0)[FLT_VARS]
+
+
+def create_variations(arrays, samples, in_memory, chunks=None):
+    '''It creates variations with the given numpy arrays, as dask arrays
+       with the given chunks if they are not in memory. The chunks of every
+       array are the first items of chunks, one per dimension, or the ones
+       of its field if chunks is a dict.'''
+    variations = Variations(samples=samples if in_memory else da.array(samples))
+    for field, array in arrays.items():
+        if not in_memory:
+            array_chunks = chunks[field] if isinstance(chunks, dict) else chunks
+            if isinstance(array_chunks, tuple):
+                array_chunks = array_chunks[:array.ndim]
+            array = da.from_array(array, chunks=array_chunks)
+        variations[field] = array
+    return variations
+
+
+def create_random_gts(shape, alt_freq, missing_rate=0, seed=0):
+    rng = np.random.default_rng(seed)
+    gts = (rng.random(shape) < alt_freq).astype(np.int8)
+    if missing_rate:
+        gts[rng.random(shape[:2]) < missing_rate] = -1
+    return gts
+
+
+def create_random_gt_variations(gts, in_memory, chunks, pop_limits,
+                                pos_step=1):
+    '''It creates variations with the given genotypes in one chromosome and
+       the populations, the samples split at pop_limits'''
+    samples = np.array([str(idx) for idx in range(gts.shape[1])])
+    arrays = {GT_FIELD: gts,
+              CHROM_FIELD: np.array(['chr1'] * gts.shape[0]),
+              POS_FIELD: np.arange(gts.shape[0]) * pos_step + 1}
+    variations = create_variations(arrays, samples, in_memory, chunks=chunks)
+    return variations, np.split(samples, pop_limits)
@@ -1,9 +1,12 @@
 import test_config
 import unittest
+import warnings
 import numpy as np
+import dask.array as da
 
-from variation6.variations import Variations
-from variation6 import GT_FIELD, CHROM_FIELD, NotMaterializedError
+from variation6.variations import Variations, VariationsView
+from variation6 import (GT_FIELD, CHROM_FIELD, QUAL_FIELD,
+                        NotMaterializedError)
 from variation6.tests import TEST_DATA_DIR
 from variation6.in_out.zarr import load_zarr
 from variation6.filters import remove_low_call_rate_vars, FLT_VARS
@@ -74,6 +77,97 @@ class VariationsTest(unittest.TestCase):
         chunks = list(variations.iterate_chunks())
         self.assertEqual(len(chunks), 7)
 
+    def test_chunk_views(self):
+        variations = load_zarr((TEST_DATA_DIR / 'test.zarr'))
+        variations[GT_FIELD] = variations[GT_FIELD].rechunk(((2, 4, 1), 3, 2))
+        gts = variations[GT_FIELD].compute()
+
+        view = variations.get_vars(slice(2, 6))
+        self.assertIsInstance(view, VariationsView)
+        self.assertIs(view.samples, variations.samples)
+        self.assertIs(view.metadata, variations.metadata)
+        self.assertEqual(view.num_variations, 4)
+        self.assertTrue(np.all(view[GT_FIELD].compute() == gts[2:6]))
+        self.assertNotIsInstance(variations.get_vars(slice(0, 6, 2)),
+                                 VariationsView)
+
+        # the chunks follow the blocks and no rechunking is done
+        chunks = list(variations.iterate_chunks())
+        self.assertEqual([chunk.num_variations for chunk in chunks],
+                         [2, 4, 1])
+        self.assertEqual(chunks[1][GT_FIELD].numblocks, (1, 1, 1))
+        self.assertTrue(np.all(chunks[1][GT_FIELD].compute() == gts[2:6]))
+
+        # in memory the default chunk size is used
+        variations = Variations(samples=np.array(['1', '2']))
+        variations[GT_FIELD] = np.zeros((5, 2, 2))
+        chunks = list(variations.iterate_chunks())
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(chunks[0].num_variations, 5)
+
+    def test_iterate_computed_chunks(self):
+        variations = load_zarr((TEST_DATA_DIR / 'test.zarr'),
+                               num_vars_per_chunk=2)
+        gts = variations[GT_FIELD].compute()
+        for kwargs in ({}, {'prefetch': 0, 'workers': 1},
+                       {'prefetch': 3, 'max_memory': 1}):
+            chunks = list(variations.iterate_computed_chunks(**kwargs))
+            self.assertEqual(len(chunks), 4)
+            self.assertIsInstance(chunks[0][GT_FIELD], np.ndarray)
+            self.assertTrue(np.all(np.concatenate([chunk[GT_FIELD]
+                                                   for chunk in chunks]) == gts))
+
+        # a stopped iteration does not wait for the chunks not used
+        chunks = variations.iterate_computed_chunks(prefetch=2)
+        self.assertTrue(np.all(next(chunks)[GT_FIELD] == gts[:2]))
+        chunks.close()
+
+        # the in memory chunks are yielded as they are
+        variations = Variations(samples=np.array(['1', '2']))
+        variations[GT_FIELD] = np.zeros((5, 2, 2))
+        chunks = list(variations.iterate_computed_chunks(chunk_size=2))
+        self.assertEqual([chunk.num_variations for chunk in chunks], [2, 2, 1])
+
+    def test_iterate_computed_chunks_silencing_warnings(self):
+        variations = Variations(samples=da.from_array(np.array(['1', '2'])))
+        variations[GT_FIELD] = da.zeros((6, 2, 2), chunks=(2, 2, 2))
+        # 0 / 0 emits a RuntimeWarning when it is computed
+        variations[QUAL_FIELD] = da.zeros(6, chunks=2) / da.zeros(6, chunks=2)
+        filters = list(warnings.filters)
+        for silence in (True, False):
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                chunks = variations.iterate_computed_chunks(silence_runtime_warnings=silence)
+                self.assertEqual(len(list(chunks)), 3)
+            runtime_warnings = [warning for warning in caught
+                                if issubclass(warning.category, RuntimeWarning)]
+            self.assertEqual(bool(runtime_warnings), not silence)
+        self.assertEqual(warnings.filters, filters)
+
+    def test_iterate_tiles(self):
+        variations = load_zarr((TEST_DATA_DIR / 'test.zarr'),
+                               num_vars_per_chunk=4, num_samples_per_chunk=2)
+        self.assertEqual(variations[GT_FIELD].chunks[:2], ((4, 3), (2, 1)))
+        self.assertEqual(variations[CHROM_FIELD].chunks, ((4, 3),))
+        gts = variations[GT_FIELD].compute()
+
+        tiles = list(variations.iterate_chunks(sample_chunk_size=2))
+        self.assertEqual(len(tiles), 4)
+        self.assertEqual(tiles[1][GT_FIELD].shape, (4, 1, 2))
+        self.assertEqual(tiles[1][CHROM_FIELD].shape, (4,))
+        self.assertTrue(np.all(tiles[1].samples.compute() == ['upv196']))
+        self.assertTrue(np.all(tiles[2][GT_FIELD].compute() == gts[4:, :2]))
+
+        # unknown shape arrays are tiled following their chunks
+        variations = remove_low_call_rate_vars(variations,
+                                               min_call_rate=0)[FLT_VARS]
+        tiles = list(variations.iterate_chunks(sample_chunk_size=2))
+        self.assertEqual(len(tiles), 4)
+        self.assertTrue(np.all(tiles[3][GT_FIELD].compute() == gts[4:, 2:]))
+        chunks = list(variations.iterate_chunks())
+        self.assertEqual(len(chunks), 2)
+        self.assertTrue(np.all(chunks[1][GT_FIELD].compute() == gts[4:]))
+
     def test_unavailable_shape(self):
         variations = Variations()
         variations.samples = ['1', '2', '3']
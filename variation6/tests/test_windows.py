@@ -0,0 +1,162 @@
+import unittest
+
+import numpy as np
+import dask.array as da
+
+from test_utils import (create_variations, create_random_gts,
+                        create_random_gt_variations)
+from variation6 import GT_FIELD, CHROM_FIELD, POS_FIELD
+from variation6.compute import compute
+from variation6.stats.windows import (calc_window_sums,
+                                      calc_diversities_by_window,
+                                      WINDOW_CHROM, WINDOW_START, WINDOW_END,
+                                      WINDOW_NUM_VARIATIONS, WINDOW_SUMS,
+                                      WINDOW_NUM_VALUES, WINDOW_PI,
+                                      WINDOW_OBS_HET,
+                                      WINDOW_NUM_POLYMORPHIC_VARS,
+                                      calc_neutrality_stats_by_window,
+                                      WINDOW_THETA_W, WINDOW_TAJIMA_D,
+                                      WINDOW_NUM_SEGREGATING_SITES)
+
+CHROMS = np.array(['chr1'] * 7 + ['chr2'] * 4)
+POSS = np.array([1, 5, 9, 12, 13, 25, 41, 2, 3, 30, 31])
+STATS = np.array([1, 2, np.nan, 4, 5, 6, 7, 8, np.nan, 10, 11])
+
+
+def _create_variations(in_memory, chunk_size=3):
+    gts = np.zeros((CHROMS.size, 2, 2), dtype=np.int8)
+    gts[::2, 0, 1] = 1
+    arrays = {CHROM_FIELD: CHROMS, POS_FIELD: POSS, GT_FIELD: gts}
+    variations = create_variations(arrays, np.array(['a', 'b']), in_memory,
+                                   chunks=chunk_size)
+    stats = STATS if in_memory else da.from_array(STATS, chunks=chunk_size)
+    return variations, stats
+
+
+class WindowSumsTest(unittest.TestCase):
+
+    def _check_bp_windows(self, in_memory):
+        variations, stats = _create_variations(in_memory)
+        table = calc_window_sums(variations, [stats], window_size=10, step=5)
+        table = compute({'table': table})['table']
+
+        self.assertEqual(list(table[WINDOW_CHROM]), ['chr1'] * 8 + ['chr2'] * 6)
+        self.assertEqual(list(table[WINDOW_START]),
+                         list(range(0, 40, 5)) + list(range(0, 30, 5)))
+        self.assertTrue(np.all(table[WINDOW_END] - table[WINDOW_START] == 10))
+        for idx in range(table[WINDOW_CHROM].size):
+            in_window = ((CHROMS == table[WINDOW_CHROM][idx]) &
+                         (table[WINDOW_START][idx] <= POSS) &
+                         (POSS < table[WINDOW_END][idx]))
+            self.assertEqual(table[WINDOW_NUM_VARIATIONS][idx],
+                             np.sum(in_window))
+            self.assertEqual(table[WINDOW_SUMS][idx, 0],
+                             np.nansum(STATS[in_window]))
+            self.assertEqual(table[WINDOW_NUM_VALUES][idx, 0],
+                             np.sum(~np.isnan(STATS[in_window])))
+
+    def test_bp_windows(self):
+        for in_memory in (True, False):
+            with self.subTest(in_memory=in_memory):
+                self._check_bp_windows(in_memory)
+
+    def _check_snp_windows(self, in_memory, chunk_size=3):
+        variations, stats = _create_variations(in_memory, chunk_size)
+        table = calc_window_sums(variations, [stats], window_size=4, step=2,
+                                 by_snps=True)
+        table = compute({'table': table})['table']
+
+        self.assertEqual(list(table[WINDOW_CHROM]), ['chr1'] * 3 + ['chr2'])
+        self.assertEqual(list(table[WINDOW_START]), [1, 9, 13, 2])
+        self.assertEqual(list(table[WINDOW_END]), [13, 26, 42, 32])
+        self.assertEqual(list(table[WINDOW_NUM_VARIATIONS]), [4, 4, 3, 4])
+        self.assertEqual(list(table[WINDOW_SUMS][:, 0]), [7, 15, 18, 29])
+        self.assertEqual(list(table[WINDOW_NUM_VALUES][:, 0]), [3, 3, 3, 3])
+
+    def test_snp_windows(self):
+        for in_memory, chunk_size in ((True, 3), (False, 3), (False, 1)):
+            with self.subTest(in_memory=in_memory, chunk_size=chunk_size):
+                self._check_snp_windows(in_memory, chunk_size)
+
+    def test_wrong_step(self):
+        variations, stats = _create_variations(in_memory=True)
+        with self.assertRaises(ValueError):
+            calc_window_sums(variations, [stats], window_size=10, step=3)
+
+
+class WindowDiversitiesTest(unittest.TestCase):
+
+    def test_diversities_by_window(self):
+        variations, _ = _create_variations(in_memory=False)
+        table = calc_diversities_by_window(variations, max_alleles=2,
+                                           window_size=20,
+                                           min_num_genotypes=0,
+                                           min_call_dp_for_het_call=None)
+        table = compute({'table': table},
+                        silence_runtime_warnings=True)['table']
+        self.assertEqual(list(table[WINDOW_NUM_VARIATIONS]), [5, 1, 1, 2, 2])
+        self.assertEqual(list(table[WINDOW_NUM_POLYMORPHIC_VARS]),
+                         [3, 0, 1, 1, 1])
+        # het calls: one of the two samples in every other variation
+        self.assertTrue(np.allclose(table[WINDOW_OBS_HET],
+                                    [0.3, 0, 0.5, 0.25, 0.25]))
+        # unbiased exp het of a variation with allele freq 0.25 and 2 samples
+        exp_het = 4 / 3 * (1 - 0.25 ** 2 - 0.75 ** 2)
+        self.assertTrue(np.allclose(table[WINDOW_PI],
+                                    [3 * exp_het / 20, 0, exp_het / 20,
+                                     exp_het / 20,
+                                     exp_het / 20]))
+
+
+class NeutralityStatsTest(unittest.TestCase):
+
+    def _create_variations(self, in_memory):
+        gts = create_random_gts((40, 10, 2), alt_freq=0.2, seed=1)
+        gts[::7] = 0
+        variations, _ = create_random_gt_variations(gts, in_memory, chunks=7,
+                                                    pop_limits=[], pos_step=10)
+        return variations, gts
+
+    def _check_neutrality_stats(self, in_memory):
+        import allel
+        variations, gts = self._create_variations(in_memory)
+        table = calc_neutrality_stats_by_window(variations, max_alleles=2,
+                                                window_size=400)
+        table = compute({'table': table}, silence_runtime_warnings=True)['table']
+
+        allele_counts = allel.GenotypeArray(gts).count_alleles()
+        num_segregating_sites = np.sum(allele_counts.is_segregating())
+        a1 = np.sum(1 / np.arange(1, 20))
+        self.assertEqual(table[WINDOW_NUM_SEGREGATING_SITES][0],
+                         num_segregating_sites)
+        self.assertAlmostEqual(table[WINDOW_PI][0] * 400,
+                               np.sum(allel.mean_pairwise_difference(allele_counts)))
+        self.assertAlmostEqual(table[WINDOW_THETA_W][0] * 400,
+                               num_segregating_sites / a1)
+        self.assertAlmostEqual(table[WINDOW_TAJIMA_D][0],
+                               allel.tajima_d(allele_counts))
+
+    def test_neutrality_stats(self):
+        for in_memory in (True, False):
+            with self.subTest(in_memory=in_memory):
+                self._check_neutrality_stats(in_memory)
+
+    def test_neutrality_stats_with_missing_gts(self):
+        variations, gts = self._create_variations(in_memory=True)
+        gts[1, :5] = -1
+        variations[GT_FIELD] = gts
+        table = calc_neutrality_stats_by_window(variations, max_alleles=2,
+                                                window_size=20)
+
+        # the missing calls only reduce the number of alleles of the site
+        expected_pi = 0
+        for site_gts in gts[:2]:
+            allele_counts = np.array([np.sum(site_gts == 0),
+                                      np.sum(site_gts == 1)])
+            num_alleles = np.sum(allele_counts)
+            expected_pi += ((num_alleles ** 2 - np.sum(allele_counts ** 2)) /
+                            (num_alleles * (num_alleles - 1)))
+        self.assertAlmostEqual(table[WINDOW_PI][0] * 20, expected_pi)
+
+if __name__ == '__main__':
+    unittest.main()
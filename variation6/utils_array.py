@@ -1,7 +1,15 @@
 
 import math
 
-from variation6 import NotMaterializedError
+import numpy as np
+
+from variation6 import (NotMaterializedError, PUBLIC_CALL_GROUP,
+                        GT_PACKED_FIELD, DEFAULT_VARIATION_NUM_IN_CHUNK)
+
+# the memory that one chunk of all the arrays can take in a worker
+DEF_CHUNK_MEMORY_BUDGET = 256 * 1024 ** 2
+MIN_NUM_VARIATIONS_IN_CHUNK = 100
+DEF_OBJECT_ITEMSIZE = 32
 
 
 def get_shape_item(array, idx: int, check_materilized=True):
@@ -9,3 +17,82 @@ def get_shape_item(array, idx: int, check_materilized=True):
     if check_materilized and math.isnan(item):
         raise NotMaterializedError()
     return item
+
+
+def _get_itemsize(dtype):
+    dtype = np.dtype(dtype)
+    # the python objects, usually strings, are larger than their pointers
+    return DEF_OBJECT_ITEMSIZE if dtype == object else dtype.itemsize
+
+
+def is_sample_call_field(field):
+    '''It tells if the columns of the field are the samples, the packed
+       genotypes hold several samples in every column'''
+    return field.startswith(PUBLIC_CALL_GROUP) and field != GT_PACKED_FIELD
+
+
+def calc_bytes_per_variation(arrays, num_samples_per_chunk=None):
+    '''It calculates the bytes that a variation takes in the given arrays.
+
+       arrays is a list of (shape, dtype, is_call_data) tuples. If
+       num_samples_per_chunk is given, the call data chunks only hold those
+       samples.'''
+    num_bytes = 0
+    for shape, dtype, is_call_data in arrays:
+        shape = list(shape[1:])
+        if is_call_data and num_samples_per_chunk is not None and shape:
+            shape[0] = min(shape[0], num_samples_per_chunk)
+        num_bytes += int(np.prod(shape)) * _get_itemsize(dtype)
+    return num_bytes
+
+
+def plan_num_vars_per_chunk(arrays, memory_budget=DEF_CHUNK_MEMORY_BUDGET,
+                            storage_chunk_size=None,
+                            num_samples_per_chunk=None,
+                            min_num_vars=MIN_NUM_VARIATIONS_IN_CHUNK,
+                            expansion_factor=1):
+    '''It chooses the number of variations per chunk so that one chunk of
+       every array, as it is stored, takes at most memory_budget /
+       expansion_factor bytes.
+
+       The calculations create intermediate arrays several times larger
+       than the stored ones, like the genotype comparisons, so a chunk only
+       fits in the memory of a worker if expansion_factor accounts for them.
+
+       If the arrays are stored by chunks, the chunks are aligned with the
+       storage ones: they hold several storage chunks or an even split of
+       one.'''
+    bytes_per_var = calc_bytes_per_variation(arrays,
+                                             num_samples_per_chunk=num_samples_per_chunk)
+    num_vars = memory_budget // max(bytes_per_var * expansion_factor, 1)
+    num_vars = max(num_vars, min_num_vars)
+    if storage_chunk_size:
+        if num_vars >= storage_chunk_size:
+            num_vars = (num_vars // storage_chunk_size) * storage_chunk_size
+        else:
+            num_splits = math.ceil(storage_chunk_size / num_vars)
+            num_vars = math.ceil(storage_chunk_size / num_splits)
+    return int(num_vars)
+
+
+def plan_num_vars_per_chunk_for_fields(arrays,
+                                       memory_budget=DEF_CHUNK_MEMORY_BUDGET,
+                                       num_samples_per_chunk=None,
+                                       expansion_factor=1):
+    '''It plans the number of variations per chunk for a list of (field,
+       array) pairs.
+
+       The chunks are aligned with the storage chunks of the largest array,
+       if it has any.'''
+    arrays = list(arrays)
+    if not arrays:
+        return DEFAULT_VARIATION_NUM_IN_CHUNK
+    array_specs = [(array.shape, array.dtype, is_sample_call_field(field))
+                   for field, array in arrays]
+    _, largest_array = max(arrays, key=lambda item: item[1].nbytes)
+    storage_chunks = getattr(largest_array, 'chunks', None)
+    storage_chunk_size = storage_chunks[0] if storage_chunks else None
+    return plan_num_vars_per_chunk(array_specs, memory_budget=memory_budget,
+                                   storage_chunk_size=storage_chunk_size,
+                                   num_samples_per_chunk=num_samples_per_chunk,
+                                   expansion_factor=expansion_factor)
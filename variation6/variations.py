@@ -1,20 +1,88 @@
 import math
+import threading
 import warnings
-from collections import OrderedDict
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 import numpy as np
 import dask.array as da
 
-from variation6 import (PUBLIC_CALL_GROUP, GT_FIELD, EmptyVariationsError,
-                        DEF_CHUNK_SIZE, NotMaterializedError)
+from variation6 import (PUBLIC_CALL_GROUP, GT_FIELD, GT_PACKED_FIELD,
+                        PUBLIC_VARIANT_STATS_GROUP,
+                        EmptyVariationsError,
+                        NotMaterializedError,
+                        DEF_NUM_PREFETCHED_CHUNKS, DEF_NUM_PREFETCH_WORKERS)
+from variation6.array.genotype import unpack_gts, num_packed_bytes
+from variation6.utils_array import (plan_num_vars_per_chunk_for_fields,
+                                    DEF_CHUNK_MEMORY_BUDGET)
+
+
+def normalize_name(name):
+    '''It returns the sample or chromosome name as str, they can be stored
+       as bytes'''
+    if isinstance(name, bytes):
+        name = name.decode()
+    return name
+
+
+def _estimate_nbytes(variations):
+    # the arrays of unknown shape can not be accounted for
+    nbytes = 0
+    for _, array in variations.items():
+        if not math.isnan(array.nbytes):
+            nbytes += array.nbytes
+    return nbytes
+
+
+_SILENCED_WARNINGS_LOCK = threading.Lock()
+_SILENCED_WARNINGS_STATE = {'num_users': 0, 'catcher': None}
+
+
+@contextmanager
+def _silence_runtime_warnings_in_threads():
+    # the warning filters are global and catch_warnings is not thread safe,
+    # so the filter is set by the first thread that requires it and removed
+    # by the last one
+    state = _SILENCED_WARNINGS_STATE
+    with _SILENCED_WARNINGS_LOCK:
+        if not state['num_users']:
+            state['catcher'] = warnings.catch_warnings()
+            state['catcher'].__enter__()
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+        state['num_users'] += 1
+    try:
+        yield
+    finally:
+        with _SILENCED_WARNINGS_LOCK:
+            state['num_users'] -= 1
+            if not state['num_users']:
+                state['catcher'].__exit__(None, None, None)
+                state['catcher'] = None
+
+
+def _compute_chunk(chunk, silence_runtime_warnings=False):
+    # compute imports this module, so it can not be imported when this
+    # module is loaded
+    from variation6.compute import compute
+    if not silence_runtime_warnings:
+        return compute({'vars': chunk}, store_variation_to_memory=True)['vars']
+    with _silence_runtime_warnings_in_threads():
+        return compute({'vars': chunk}, store_variation_to_memory=True)['vars']
+
+
+def _is_contiguous_slice(index):
+    return isinstance(index, slice) and index.step in (None, 1)
 
 
 class Variations:
 
     def __init__(self, samples=None, metadata=None):
         self._samples = None
+        self._sample_index = None
         self.samples = samples
         self._arrays = {}
+        self._unpacked_gts = None, None
 
         self._metadata = {}
 
@@ -58,6 +126,20 @@ class Variations:
 
             self._samples = samples
 
+    @property
+    def sample_index(self):
+        '''It maps each sample name (as str) to its column in the call data.
+           It is built once, the samples can not be changed afterwards'''
+        if self._sample_index is None:
+            samples = self.samples
+            if samples is None:
+                return {}
+            if isinstance(samples, da.Array):
+                samples = samples.compute()
+            self._sample_index = {normalize_name(sample): idx
+                                  for idx, sample in enumerate(samples)}
+        return self._sample_index
+
     @property
     def num_samples(self):
         if self.samples is None:
@@ -111,21 +193,63 @@ class Variations:
             if self.num_samples == 0:
                 msg = "Can not set call data if samples are not defined"
                 raise ValueError(msg)
+            if key == GT_PACKED_FIELD:
+                expected_num_cols = num_packed_bytes(self.num_samples)
+            else:
+                expected_num_cols = self.num_samples
             if (not math.isnan(self.num_samples) and self.num_samples != 0
-                    and value.ndim > 1 and self.num_samples != value.shape[1]):
+                    and value.ndim > 1 and expected_num_cols != value.shape[1]):
                 msg = 'Shape of the array does not fit with num samples'
                 raise ValueError(msg)
 
+        # the stats calculated from the previous genotypes are no longer
+        # valid
+        if key in (GT_FIELD, GT_PACKED_FIELD) and GT_FIELD in self:
+            self.remove_variant_stats()
+
+        # the new genotypes replace the packed ones
+        if key == GT_FIELD:
+            self._arrays.pop(GT_PACKED_FIELD, None)
+
         self._arrays[key] = value
 
+    def remove_variant_stats(self):
+        for key in list(self._arrays):
+            if key.startswith(PUBLIC_VARIANT_STATS_GROUP):
+                del self._arrays[key]
+
+    @property
+    def has_packed_gts(self):
+        return GT_PACKED_FIELD in self._arrays and GT_FIELD not in self._arrays
+
     def __getitem__(self, key):
+        if key == GT_FIELD and self.has_packed_gts:
+            # the packed genotypes are unpacked for the code that requires
+            # the full genotypes
+            return self._get_unpacked_gts()
         return self._arrays.get(key)
 
+    def _get_unpacked_gts(self):
+        packed = self._arrays[GT_PACKED_FIELD]
+        if not isinstance(packed, da.Array):
+            return unpack_gts(packed, self.num_samples)
+        # the lazy unpacked array is reused while the packed one is the same
+        cached_packed, unpacked = self._unpacked_gts
+        if cached_packed is not packed:
+            unpacked = unpack_gts(packed, self.num_samples)
+            self._unpacked_gts = packed, unpacked
+        return unpacked
+
     def __contains__(self, lookup):
+        if lookup == GT_FIELD and self.has_packed_gts:
+            return True
         return lookup in self._arrays
 
     def get_vars(self, index):
+        if _is_contiguous_slice(index):
+            return VariationsView(self, index)
         variations = Variations(samples=self.samples, metadata=self.metadata)
+        variations._sample_index = self._sample_index
         for key, array in self._arrays.items():
             variations[key] = array[index, ...]
         return variations
@@ -136,35 +260,169 @@ class Variations:
     def items(self):
         return self._arrays.items()
 
-    def iterate_chunks(self, chunk_size=None):
-        gts = self._arrays[GT_FIELD]
+    def _items_for_tiles(self):
+        for key, array in self._arrays.items():
+            if key.startswith(PUBLIC_VARIANT_STATS_GROUP):
+                # the stats of all samples do not apply to a tile
+                continue
+            if key == GT_PACKED_FIELD:
+                # packed bytes can not be split by sample
+                key, array = GT_FIELD, self[GT_FIELD]
+            yield key, array
+
+    def _get_tile(self, var_index, sample_index):
+        variations = Variations(samples=self.samples[sample_index],
+                                metadata=self.metadata)
+        for key, array in self._items_for_tiles():
+            if PUBLIC_CALL_GROUP in key:
+                variations[key] = array[var_index, sample_index, ...]
+            else:
+                variations[key] = array[var_index, ...]
+        return variations
+
+    def iterate_chunks(self, chunk_size=None, sample_chunk_size=None,
+                       memory_budget=DEF_CHUNK_MEMORY_BUDGET,
+                       expansion_factor=1):
+        '''It yields the variations by chunks of variations.
+
+           If sample_chunk_size is given, every chunk of variations is also
+           split in tiles of samples. For dask arrays of unknown shape the
+           chunks and tiles are those of the arrays. If chunk_size is not
+           given, the dask chunks follow the blocks and the in memory ones
+           are sized with the memory budget and the expansion factor, see
+           plan_num_vars_per_chunk.'''
+        gts = self[GT_FIELD]
         if isinstance(gts, da.Array) and np.any(np.isnan(gts.shape)):
-            if chunk_size:
+            if chunk_size or sample_chunk_size:
                 msg = 'If variations is full of dask arrays with unknown '
                 msg += 'shape, can not define chunk size. This is defined by '
                 msg += 'chunks of each array'
                 warnings.warn(msg, RuntimeWarning)
-            return self._iterate_chunks_of_unknown_shape_arrays()
+            return self._iterate_chunks_of_unknown_shape_arrays(by_tiles=bool(sample_chunk_size))
+        else:
+            return self._iterate_chunks_of_known_shape_arrays(chunk_size,
+                                                              sample_chunk_size,
+                                                              memory_budget,
+                                                              expansion_factor)
+
+    def iterate_computed_chunks(self, chunk_size=None,
+                                prefetch=DEF_NUM_PREFETCHED_CHUNKS,
+                                workers=DEF_NUM_PREFETCH_WORKERS,
+                                max_memory=None,
+                                silence_runtime_warnings=False):
+        '''It yields the chunks of variations computed in memory.
+
+           While a chunk is being used the next prefetch chunks are computed
+           by a pool of worker threads, so reading and decompressing the
+           data overlaps with the work done with the chunks. If max_memory
+           is given, no more chunks are prefetched once the estimated size
+           in bytes of the prefetched chunks and the chunk being used
+           reaches it. The chunks kept by the caller after asking for the
+           next one are not accounted for.'''
+        chunks = self.iterate_chunks(chunk_size=chunk_size)
+        if not any(isinstance(array, da.Array) for _, array in self.items()):
+            yield from chunks
+            return
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            pending_nbytes = 0
+            used_nbytes = 0
+            next_chunk = next(chunks, None)
+            try:
+                while next_chunk is not None or pending:
+                    while next_chunk is not None and len(pending) <= prefetch:
+                        nbytes = _estimate_nbytes(next_chunk)
+                        if (pending and max_memory is not None and
+                                used_nbytes + pending_nbytes + nbytes > max_memory):
+                            break
+                        pending.append((executor.submit(_compute_chunk,
+                                                        next_chunk,
+                                                        silence_runtime_warnings),
+                                        nbytes))
+                        pending_nbytes += nbytes
+                        next_chunk = next(chunks, None)
+                    future, used_nbytes = pending.popleft()
+                    pending_nbytes -= used_nbytes
+                    yield future.result()
+            finally:
+                # the chunks not used are not computed
+                for future, _ in pending:
+                    future.cancel()
+
+    def _get_chunk_slices(self, chunk_size, memory_budget, expansion_factor):
+        gts = self[GT_FIELD]
+        if chunk_size is None and isinstance(gts, da.Array):
+            # the chunks are aligned with the blocks, so slicing them does
+            # not require any rechunking
+            limits = np.cumsum((0,) + gts.chunks[0])
         else:
             if chunk_size is None:
-                chunk_size = DEF_CHUNK_SIZE
-                chunk_size = gts.chunks[0][0]
-            return self._iterate_chunks_of_known_shape_arrays(chunk_size)
-
-    def _iterate_chunks_of_known_shape_arrays(self, chunk_size):
-            chunk_indices = list(range(0, self.num_variations, chunk_size))
-            for chunk_start in chunk_indices:
-                index = slice(chunk_start, chunk_start + chunk_size)
-                yield self.get_vars(index)
-
-    def _iterate_chunks_of_unknown_shape_arrays(self):
-        named_blocks = OrderedDict({key: array.blocks for key, array in self._arrays.items()})
-        fields = named_blocks.keys()
-        array_blocks = zip(*named_blocks.values())
-        for array_block in array_blocks:
-            variations = Variations(samples=self.samples, metadata=self.metadata)
-            for field, block in zip(fields, array_block):
-                variations[field] = block
-            yield variations
-
+                chunk_size = plan_num_vars_per_chunk_for_fields(self.items(),
+                                                                memory_budget=memory_budget,
+                                                                expansion_factor=expansion_factor)
+            limits = list(range(0, self.num_variations, chunk_size))
+            limits.append(self.num_variations)
+        return [slice(int(start), int(end))
+                for start, end in zip(limits[:-1], limits[1:])]
+
+    def _iterate_chunks_of_known_shape_arrays(self, chunk_size,
+                                              sample_chunk_size=None,
+                                              memory_budget=DEF_CHUNK_MEMORY_BUDGET,
+                                              expansion_factor=1):
+            for index in self._get_chunk_slices(chunk_size, memory_budget,
+                                                expansion_factor):
+                if sample_chunk_size is None:
+                    yield self.get_vars(index)
+                    continue
+                for sample_start in range(0, self.num_samples,
+                                          sample_chunk_size):
+                    sample_index = slice(sample_start,
+                                         sample_start + sample_chunk_size)
+                    yield self._get_tile(index, sample_index)
+
+    def _iterate_chunks_of_unknown_shape_arrays(self, by_tiles=False):
+        gts = self[GT_FIELD]
+        num_sample_chunks = gts.numblocks[1] if by_tiles else 1
+        sample_chunk_limits = np.cumsum((0,) + gts.chunks[1])
+
+        for chunk_idx in range(gts.numblocks[0]):
+            for sample_chunk_idx in range(num_sample_chunks):
+                if by_tiles:
+                    start = sample_chunk_limits[sample_chunk_idx]
+                    end = sample_chunk_limits[sample_chunk_idx + 1]
+                    samples = self.samples[start:end]
+                else:
+                    samples = self.samples
+                variations = Variations(samples=samples, metadata=self.metadata)
+                if not by_tiles:
+                    variations._sample_index = self._sample_index
+                items = self._items_for_tiles() if by_tiles else self.items()
+                for field, array in items:
+                    if by_tiles and PUBLIC_CALL_GROUP in field:
+                        block = array.blocks[chunk_idx, sample_chunk_idx]
+                    else:
+                        block = array.blocks[chunk_idx]
+                    variations[field] = block
+                yield variations
+
+
+class VariationsView(Variations):
+    '''A contiguous slice of the variations of a parent Variations.
+
+       It shares the samples, sample index and metadata of the parent, and
+       its arrays are slices of the parent arrays, that are already known to
+       fit, so no validation is done.'''
+
+    def __init__(self, parent, index):
+        self._parent = parent
+        self._samples = parent.samples
+        self._sample_index = None
+        self._metadata = parent.metadata
+        self._arrays = {key: array[index, ...]
+                        for key, array in parent.items()}
+        self._unpacked_gts = None, None
 
+    @property
+    def sample_index(self):
+        return self._parent.sample_index